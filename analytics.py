@@ -0,0 +1,444 @@
+"""资源利用率统计
+
+按时间桶（hour/day/week）统计每台服务器各项资源的使用量、利用率和峰值，以及按姓名、任务类型分组的使用量，用于容量规划。
+
+每条记录的使用时间段见 usage_interval：已完成的记录从预约开始起按实际使用时间（没有时按预计使用时间）计，
+未完成的记录到预约结束为止（包括以后的预约），没有预计结束时间的视为一直使用到现在。
+记录按行号存放在 NumPy 数组中（UsageTable），登记和修改时只更新一行；统计时对使用时间段做事件扫描：
+开始/结束时间连同桶边界一起排序，累加占用量的增减（cumsum）得到每一小段时间的占用水平，再按桶求积分和峰值。
+
+已结束的时间桶的结果按 (桶大小, 桶开始时间) 缓存，再次查询时只计算未缓存的桶（通常只有当前和以后的桶）；
+记录修改时只作废与其新旧使用时间段的差异部分重叠的缓存桶，重新加载时全部作废。
+已归档的记录（见 archive.py）不再修改，由 archive_table 单独建表，归档变化时才重建，重新加载时复制到数组开头。
+缓存条目存放在 ServerManager 共用的有界 LRU（cache.LRUCache）中，超过容量时最久未查询的桶被淘汰，之后按需重新计算。
+"""
+import bisect
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+from metrics import CACHE_REQUESTS
+from schedule import from_seconds, to_seconds
+from storage import to_text
+
+HOUR = 3600
+BUCKETS = {'hour': HOUR, 'day': 24 * HOUR, 'week': 7 * 24 * HOUR}
+# 周桶从周一零点开始（1970-01-01 是周四）
+_BUCKET_OFFSETS = {'week': 4 * 24 * HOUR}
+# 未指定起始时间时统计的桶数
+DEFAULT_BUCKETS = {'hour': 48, 'day': 30, 'week': 26}
+MAX_BUCKETS = 5000
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def floor_bucket(seconds, bucket):
+    """秒数向下对齐到桶的开始"""
+    size = BUCKETS[bucket]
+    offset = _BUCKET_OFFSETS.get(bucket, 0)
+    return math.floor((seconds - offset) / size) * size + offset
+
+
+def usage_interval(record):
+    """记录的使用时间段 (开始, 结束) 秒数，结束为 inf 表示仍在使用；无法确定开始时间时返回 None"""
+    if record.booking_start is None:
+        return None
+    begin = to_seconds(record.booking_start, 0)
+    if record.completed:
+        hours = record.actual_hours if record.actual_hours > 0 else record.duration_hours
+        return begin, begin + hours * HOUR
+    return begin, to_seconds(record.booking_end, math.inf)
+
+
+class DiscreteColumns:
+    """编号资源：每个编号一列（占用为1），不指定编号的 "Yes" 一列；同一时刻占用的编号数不超过总数"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.total = len(resource.ids)
+        self.width = self.total + 1
+        self._positions = {i: pos for pos, i in enumerate(resource.ids)}
+
+    def values(self, demand):
+        ids, unnamed = demand
+        row = [0] * self.width
+        for i in ids:
+            if i in self._positions:
+                row[self._positions[i]] = 1
+        row[-1] = 1 if unnamed else 0
+        return row
+
+    def amount(self, row):
+        return sum(row)
+
+    def used(self, levels):
+        """返回 (占用量, 每个编号是否占用)，levels 为各段时间上本资源各列的累计值"""
+        busy = levels[:, :-1] > 0
+        return np.minimum(busy.sum(axis=1) + levels[:, -1], self.total), busy
+
+
+class PoolColumns:
+    """数量资源：占用量一列、申请 "all" 的任务数一列"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.total = resource.total
+        self.width = 2
+
+    def values(self, demand):
+        if demand == 'all':
+            return [0, 1]
+        if isinstance(demand, int) and demand > 0:
+            return [demand, 0]
+        return [0, 0]
+
+    def amount(self, row):
+        return self.total if row[1] else row[0]
+
+    def used(self, levels):
+        return np.where(levels[:, 1] > 0, self.total, np.minimum(levels[:, 0], self.total)), None
+
+
+class SeatColumns:
+    """名额资源：占用名额的任务数一列"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.total = resource.total
+        self.width = 1
+
+    def values(self, demand):
+        return [1 if demand is True else 0]
+
+    def amount(self, row):
+        return row[0]
+
+    def used(self, levels):
+        return np.minimum(levels[:, 0], self.total), None
+
+
+ANALYTICS_KINDS = {'discrete': DiscreteColumns, 'pool': PoolColumns, 'seat': SeatColumns}
+
+
+class UsageTable:
+    """一台服务器全部记录的使用时间段、各列占用量、姓名和任务类型，按行号存放在数组中"""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.width = sum(column.width for column in columns)
+        self.size = 0
+        self._allocate(64)
+
+    def _allocate(self, capacity):
+        self.begin = np.full(capacity, np.nan)
+        self.end = np.full(capacity, np.nan)
+        self.values = np.zeros((capacity, self.width), dtype=np.int64)
+        self.amounts = np.zeros((capacity, len(self.columns)), dtype=np.int64)
+        self.names = np.empty(capacity, dtype=object)
+        self.tasks = np.empty(capacity, dtype=object)
+
+    def _arrays(self):
+        return (self.begin, self.end, self.values, self.amounts, self.names, self.tasks)
+
+    def _grow(self, capacity):
+        old = self._arrays()
+        self._allocate(capacity)
+        for new, data in zip(self._arrays(), old):
+            new[:self.size] = data[:self.size]
+
+    def load(self, records, base=None):
+        """按全部记录重建；base 为另一张表（已归档的记录），其各行复制到最前面"""
+        offset = base.size if base is not None else 0
+        self._allocate(max(64, offset + len(records)))
+        if offset:
+            for new, data in zip(self._arrays(), base._arrays()):
+                new[:offset] = data[:offset]
+        self.size = offset
+        for row_index, record in enumerate(records, offset):
+            self.set(row_index, record)
+
+    def set(self, row_index, record):
+        """写入一行，row_index 等于当前行数时追加"""
+        if row_index >= len(self.begin):
+            self._grow(len(self.begin) * 2)
+        self.size = max(self.size, row_index + 1)
+        interval = usage_interval(record)
+        self.begin[row_index], self.end[row_index] = interval if interval else (np.nan, np.nan)
+        offset = 0
+        for position, (column, demand) in enumerate(zip(self.columns, record.demand)):
+            row = column.values(demand)
+            self.values[row_index, offset:offset + column.width] = row
+            self.amounts[row_index, position] = column.amount(row)
+            offset += column.width
+        self.names[row_index] = record.name
+        self.tasks[row_index] = to_text(record.get('任务类型', '')).strip()
+
+    def row_key(self, row_index):
+        """一行的 (开始, 结束, 其余内容)，用于判断修改影响的时间范围"""
+        rest = (tuple(self.values[row_index]), self.names[row_index], self.tasks[row_index])
+        return float(self.begin[row_index]), float(self.end[row_index]), rest
+
+    def sweep(self, edges, now):
+        """统计由边界 edges（k+1 个秒数）划分的 k 个桶，返回每个桶的结果字典"""
+        k = len(edges) - 1
+        lo, hi = edges[0], edges[-1]
+        begin = self.begin[:self.size]
+        # 没有预计结束时间的未完成记录使用到现在
+        end = self.end[:self.size]
+        end = np.where(np.isinf(end), np.maximum(begin, now), end)
+        with np.errstate(invalid='ignore'):
+            mask = (begin < hi) & (end > lo) & (end > begin)
+        start = np.clip(begin[mask], lo, hi)
+        stop = np.clip(end[mask], lo, hi)
+        values = self.values[:self.size][mask]
+
+        # 事件扫描：开始 +占用量，结束 -占用量，桶边界 0；排序后累加得到每段时间的占用水平
+        times = np.concatenate([start, stop, edges])
+        deltas = np.concatenate([values, -values, np.zeros((k + 1, self.width), dtype=np.int64)])
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        levels = np.cumsum(deltas[order], axis=0)[:-1]
+        lengths = np.diff(times)
+        buckets = np.searchsorted(edges, times[:-1], side='right') - 1
+        valid = (lengths > 0) & (buckets < k)
+        levels, lengths, buckets = levels[valid], lengths[valid], buckets[valid]
+
+        results = [{'resources': {}} for _ in range(k)]
+        offset = 0
+        for column in self.columns:
+            used, busy = column.used(levels[:, offset:offset + column.width])
+            offset += column.width
+            used_hours = np.bincount(buckets, weights=used * lengths, minlength=k) / HOUR
+            peak = np.zeros(k)
+            np.maximum.at(peak, buckets, used)
+            by_id = None
+            if busy is not None:
+                by_id = np.stack([np.bincount(buckets, weights=busy[:, j] * lengths, minlength=k) / HOUR
+                                  for j in range(busy.shape[1])], axis=1)
+            for i, result in enumerate(results):
+                stats = {'used_hours': float(used_hours[i]), 'peak': float(peak[i])}
+                if by_id is not None:
+                    stats['by_id'] = dict(zip(column.resource.ids, by_id[i].tolist()))
+                result['resources'][column.resource.key] = stats
+
+        # 按姓名、任务类型分组：每条记录与每个桶的重叠时长 × 占用量
+        first = np.searchsorted(edges, start, side='right') - 1
+        last = np.searchsorted(edges, stop, side='left') - 1
+        counts = last - first + 1
+        rows = np.repeat(np.arange(len(start)), counts)
+        positions = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+        bucket_of = first[rows] + positions
+        overlap = (np.minimum(stop[rows], edges[bucket_of + 1]) - np.maximum(start[rows], edges[bucket_of])) / HOUR
+        keys = [column.resource.key for column in self.columns]
+        weighted = pd.DataFrame(self.amounts[:self.size][mask][rows] * overlap[:, None], columns=keys)
+        weighted['bucket'] = bucket_of
+        for field, labels in (('by_user', self.names), ('by_task_type', self.tasks)):
+            weighted['group'] = labels[:self.size][mask][rows]
+            grouped = weighted.groupby(['bucket', 'group'])[keys].sum()
+            grouped_buckets = grouped.index.get_level_values('bucket').to_numpy()
+            groups = grouped.index.get_level_values('group').to_numpy()
+            sums = grouped.to_numpy()
+            # 每个桶保存 (分组名数组, 使用量矩阵)，合并多个桶时一次 groupby
+            bounds = np.searchsorted(grouped_buckets, np.arange(k + 1))
+            for i, result in enumerate(results):
+                result[field] = (groups[bounds[i]:bounds[i + 1]], sums[bounds[i]:bounds[i + 1]])
+        return results
+
+
+class BucketCache:
+    """已结束的时间桶的统计结果
+
+    结果存放在 LRU 中，键为 ('analytics', 服务器, 桶大小, 桶开始)，依赖标签 ('data', 服务器)；
+    这里只保存每种桶大小有序的桶开始时间，用于按时间范围作废。被 LRU 淘汰的桶开始时间留在列表中，
+    查询时视为未命中，作废时一并删除
+    """
+
+    def __init__(self, lru, server_type):
+        self.lru = lru
+        self.server_type = server_type
+        self._starts = {bucket: [] for bucket in BUCKETS}
+        self._known = {bucket: set() for bucket in BUCKETS}
+
+    def _key(self, bucket, start):
+        return 'analytics', self.server_type, bucket, start
+
+    def get(self, bucket, start):
+        return self.lru.get(self._key(bucket, start))
+
+    def put(self, bucket, start, result):
+        if start not in self._known[bucket]:
+            self._known[bucket].add(start)
+            bisect.insort(self._starts[bucket], start)
+        self.lru.put(self._key(bucket, start), result, _result_size(result), deps=[('data', self.server_type)])
+
+    def invalidate(self, begin, end):
+        """作废与 [begin, end) 重叠的桶"""
+        for bucket, size in BUCKETS.items():
+            starts = self._starts[bucket]
+            lo = bisect.bisect_right(starts, begin - size)
+            hi = bisect.bisect_left(starts, end)
+            for start in starts[lo:hi]:
+                self._known[bucket].discard(start)
+                self.lru.discard(self._key(bucket, start))
+            del starts[lo:hi]
+
+    def clear(self):
+        for bucket in BUCKETS:
+            self._starts[bucket].clear()
+            self._known[bucket].clear()
+        self.lru.invalidate(('data', self.server_type))
+
+
+def _result_size(result):
+    """一个桶的结果占用内存的估计（字节）：数组按 nbytes，字典和字符串按每项的固定开销"""
+    size = 1024
+    for field in ('by_user', 'by_task_type'):
+        labels, sums = result[field]
+        size += sums.nbytes + 80 * len(labels)
+    for stats in result['resources'].values():
+        size += 400 + 200 * len(stats.get('by_id', ()))
+    return size
+
+
+def _changed_spans(old, new):
+    """一行从 old 改为 new（row_key）后统计结果可能变化的时间范围"""
+    if old is None:
+        spans = [new[:2]]
+    elif old[2] == new[2] and old[0] == new[0]:
+        # 只有结束时间变化（完成、修改实际使用时间）时，只影响新旧结束时间之间
+        if old[1] == new[1]:
+            return []
+        spans = [(min(old[1], new[1]), max(old[1], new[1]))]
+    else:
+        spans = [old[:2], new[:2]]
+    return [(begin, end) for begin, end in spans if not math.isnan(begin)]
+
+
+def _round(value):
+    return round(float(value), 3)
+
+
+class ServerAnalytics:
+    """一台服务器的利用率统计
+
+    记录变更由 ServerManager 在该服务器的写锁内通知；统计在读锁内调用，可能并发，缓存由内部的锁保护
+    """
+
+    def __init__(self, spec, lru):
+        self.spec = spec
+        self.columns = [ANALYTICS_KINDS[resource.kind](resource) for resource in spec.resources]
+        self.table = UsageTable(self.columns)
+        self.cache = BucketCache(lru, spec.id)
+        self._lock = threading.Lock()
+        # 已归档的记录占用数组开头的 offset 行，当前记录的行号需加上 offset
+        self.offset = 0
+
+    def archive_table(self, records):
+        """已归档记录的表，传给 load 与当前记录一起统计"""
+        table = UsageTable(self.columns)
+        table.load(records)
+        return table
+
+    def load(self, records, archived=None):
+        with self._lock:
+            self.table.load(records, archived)
+            self.offset = archived.size if archived is not None else 0
+            self.cache.clear()
+
+    def update(self, row_index, old_record, new_record):
+        """登记（old_record 为 None）或修改一行后更新数组，并作废受影响的缓存桶"""
+        row_index += self.offset
+        with self._lock:
+            old = self.table.row_key(row_index) if old_record is not None else None
+            self.table.set(row_index, new_record)
+            for begin, end in _changed_spans(old, self.table.row_key(row_index)):
+                self.cache.invalidate(begin, end)
+
+    def _bucket_results(self, starts, bucket, now):
+        size = BUCKETS[bucket]
+        with self._lock:
+            results = [self.cache.get(bucket, start) for start in starts]
+            missing = [i for i, result in enumerate(results) if result is None]
+            CACHE_REQUESTS.inc(len(starts) - len(missing), cache='analytics', key=bucket, result='hit')
+            CACHE_REQUESTS.inc(len(missing), cache='analytics', key=bucket, result='miss')
+            # 连续的未缓存桶一次扫描
+            runs = []
+            for i in missing:
+                if runs and runs[-1][1] == i:
+                    runs[-1][1] = i + 1
+                else:
+                    runs.append([i, i + 1])
+            for first, last in runs:
+                edges = np.array([starts[i] for i in range(first, last)] + [starts[last - 1] + size], dtype=float)
+                for i, result in zip(range(first, last), self.table.sweep(edges, now)):
+                    result['entry'] = self._entry(starts[i], size, result)
+                    results[i] = result
+                    if starts[i] + size <= now:
+                        self.cache.put(bucket, starts[i], result)
+        return results
+
+    def _entry(self, start, size, result):
+        """一个桶在响应中的内容，随结果一起缓存"""
+        resources = {}
+        for column in self.columns:
+            stats = result['resources'][column.resource.key]
+            capacity = column.total * size / HOUR
+            entry = {'used_hours': _round(stats['used_hours']),
+                     'utilization': _round(stats['used_hours'] / capacity) if capacity else 0.0,
+                     'peak': stats['peak']}
+            if 'by_id' in stats:
+                entry['by_id'] = {str(i): _round(hours) for i, hours in stats['by_id'].items()}
+            resources[column.resource.key] = entry
+        return {'start': from_seconds(start).strftime(TIME_FORMAT),
+                'end': from_seconds(start + size).strftime(TIME_FORMAT),
+                'resources': resources}
+
+    def utilization(self, begin, end, bucket, now):
+        """统计 [begin, end)（datetime，begin 为 None 时取 DEFAULT_BUCKETS 个桶）内各时间桶的利用率
+
+        返回各桶每项资源的使用量（资源数×小时）、利用率和峰值，整个时间范围的合计，
+        以及按姓名、任务类型分组的使用量；时间范围超过 MAX_BUCKETS 个桶时抛出 ValueError
+        """
+        size = BUCKETS[bucket]
+        now_seconds = to_seconds(now, 0)
+        hi = to_seconds(end, now_seconds)
+        hi_floor = floor_bucket(hi, bucket)
+        hi = hi_floor if hi_floor == hi else hi_floor + size
+        lo = floor_bucket(to_seconds(begin, hi - DEFAULT_BUCKETS[bucket] * size), bucket)
+        if lo >= hi:
+            raise ValueError('from 必须早于 to')
+        count = int((hi - lo) // size)
+        if count > MAX_BUCKETS:
+            raise ValueError(f'时间范围过长，最多 {MAX_BUCKETS} 个{bucket}')
+        starts = [lo + i * size for i in range(count)]
+        results = self._bucket_results(starts, bucket, now_seconds)
+
+        keys = [column.resource.key for column in self.columns]
+        totals = {key: {'used_hours': 0.0, 'peak': 0.0} for key in keys}
+        for result in results:
+            for key, stats in result['resources'].items():
+                totals[key]['used_hours'] += stats['used_hours']
+                totals[key]['peak'] = max(totals[key]['peak'], stats['peak'])
+        groups = {}
+        for field in ('by_user', 'by_task_type'):
+            labels = np.concatenate([result[field][0] for result in results])
+            sums = pd.DataFrame(np.concatenate([result[field][1] for result in results]), columns=keys)
+            groups[field] = {group: {key: _round(value) for key, value in row.items()}
+                             for group, row in sums.groupby(labels).sum().to_dict('index').items()}
+
+        for column in self.columns:
+            stats = totals[column.resource.key]
+            capacity = column.total * (hi - lo) / HOUR
+            stats['utilization'] = _round(stats['used_hours'] / capacity) if capacity else 0.0
+            stats['used_hours'] = _round(stats['used_hours'])
+        return {
+            'bucket': bucket,
+            'from': from_seconds(lo).strftime(TIME_FORMAT),
+            'to': from_seconds(hi).strftime(TIME_FORMAT),
+            'capacity': {column.resource.key: column.total for column in self.columns},
+            'totals': totals,
+            'buckets': [result['entry'] for result in results],
+            **groups
+        }
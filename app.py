@@ -1,806 +1,1674 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from flask import Flask, Response, g, get_template_attribute, render_template, request, redirect, url_for, jsonify, send_file, abort
+from markupsafe import Markup
 import pandas as pd
 import os
+import sys
+import cProfile
 from datetime import datetime, timedelta
+import io
+import codecs
+import json
 import shutil
+import tempfile
 import time
 import threading
-from functools import wraps
-import re
+import heapq
+import itertools
+import bisect
+import zlib
+from contextlib import contextmanager
+from functools import partial, wraps
+
+from analytics import BUCKETS, ServerAnalytics
+from archive import ArchiveStore
+from backup import BackupStore
+from bulk import CHUNK_ROWS, CONTENT_TYPES, FORMATS, check_columns, chunks, detect_format, export_rows, read_rows, validate_chunk
+from cache import LRUCache
+from coherence import Coherence
+from filewatch import FileWatcher
+from locks import ReadWriteLock
+from pagecache import ENCODINGS, CachedBody, choose_encoding
+from metrics import CACHE_REQUESTS, Counter, Gauge, Histogram, instrument, render as render_metrics, timed
+from duration import parse_duration_hours, parse_start_date
+from records import Record, new_record_id, records_from_frame
+from schedule import ServerSchedule
+from inventory import ID_COLUMN, SERVER_COLUMNS, SERVERS
+from storage import create_storage, to_text
+from writequeue import WriteBatch, WriteQueue
 
 app = Flask(__name__)
 
+SSE_KEEPALIVE_SECONDS = 15
+LONG_POLL_MAX_SECONDS = 60
+RECORDS_PAGE_SIZE = 50
+MAX_RECORDS_PAGE_SIZE = 200
+# 修改接口接受的完成状态：'Yes' 为已完成，空字符串为进行中
+STATUS_VALUES = ('Yes', '')
+
+# 运行指标，由 /metrics 输出（见 metrics.py）
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP 请求耗时（秒），按路由模板统计', ['route', 'method', 'status'])
+MANAGER_SECONDS = Histogram('server_manager_call_seconds', 'ServerManager 方法耗时（秒）', ['method'])
+STORAGE_SECONDS = Histogram('storage_call_seconds', '存储后端读写耗时（秒）', ['backend', 'method'])
+RELOADS = Counter('records_reloads_total', '其他进程写入后从存储重新加载记录的次数，mode 为 incremental（只读取新增和修改的行）或 full',
+                  ['server', 'mode'])
+CHECK_SECONDS = Histogram('periodic_check_seconds', '一次超时检查（全部服务器）的耗时（秒）')
+CHECK_ROWS = Counter('periodic_check_rows_total', '超时检查处理的行数，started 为预约开始，completed 为超时自动完成',
+                     ['server', 'action'])
+BULK_ROWS = Counter('bulk_import_rows_total', '批量导入处理的行数，result 为 imported、skipped（记录ID已存在）或 rejected',
+                    ['server', 'result'])
+ARCHIVED_ROWS = Counter('archived_records_total', '移入归档的已完成记录数', ['server'])
+EXTERNAL_RELOADS = Counter('records_external_reloads_total', '记录文件被外部程序修改后重新加载的次数', ['server'])
+STORAGE_METHODS = ('init_server', 'load', 'write_batch', 'replace', 'compact', 'reload')
+
+# 派生数据（导出的 .xlsx、利用率统计的时间桶）共用的缓存容量上限（字节，按估计的大小计）
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# 渲染结果（页面、接口响应体及其压缩版本、表格行片段）缓存的内存上限
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# 记录文件的监视：WATCH_FILES=0 时关闭；inotify 不可用时按 FILE_POLL_INTERVAL 秒定时检查
+WATCH_FILES = os.environ.get('WATCH_FILES', '1') == '1'
+FILE_POLL_INTERVAL = float(os.environ.get('FILE_POLL_INTERVAL', 2))
+# 登记和修改状态经写入队列组提交（见 writequeue.py），GROUP_COMMIT=0 时每个请求各自提交
+GROUP_COMMIT = os.environ.get('GROUP_COMMIT', '1') == '1'
+WRITE_BATCH_MAX = int(os.environ.get('WRITE_BATCH_MAX', 256))
+# 归档：登记日期早于 ARCHIVE_AFTER_DAYS 天的已完成记录每 ARCHIVE_INTERVAL 秒移入归档一次（见 archive.py），为 0 时不归档
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 24 * 3600))
+# 缓存的归档月份中每条记录占用内存的估计（字节）
+ARCHIVE_RECORD_BYTES = 1500
+# 每台服务器变更日志的最大条数，超过时丢弃较早的一半，请求更早版本的客户端改为取得全部记录
+CHANGE_LOG_MAX = int(os.environ.get('CHANGE_LOG_MAX', 10000))
+# 重新加载（归档、恢复备份、外部修改）后移出存储的记录ID保留多少秒，期间以它们为游标的分页请求仍能接着翻页
+MOVED_CURSOR_SECONDS = 3600
+# 分页游标指向已归档的记录（按日期查询时排在存储中的记录之后）时加的前缀
+ARCHIVE_CURSOR = 'archive:'
+
+# 批量导入的结果中最多列出的错误行数
+MAX_IMPORT_ERRORS = 100
+
+# 单个请求的性能分析：PROFILE_REQUESTS=1 时，带 ?profile=1 的请求把 cProfile 结果写入 PROFILE_DIR
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+class Usage:
+    """一台服务器的实时占用：清单中每项资源一个计数器，随记录变化按差量更新"""
+    
+    def __init__(self, spec):
+        self.counters = [resource.counter() for resource in spec.resources]
+    
+    def apply(self, record, sign):
+        """把一条记录的占用计入(sign=1)或移出(sign=-1)"""
+        if record.completed:
+            return
+        for counter, demand in zip(self.counters, record.demand):
+            counter.apply(demand, sign)
+    
+    def summary(self):
+        summary = {}
+        for counter in self.counters:
+            summary.update(counter.summary())
+        return summary
+
 class ServerManager:
     def __init__(self):
-        self.excel_9755 = "9755_records.xlsx"
-        self.excel_5520 = "5520_records.xlsx"
-        self.backup_dir = "backups"
+        self.backup_dir = os.environ.get('BACKUP_DIR', 'backups')
+        
+        # 多进程部署时的进程间协调：共享版本号、跨进程写锁、超时检查的主进程选举
+        self._coherence = Coherence(os.environ.get('COHERENCE_DIR', 'coherence'), list(SERVER_COLUMNS))
+        self.coherence_poll_interval = 5  # 主进程检查其他进程写入的新任务的间隔（秒）
+        self.leader_retry_interval = 10  # 非主进程尝试接替超时检查的间隔（秒）
+        
+        # 存储后端：sqlite（默认，Excel 仅用于导出）、feather（列式文件 + 预写日志，Excel 仅用于导出）、
+        # excel（Excel + 预写日志）或 excel-direct（直接读写 Excel 文件）
+        # 除 sqlite 外的后端都在进程内缓存整张表，只能由一个进程使用，多进程部署需使用 sqlite
+        backend = os.environ.get('STORAGE_BACKEND', 'sqlite')
+        if backend != 'sqlite' and not self._coherence.claim_exclusive('excel-storage'):
+            raise RuntimeError(f'存储后端 {backend} 已被其他进程使用，多进程部署请设置 STORAGE_BACKEND=sqlite')
+        self.storage = instrument(create_storage(
+            backend,
+            {server_type: spec.excel_file for server_type, spec in SERVERS.items()},
+            db_path=os.environ.get('SQLITE_PATH', 'records.db'),
+            journal_dir=os.environ.get('JOURNAL_DIR', 'journal'),
+            feather_dir=os.environ.get('FEATHER_DIR', 'data')
+        ), STORAGE_METHODS, STORAGE_SECONDS, backend=backend)
+        
+        # 派生数据的缓存：有界 LRU，按依赖标签作废。('records', 服务器) 在每次写入时作废，
+        # ('data', 服务器) 在重新加载时作废，并连带作废 ('records', 服务器)；
+        # 导出的 .xlsx 依赖 records 并带数据版本号，利用率统计的时间桶依赖 data、写入时按时间范围单独作废
+        self._cache = LRUCache('server_manager', CACHE_MAX_BYTES)
+        for server_type in SERVER_COLUMNS:
+            self._cache.depend(('records', server_type), ('data', server_type))
+        
+        # 常驻内存的记录（Record，加载或写入时解析一次）与资源占用，写入时同步更新。每台服务器一把读写锁，两台服务器的写入互不阻塞；
+        # 资源占用在每次写入后发布为新的快照，读取时不加锁
+        self._records = {}
+        self._usage = {}
+        self._summaries = {}
+        self._locks = {server_type: ReadWriteLock() for server_type in SERVER_COLUMNS}
         
-        # 缓存相关
-        self._cache = {}
-        self._cache_lock = threading.Lock()
-        self._last_modified = {}
-        self._data_cache = {}
-        self.cache_timeout = 30  # 30秒缓存
+        # 未完成记录的索引 {row_index: 预计结束时间} 与按结束时间排序的最小堆
+        self._active = {}
+        self._expiry_heaps = {}
         
-        if not os.path.exists(self.backup_dir):
-            os.makedirs(self.backup_dir)
+        # 预约表：未完成记录占用的时间段，用于登记时的冲突检查和空闲时段查询。
+        # 提前预约的记录在预约开始前不计入当前占用，_counted 为已计入的行，_start_heaps 为按预约开始时间排序的最小堆
+        self._schedules = {}
+        self._counted = {}
+        self._start_heaps = {}
         
-        self.init_excel_files()
+        # 利用率统计：每台服务器的使用时间段数组与已结束时间桶的缓存，随记录变化按行更新
+        self._analytics = {server_type: ServerAnalytics(spec, self._cache) for server_type, spec in SERVERS.items()}
+        self._expiry_cond = threading.Condition()
+        self.max_check_interval = 300  # 没有到期任务时最长5分钟检查一次
+        
+        # 数据变更通知：登记、状态修改、超时自动完成时版本号加一并唤醒等待者
+        self._change_version = 0
+        self._change_cond = threading.Condition()
+        
+        # 每台服务器的数据版本号，取自进程间共享的计数器，任何进程写入都会使其加一；
+        # 变更日志按版本号顺序记录本进程加载后（或截断后）被修改的行，用于增量查询；
+        # 请求的版本早于 _base_versions 时日志已不完整，返回全部记录
+        self._base_versions = {}
+        self._versions = {}
+        self._change_log = {}
+        
+        # 分页查询用的索引：姓名 -> 行号列表、按 (登记日期, 行号) 排序的列表；
+        # 未完成状态直接使用 self._active，每行的登记日期取 Record.start_day
+        self._name_index = {}
+        self._start_index = {}
+        
+        # 记录ID -> 行号，修改记录时按ID定位
+        self._ids = {}
+        # 分页游标：重新加载后移出存储的记录ID -> 原顺序中其后（更早登记）第一条仍在存储中的记录ID，
+        # 每次重新加载一项 (时间, 映射)，保留 MOVED_CURSOR_SECONDS 秒
+        self._moved_ids = {}
+        
+        # 增量备份：单个后台线程按内容寻址保存快照，连续写入合并为一次
+        self.backups = BackupStore(self.backup_dir)
+        
+        # 归档：已完成的历史记录按月份移出存储，内存中只有未完成和近期的记录。
+        # 按登记日期查询时读取重叠的月份（缓存在 self._cache 中）；利用率统计使用按归档签名缓存的归档记录表
+        self.archive = ArchiveStore(os.environ.get('ARCHIVE_DIR', 'archive'))
+        self._archive_tables = {}
+        self._last_archive = None
+        
+        # 写入队列：同时到达的登记和状态修改成批执行，每批只写一次存储
+        self._write_queues = {}
+        if GROUP_COMMIT:
+            self._write_queues = {server_type: WriteQueue(server_type, partial(self._commit, server_type), WRITE_BATCH_MAX)
+                                  for server_type in SERVER_COLUMNS}
+        
+        self.init_storage()
+        
+        # 以 .xlsx 为数据源的后端：文件被外部程序（如 Excel）修改后重新加载
+        self._file_watcher = None
+        watched = self.storage.watched_files()
+        if watched and WATCH_FILES:
+            self._file_watcher = FileWatcher(watched, self._on_external_change, poll_interval=FILE_POLL_INTERVAL).start()
+            print(f"监视记录文件的外部修改（{self._file_watcher.mode}）")
         
         # 启动定时检查任务
         self._start_periodic_check()
     
-    def init_excel_files(self):
-        columns_9755 = ['时间', '姓名', '占用节点', '占用GPU', '是否使用远程桌面', '任务类型', '预计使用时间', '实际使用时间', '是否完成']
-        columns_5520 = ['时间', '姓名', '使用核数', '占用GPU', '是否使用远程桌面', '任务类型', '预计使用时间', '实际使用时间', '是否完成']
-        
-        if not os.path.exists(self.excel_9755):
-            df = pd.DataFrame(columns=columns_9755)
-            df.to_excel(self.excel_9755, index=False)
-        else:
-            # 检查并添加新列
-            self._add_missing_columns(self.excel_9755, columns_9755)
-        
-        if not os.path.exists(self.excel_5520):
-            df = pd.DataFrame(columns=columns_5520)
-            df.to_excel(self.excel_5520, index=False)
-        else:
-            # 检查并添加新列
-            self._add_missing_columns(self.excel_5520, columns_5520)
-    
-    def _get_file_modified_time(self, filename):
-        if os.path.exists(filename):
-            return os.path.getmtime(filename)
-        return 0
-    
-    def _is_cache_valid(self, cache_key):
-        with self._cache_lock:
-            if cache_key not in self._cache:
-                return False
-            cache_time, _ = self._cache[cache_key]
-            return time.time() - cache_time < self.cache_timeout
-    
-    def _get_cached_data(self, cache_key):
-        with self._cache_lock:
-            if cache_key in self._cache:
-                _, data = self._cache[cache_key]
-                return data
-        return None
+    def init_storage(self):
+        for server_type, columns in SERVER_COLUMNS.items():
+            with self._locks[server_type].write(), self._coherence.lock(server_type):
+                self.storage.init_server(server_type, columns)
+                # 存储文件可能在停机期间被修改，启动时版本号加一，使客户端缓存和其他进程的内存数据失效
+                self._coherence.versions.bump(server_type)
+                self._load_server(server_type)
+            self.backup_file(server_type)
+    
+    def _on_external_change(self, server_type):
+        """记录文件发生变化：不是本进程写入的，则重新读取存储并加载，版本号加一使客户端缓存失效"""
+        if not self.storage.changed_externally(server_type):
+            return
+        print(f"{server_type} 的记录文件被外部修改，重新加载")
+        with self._write_transaction(server_type):
+            self.storage.reload(server_type)
+            self._coherence.versions.bump(server_type)
+            self._load_server(server_type)
+        EXTERNAL_RELOADS.inc(server=server_type)
+    
+    @contextmanager
+    def _write_transaction(self, server_type):
+        """写事务：进程内写锁 + 跨进程文件锁；进入时如果其他进程已经写入，先从存储读取其写入"""
+        with self._locks[server_type].write(), self._coherence.lock(server_type):
+            if self._coherence.versions.get(server_type) != self._versions.get(server_type):
+                self._refresh_server(server_type)
+            yield
+    
+    @timed(MANAGER_SECONDS)
+    def _refresh_server(self, server_type):
+        """其他进程写入后同步内存数据，调用方需处于写事务中
+        
+        存储能给出本进程加载后新增和修改的行时，只读取这些行并按本进程写入时的路径更新内存与各索引，
+        变更日志保留，增量查询仍返回差量；否则（整表替换后、不支持的后端）完整加载
+        """
+        # 先取版本号再读取：读取期间其他进程的写入会在下次同步时再读一遍，不会遗漏
+        version = self._coherence.versions.get(server_type)
+        changes = self.storage.load_changes(server_type)
+        if changes is None:
+            RELOADS.inc(server=server_type, mode='full')
+            self._load_server(server_type)
+            return
+        RELOADS.inc(server=server_type, mode='incremental')
+        resources = SERVERS[server_type].resources
+        records = self._records[server_type]
+        rows = []
+        for row_index, fields in changes:
+            record = Record(fields, resources)
+            if row_index < len(records):
+                # 本进程自己的写入也在其中，内容相同的行跳过
+                if records[row_index].revision == record.revision:
+                    continue
+                self._set_record(server_type, row_index, record)
+            elif row_index == len(records):
+                self._insert_record(server_type, record)
+            else:
+                RELOADS.inc(server=server_type, mode='full')
+                self._load_server(server_type)
+                return
+            rows.append(row_index)
+        # 超时检查只在主进程中运行：主进程计入已开始的预约后版本号加一，存储没有变化，这里同样计入
+        rows.extend(idx for idx in self._start_due(server_type, datetime.now()) if idx not in rows)
+        self._summaries[server_type] = self._usage[server_type].summary()
+        self._versions[server_type] = version
+        self._log_changes(server_type, version, rows)
+        if rows:
+            self._cache.invalidate(('records', server_type))
+        self._wake_watchers()
+    
+    def _sync(self, server_type):
+        """读取前检查共享版本号，其他进程写入过时重新加载"""
+        if self._coherence.versions.get(server_type) != self._versions.get(server_type):
+            with self._write_transaction(server_type):
+                pass
     
-    def _set_cache(self, cache_key, data):
-        with self._cache_lock:
-            self._cache[cache_key] = (time.time(), data)
+    @timed(MANAGER_SECONDS)
+    def _load_server(self, server_type):
+        """从存储加载记录并重建资源占用，调用方需持有该服务器的跨进程写锁"""
+        spec = SERVERS[server_type]
+        df, typed = self.storage.load_typed(server_type)
+        records = records_from_frame(df, spec.resources, typed=typed)
+        ids = self._assign_record_ids(server_type, records)
+        archived = self._archive_table(server_type)
+        usage = Usage(spec)
+        schedule = ServerSchedule(spec)
+        now = datetime.now()
+        active = {}
+        counted = set()
+        starts = []
+        name_index = {}
+        for idx, record in enumerate(records):
+            if not record.completed:
+                active[idx] = record.end_time
+                schedule.add(idx, record)
+                if record.booking_start is not None and record.booking_start > now:
+                    starts.append((record.booking_start, idx))
+                else:
+                    usage.apply(record, 1)
+                    counted.add(idx)
+            name_index.setdefault(record.name, []).append(idx)
+        heap = [(end_time, idx) for idx, end_time in active.items() if end_time is not None]
+        heapq.heapify(heap)
+        heapq.heapify(starts)
+        start_index = sorted((record.start_day, idx) for idx, record in enumerate(records)
+                             if record.start_day is not None)
+        moved = self._moved_since_load(server_type, ids)
+        with self._locks[server_type].write():
+            base_version = self._coherence.versions.get(server_type)
+            self._base_versions[server_type] = base_version
+            self._versions[server_type] = base_version
+            self._change_log[server_type] = ([], [])
+            self._records[server_type] = records
+            self._usage[server_type] = usage
+            self._active[server_type] = active
+            self._expiry_heaps[server_type] = heap
+            self._schedules[server_type] = schedule
+            self._counted[server_type] = counted
+            self._start_heaps[server_type] = starts
+            self._name_index[server_type] = name_index
+            self._ids[server_type] = ids
+            self._moved_ids[server_type] = moved
+            self._start_index[server_type] = start_index
+            self._summaries[server_type] = usage.summary()
+            self._cache.invalidate(('data', server_type))
+            self._analytics[server_type].load(records, archived)
+        with self._expiry_cond:
+            self._expiry_cond.notify_all()
+        self._wake_watchers()
     
-    def _clear_cache(self, pattern=None):
-        with self._cache_lock:
-            if pattern:
-                keys_to_remove = [k for k in self._cache.keys() if pattern in k]
-                for key in keys_to_remove:
-                    del self._cache[key]
+    def _moved_since_load(self, server_type, ids):
+        """重新加载时不在新记录中的记录ID，映射到原顺序中其后第一条仍在新记录中的记录ID（没有时为 None），
+        与此前未过期的映射一起返回，供 _cursor_limit 接着翻页"""
+        now = time.monotonic()
+        history = [(at, moved) for at, moved in self._moved_ids.get(server_type, [])
+                   if now - at < MOVED_CURSOR_SECONDS]
+        moved = {}
+        below = None
+        for record in self._records.get(server_type, []):
+            record_id = record.get(ID_COLUMN)
+            if record_id in ids:
+                below = record_id
             else:
-                self._cache.clear()
+                moved[record_id] = below
+        if moved:
+            history.append((now, moved))
+        return history
     
-    def _add_missing_columns(self, filename, expected_columns):
-        """为现有Excel文件添加缺失的列"""
-        df = pd.read_excel(filename)
-        current_columns = list(df.columns)
+    def _cursor_limit(self, server_type, record_id):
+        """分页游标（上一页最后一条记录的ID）对应的存储行号上限（不含），调用方需持有读锁
         
-        # 检查是否需要添加新列
-        missing_columns = [col for col in expected_columns if col not in current_columns]
+        游标记录已移出存储时，沿重新加载前的顺序找到其后第一条仍在存储中的记录，从它开始（含）；
+        不是存储中的记录、也不是近期移出的记录时返回 None
+        """
+        ids = self._ids[server_type]
+        replaced = False
+        visited = set()
+        while record_id not in ids:
+            if record_id in visited:
+                return None
+            visited.add(record_id)
+            for _, mapping in reversed(self._moved_ids[server_type]):
+                if record_id in mapping:
+                    record_id = mapping[record_id]
+                    break
+            else:
+                return None
+            if record_id is None:
+                return 0
+            replaced = True
+        return ids[record_id] + 1 if replaced else ids[record_id]
+    
+    def _assign_record_ids(self, server_type, records):
+        """为没有记录ID（旧数据、在 Excel 中手工添加的行）或ID重复的记录分配ID并写入存储，返回 {记录ID: 行号}
         
-        if missing_columns:
-            for col in missing_columns:
-                if col == '实际使用时间':
-                    # 如果没有实际使用时间列，用预计使用时间填充
-                    df[col] = df.get('预计使用时间', '')
-                else:
-                    df[col] = ''
-            
-            # 按照期望的列顺序重新排列
-            df = df.reindex(columns=expected_columns)
-            df.to_excel(filename, index=False)
-    
-    def _parse_time_duration(self, time_str):
-        """解析时间字符串，返回小时数"""
-        if not time_str or pd.isna(time_str):
-            return 0
-        
-        time_str = str(time_str).strip().lower()
-        
-        # 首先检查是否是日期范围格式
-        date_range_patterns = [
-            r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})\s*[~\-到至]\s*(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})',  # 2025.6.10~2025.6.12
-            r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})\s*[~\-到至]\s*(\d{1,2})[.\-/](\d{1,2})',  # 2025.6.10~6.12
-        ]
-        
-        for pattern in date_range_patterns:
-            match = re.search(pattern, time_str)
-            if match:
+        在加载过程中调用，记录尚未发布，直接修改其字段；写入存储后版本号加一，其他进程随之重新加载
+        """
+        ids = {}
+        updates = []
+        for idx, record in enumerate(records):
+            record_id = to_text(record.get(ID_COLUMN, '')).strip()
+            if not record_id or record_id in ids:
+                record_id = new_record_id()
+                record.fields[ID_COLUMN] = record_id
+                updates.append(('update', idx, {ID_COLUMN: record_id}))
+            ids[record_id] = idx
+        if updates:
+            self.storage.write_batch(server_type, updates)
+            self._coherence.versions.bump(server_type)
+            print(f"已为 {server_type} 的 {len(updates)} 条记录分配记录ID")
+        return ids
+    
+    def _archive_table(self, server_type):
+        """已归档记录的利用率统计表，归档文件变化时重建"""
+        signature = self.archive.signature(server_type)
+        cached = self._archive_tables.get(server_type)
+        if cached is None or cached[0] != signature:
+            records = list(self._iter_archived(server_type, self.archive.months(server_type)))
+            cached = (signature, self._analytics[server_type].archive_table(records))
+            self._archive_tables[server_type] = cached
+        return cached[1]
+    
+    def _iter_archived(self, server_type, months):
+        """按月份依次读取归档记录（不缓存），用于导出和重建统计表"""
+        resources = SERVERS[server_type].resources
+        for month in months:
+            yield from records_from_frame(self.archive.read(server_type, month), resources)
+    
+    def _archived_month(self, server_type, month):
+        """一个月份的归档记录，按文件签名缓存"""
+        key = ('archive', server_type, month)
+        signature = self.archive.signature(server_type, month)
+        records = self._cache.get(key, signature)
+        CACHE_REQUESTS.inc(cache='archive', key=server_type, result='miss' if records is None else 'hit')
+        if records is None:
+            records = records_from_frame(self.archive.read(server_type, month), SERVERS[server_type].resources)
+            self._cache.put(key, records, ARCHIVE_RECORD_BYTES * len(records), version=signature)
+        return records
+    
+    @timed(MANAGER_SECONDS)
+    def archive_completed(self, server_type, now=None):
+        """把登记日期早于 ARCHIVE_AFTER_DAYS 天、已完成且预计结束时间已过的记录移入归档，返回移动的记录数
+        
+        先写归档文件，再用剩余的记录替换存储；两步之间中断时记录同时在存储和归档中，下次归档时按记录ID合并
+        """
+        cutoff = (now or datetime.now()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+        cutoff_day = cutoff.toordinal()
+        with self._write_transaction(server_type):
+            records = self._records[server_type]
+            moved = [record for record in records
+                     if record.completed and record.start_day is not None and record.start_day < cutoff_day
+                     and (record.end_time is None or record.end_time < cutoff)]
+            if not moved:
+                return 0
+            columns = SERVER_COLUMNS[server_type]
+            self.backups.snapshot(server_type, columns, list(records))
+            # add 返回时归档已落盘，之后才从存储中删除
+            months = self.archive.add(server_type, columns, moved)
+            moved_ids = {id(record) for record in moved}
+            self.storage.replace(server_type, [record.fields for record in records if id(record) not in moved_ids])
+            self._coherence.versions.bump(server_type)
+            self._load_server(server_type)
+        ARCHIVED_ROWS.inc(len(moved), server=server_type)
+        print(f"已把 {server_type} 的 {len(moved)} 条已完成记录移入归档（{months[0]} ~ {months[-1]}）")
+        return len(moved)
+    
+    def _notify_change(self, server_type, row_indices):
+        """数据变更后发布资源占用快照、递增版本号、记录变更行并通知所有等待者，调用方需处于写事务中"""
+        self._summaries[server_type] = self._usage[server_type].summary()
+        version = self._coherence.versions.bump(server_type)
+        self._versions[server_type] = version
+        self._cache.invalidate(('records', server_type))
+        self._log_changes(server_type, version, row_indices)
+        self._wake_watchers()
+    
+    def _log_changes(self, server_type, version, row_indices):
+        """把变更行按版本号记入变更日志，超过 CHANGE_LOG_MAX 条时丢弃较早的一半"""
+        log_versions, log_rows = self._change_log[server_type]
+        for row_index in row_indices:
+            log_versions.append(version)
+            log_rows.append(row_index)
+        if len(log_versions) > CHANGE_LOG_MAX:
+            # 按版本号整体丢弃：被丢弃的最大版本之后的变更全部保留
+            base_version = log_versions[len(log_versions) // 2]
+            end = bisect.bisect_right(log_versions, base_version)
+            del log_versions[:end]
+            del log_rows[:end]
+            self._base_versions[server_type] = base_version
+    
+    def _wake_watchers(self):
+        with self._change_cond:
+            self._change_version += 1
+            self._change_cond.notify_all()
+    
+    def data_version(self, server_type):
+        self._sync(server_type)
+        return self._versions[server_type]
+    
+    @timed(MANAGER_SECONDS)
+    def get_changes(self, server_type, since=None):
+        """返回 (当前版本号, [(row_index, 记录)])，since 为空时返回全部记录，否则只返回该版本之后修改过的行"""
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            version = self._versions[server_type]
+            records = self._records[server_type]
+            if since is None or since < self._base_versions[server_type]:
+                indices = range(len(records))
+            else:
+                log_versions, log_rows = self._change_log[server_type]
+                start = bisect.bisect_right(log_versions, since)
+                indices = sorted(set(log_rows[start:]))
+            return version, [(idx, records[idx]) for idx in indices]
+    
+    def wait_for_change(self, last_version, timeout=None):
+        """等待数据版本号不同于 last_version，返回当前版本号（超时则原样返回）
+        
+        其他进程的写入不会唤醒本进程，所以每秒检查一次共享版本号
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._change_cond:
+                slice_timeout = 1 if deadline is None else min(1, max(deadline - time.monotonic(), 0))
+                if self._change_cond.wait_for(lambda: self._change_version != last_version, slice_timeout):
+                    return self._change_version
+            for server_type in SERVER_COLUMNS:
+                self._sync(server_type)
+            if deadline is not None and time.monotonic() >= deadline:
+                with self._change_cond:
+                    return self._change_version
+    
+    def wait_for_data(self, server_type, since, timeout):
+        """长轮询：等待该服务器的数据版本号不同于 since，最多 timeout 秒，返回当前版本号"""
+        deadline = time.monotonic() + timeout
+        change = self.wait_for_change(None)
+        while True:
+            version = self.data_version(server_type)
+            remaining = deadline - time.monotonic()
+            if version != since or remaining <= 0:
+                return version
+            change = self.wait_for_change(change, timeout=remaining)
+    
+    def _track_record(self, server_type, row_index, record):
+        """更新未完成记录索引与到期堆，调用方需持有该服务器的写锁"""
+        active = self._active[server_type]
+        if record.completed:
+            active.pop(row_index, None)
+            return
+        end_time = record.end_time
+        if row_index in active and active[row_index] == end_time:
+            return
+        active[row_index] = end_time
+        if end_time is not None:
+            heap = self._expiry_heaps[server_type]
+            heapq.heappush(heap, (end_time, row_index))
+            # 新的最早到期时间，唤醒检查线程重新计算等待时长
+            if heap[0] == (end_time, row_index):
+                with self._expiry_cond:
+                    self._expiry_cond.notify_all()
+    
+    def _start_due(self, server_type, current_time):
+        """把预约开始时间已到的记录计入当前占用，返回这些行号；调用方需持有该服务器的写锁"""
+        records = self._records[server_type]
+        starts = self._start_heaps[server_type]
+        counted = self._counted[server_type]
+        started = []
+        while starts and starts[0][0] <= current_time:
+            begin, idx = heapq.heappop(starts)
+            record = records[idx]
+            # 记录已完成、已计入或预约时间已改变时，堆中的条目已过期
+            if record.completed or idx in counted or record.booking_start != begin:
+                continue
+            self._usage[server_type].apply(record, 1)
+            counted.add(idx)
+            started.append(idx)
+        return started
+    
+    def _track_usage(self, server_type, row_index, old_record, new_record):
+        """按记录变化更新预约表与当前占用，调用方需持有该服务器的写锁；old_record 为 None 表示新增
+        
+        预约尚未开始的记录先放入开始时间堆，开始时间到达后由检查线程计入当前占用
+        """
+        usage = self._usage[server_type]
+        counted = self._counted[server_type]
+        schedule = self._schedules[server_type]
+        if old_record is not None:
+            schedule.remove(row_index, old_record)
+            if row_index in counted:
+                usage.apply(old_record, -1)
+                counted.discard(row_index)
+        if new_record.completed:
+            return
+        schedule.add(row_index, new_record)
+        begin = new_record.booking_start
+        if begin is None or begin <= datetime.now():
+            usage.apply(new_record, 1)
+            counted.add(row_index)
+            return
+        heap = self._start_heaps[server_type]
+        heapq.heappush(heap, (begin, row_index))
+        if heap[0] == (begin, row_index):
+            with self._expiry_cond:
+                self._expiry_cond.notify_all()
+    
+    @timed(MANAGER_SECONDS)
+    def _commit(self, server_type, stages):
+        """在一个写事务中依次执行写操作 stage(batch)，再把累积的存储操作一次写入，返回每个写操作的 (结果, 异常)
+        
+        写操作先检查并修改内存中的记录，后面的写操作能看到前面的修改（如登记的冲突检查）。
+        写入存储失败时内存中的修改没有持久化，从存储重新加载，整批视为失败
+        """
+        outcomes = []
+        batch = WriteBatch()
+        with self._write_transaction(server_type):
+            for stage in stages:
                 try:
-                    groups = match.groups()
-                    if len(groups) == 6:  # 完整日期范围
-                        start_year, start_month, start_day, end_year, end_month, end_day = groups
-                        start_date = datetime(int(start_year), int(start_month), int(start_day))
-                        end_date = datetime(int(end_year), int(end_month), int(end_day))
-                    else:  # 简化日期范围 (同年)
-                        start_year, start_month, start_day, end_month, end_day = groups
-                        start_date = datetime(int(start_year), int(start_month), int(start_day))
-                        end_date = datetime(int(start_year), int(end_month), int(end_day))
-                    
-                    # 计算天数差异并转换为小时
-                    delta = end_date - start_date
-                    return max(delta.days * 24, 24)  # 至少1天(24小时)
-                except (ValueError, TypeError):
-                    continue
+                    outcomes.append((stage(batch), None))
+                except Exception as e:
+                    outcomes.append((None, e))
+            if batch.operations:
+                try:
+                    self.storage.write_batch(server_type, batch.operations)
+                except Exception as e:
+                    print(f"写入 {server_type} 出错，从存储重新加载: {str(e)}")
+                    self._load_server(server_type)
+                    return [(None, e)] * len(stages)
+            if batch.rows:
+                self._notify_change(server_type, batch.rows)
+        return outcomes
+    
+    def _submit(self, server_type, stage):
+        """执行一个写操作并返回其结果：经写入队列与其他请求的写操作一起提交，没有写入队列时单独提交
         
-        # 匹配单一日期格式 (默认为1天)
-        single_date_pattern = r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})'
-        match = re.search(single_date_pattern, time_str)
-        if match:
-            return 24  # 单日使用默认为24小时
-        
-        # 匹配各种时间单位格式
-        time_unit_patterns = [
-            (r'(\d+(?:\.\d+)?)\s*小时', 1),
-            (r'(\d+(?:\.\d+)?)\s*h', 1),
-            (r'(\d+(?:\.\d+)?)\s*hour', 1),
-            (r'(\d+(?:\.\d+)?)\s*天', 24),
-            (r'(\d+(?:\.\d+)?)\s*day', 24),
-            (r'(\d+(?:\.\d+)?)\s*分钟', 1/60),
-            (r'(\d+(?:\.\d+)?)\s*min', 1/60),
-            (r'(\d+(?:\.\d+)?)\s*minute', 1/60),
-        ]
-        
-        for pattern, multiplier in time_unit_patterns:
-            match = re.search(pattern, time_str)
-            if match:
-                return float(match.group(1)) * multiplier
-        
-        # 如果没有匹配到单位，尝试解析纯数字（默认为小时）
-        try:
-            return float(time_str)
-        except ValueError:
-            return 0
+        持有该服务器写锁的线程（超时检查）不能等待写入队列，需直接调用 _commit
+        """
+        queue = self._write_queues.get(server_type)
+        if queue is not None:
+            return queue.submit(stage)
+        (result, error), = self._commit(server_type, [stage])
+        if error is not None:
+            raise error
+        return result
+    
+    def _stage_updates(self, server_type, updates, batch):
+        """修改内存记录与资源占用并加入存储操作，updates 为 {row_index: {字段: 值}}；调用方需处于写事务中"""
+        records = self._records[server_type]
+        updates = {idx: fields for idx, fields in updates.items() if 0 <= idx < len(records)}
+        if not updates:
+            return False
+        for row_index, fields in updates.items():
+            batch.operations.append(('update', row_index, fields))
+            self._set_record(server_type, row_index, records[row_index].with_fields(fields))
+        batch.rows.extend(updates)
+        return True
+    
+    def _set_record(self, server_type, row_index, record):
+        """用 record 替换内存中的一行并同步资源占用、预约表、利用率统计与各索引，调用方需持有该服务器的写锁"""
+        old_record = self._records[server_type][row_index]
+        self._track_usage(server_type, row_index, old_record, record)
+        self._analytics[server_type].update(row_index, old_record, record)
+        self._records[server_type][row_index] = record
+        self._track_record(server_type, row_index, record)
+        old_id, record_id = old_record.get(ID_COLUMN), record.get(ID_COLUMN)
+        if old_id != record_id:
+            ids = self._ids[server_type]
+            if ids.get(old_id) == row_index:
+                del ids[old_id]
+            ids[record_id] = row_index
+        if old_record.name != record.name:
+            name_index = self._name_index[server_type]
+            name_index[old_record.name].remove(row_index)
+            bisect.insort(name_index.setdefault(record.name, []), row_index)
+        if old_record.start_day != record.start_day:
+            start_index = self._start_index[server_type]
+            if old_record.start_day is not None:
+                start_index.remove((old_record.start_day, row_index))
+            if record.start_day is not None:
+                bisect.insort(start_index, (record.start_day, row_index))
+    
+    def _insert_record(self, server_type, record):
+        """把记录追加到内存并加入资源占用、预约表、利用率统计与各索引，返回行号；调用方需持有该服务器的写锁"""
+        self._records[server_type].append(record)
+        row_index = len(self._records[server_type]) - 1
+        self._ids[server_type][record[ID_COLUMN]] = row_index
+        self._track_usage(server_type, row_index, None, record)
+        self._analytics[server_type].update(row_index, None, record)
+        self._track_record(server_type, row_index, record)
+        self._name_index[server_type].setdefault(record.name, []).append(row_index)
+        if record.start_day is not None:
+            bisect.insort(self._start_index[server_type], (record.start_day, row_index))
+        return row_index
+    
+    @timed(MANAGER_SECONDS)
+    def _apply_updates(self, server_type, updates):
+        """写入存储并同步内存记录与资源占用，updates 为 {row_index: {字段: 值}}；不经过写入队列"""
+        (result, error), = self._commit(server_type, [partial(self._stage_updates, server_type, updates)])
+        if error is not None:
+            raise error
+        return result
     
     def _can_change_to_in_progress(self, record):
         """检查是否可以将状态改为进行中"""
-        if pd.isna(record.get('是否完成')) or record.get('是否完成') != 'Yes':
+        if not record.completed:
             return True
         
-        # 如果已经完成，检查是否是因为超时自动完成的
-        start_time_str = record.get('时间', '')
-        estimated_time_str = record.get('预计使用时间', '')
+        # 如果已经完成，检查是否是因为超时自动完成的：当前时间已经超过预计结束时间，不允许改为进行中
+        if record.end_time is not None and datetime.now() >= record.end_time:
+            return False
         
-        if start_time_str and estimated_time_str:
+        return True
+    
+    def backup_file(self, server_type):
+        """请求一次备份，由备份线程稍后对最新数据做快照"""
+        self.backups.request(server_type, lambda: (SERVER_COLUMNS[server_type], self.get_records(server_type)))
+    
+    @timed(MANAGER_SECONDS)
+    def restore_backup(self, server_type, timestamp):
+        """把记录恢复为 timestamp 时刻之前最新的备份，恢复前先为当前数据做一次快照；返回恢复的记录数"""
+        records = self.backups.restore(server_type, timestamp).to_dict('records')
+        with self._write_transaction(server_type):
+            self.backups.snapshot(server_type, SERVER_COLUMNS[server_type], list(self._records[server_type]))
+            self.storage.replace(server_type, records)
+            self._coherence.versions.bump(server_type)
+            self._load_server(server_type)
+        return len(records)
+    
+    def add_record(self, server_type, data):
+        self._add_record(server_type, self._new_record(server_type, data))
+    
+    def _new_record(self, server_type, data):
+        """由登记数据创建记录并分配记录ID"""
+        fields = dict(data)
+        if not to_text(fields.get(ID_COLUMN, '')).strip():
+            fields[ID_COLUMN] = new_record_id()
+        return Record(fields, SERVERS[server_type].resources)
+    
+    @timed(MANAGER_SECONDS)
+    def try_reserve(self, server_type, data):
+        """在该服务器的写锁内检查资源冲突并登记，检查与写入之间不会插入其他登记
+        
+        返回冲突说明列表，为空表示已登记成功
+        """
+        record = self._new_record(server_type, data)
+        errors = self._submit(server_type, partial(self._stage_reserve, server_type, record))
+        if not errors:
+            self.backup_file(server_type)
+        return errors
+    
+    @timed(MANAGER_SECONDS)
+    def _add_record(self, server_type, record):
+        self.backup_file(server_type)
+        self._submit(server_type, partial(self._stage_add, server_type, record))
+    
+    def _stage_reserve(self, server_type, record, batch):
+        """检查资源冲突，没有冲突时登记；返回冲突说明列表"""
+        errors = self._schedules[server_type].reservation_errors(
+            record, self._usage[server_type].summary(), datetime.now())
+        if not errors:
+            self._stage_add(server_type, record, batch)
+        return errors
+    
+    def _stage_add(self, server_type, record, batch):
+        """把记录加入内存与各索引并加入存储操作，调用方需处于写事务中；返回行号"""
+        ids = self._ids[server_type]
+        if record.get(ID_COLUMN) in ids:
+            record = record.with_fields({ID_COLUMN: new_record_id()})
+        batch.operations.append(('append', record.fields))
+        row_index = self._insert_record(server_type, record)
+        batch.rows.append(row_index)
+        return row_index
+    
+    @timed(MANAGER_SECONDS)
+    def import_records(self, server_type, rows, chunk_size=CHUNK_ROWS):
+        """批量导入：rows 逐行产生 {列名: 文本}，每 chunk_size 行检查一次，在一个写事务中登记并一次写入存储
+        
+        格式错误或与已有预约冲突的行不导入，记录ID已存在的行跳过；列名不正确或第一块无法读取时抛出 ValueError，不导入任何行；
+        之后的块无法读取时停止导入，结果中 'error' 为错误说明。
+        各块经写入队列依次提交，块之间其他请求的写操作照常进行。
+        返回 {'imported', 'skipped', 'rejected', 'chunks', 'errors': [{'row': 第几行, 'errors': [说明]}]}，
+        row 从1开始、不含表头，errors 最多列出 MAX_IMPORT_ERRORS 行
+        """
+        spec = SERVERS[server_type]
+        result = {'imported': 0, 'skipped': 0, 'rejected': 0, 'chunks': 0, 'errors': []}
+        
+        def reject(row, messages):
+            result['rejected'] += 1
+            if len(result['errors']) < MAX_IMPORT_ERRORS:
+                result['errors'].append({'row': row, 'errors': messages})
+        
+        offset = 0
+        chunk_iter = chunks(rows, chunk_size)
+        while True:
             try:
-                start_time = datetime.strptime(str(start_time_str), '%Y-%m-%d %H:%M:%S')
-                estimated_hours = self._parse_time_duration(estimated_time_str)
-                end_time = start_time + timedelta(hours=estimated_hours)
-                current_time = datetime.now()
-                
-                # 如果当前时间已经超过预计结束时间，不允许改为进行中
-                if current_time >= end_time:
-                    return False
-            except (ValueError, TypeError):
-                pass
+                chunk = next(chunk_iter, None)
+            except ValueError as e:
+                # 文件后半部分格式错误：已导入的块保留，返回已处理的结果和错误
+                if not offset:
+                    raise
+                result['error'] = f'读取第 {offset} 行之后的内容时出错，之后的行没有导入: {e}'
+                break
+            if chunk is None:
+                break
+            if offset == 0:
+                check_columns(spec, chunk[0])
+            valid, hours, errors = validate_chunk(spec, chunk)
+            missing = (valid[ID_COLUMN] == '').to_numpy()
+            if missing.any():
+                valid.loc[missing, ID_COLUMN] = [new_record_id() for _ in range(int(missing.sum()))]
+            numbers = [offset + position + 1 for position in valid.index]
+            records = records_from_frame(valid, spec.resources, hours)
+            outcomes = self._submit(server_type, partial(self._stage_import, server_type, records)) if records else []
+            
+            messages = {offset + position + 1: errors[position] for position in errors}
+            for number, outcome in zip(numbers, outcomes):
+                if outcome == 'skipped':
+                    result['skipped'] += 1
+                elif outcome:
+                    messages[number] = outcome
+                else:
+                    result['imported'] += 1
+            for number in sorted(messages):
+                reject(number, messages[number])
+            offset += len(chunk)
+            result['chunks'] += 1
         
-        return True
+        for key in ('imported', 'skipped', 'rejected'):
+            if result[key]:
+                BULK_ROWS.inc(result[key], server=server_type, result=key)
+        if result['imported']:
+            self.backup_file(server_type)
+        print(f"批量导入 {server_type}: 导入 {result['imported']} 条，跳过 {result['skipped']} 条，"
+              f"拒绝 {result['rejected']} 条")
+        return result
     
-    def _check_remote_desktop_conflict(self, server_type, exclude_index=None):
-        """检查远程桌面是否已被占用"""
-        if server_type == '9755':
-            records = self.get_records_9755()
-        else:
-            records = self.get_records_5520()
+    def _stage_import(self, server_type, records, batch):
+        """依次登记一块导入的记录，返回每条的结果：None 为已登记，'skipped' 为记录ID已存在，列表为资源冲突说明
         
-        for idx, record in enumerate(records):
-            if exclude_index is not None and idx == exclude_index:
+        已完成的记录不占用资源，不检查冲突；未完成的记录与登记时一样检查，后面的记录能看到前面登记的占用
+        """
+        ids = self._ids[server_type]
+        schedule = self._schedules[server_type]
+        now = datetime.now()
+        outcomes = []
+        for record in records:
+            if record[ID_COLUMN] in ids:
+                outcomes.append('skipped')
                 continue
+            if not record.completed:
+                errors = schedule.reservation_errors(record, self._usage[server_type].summary(), now)
+                if errors:
+                    outcomes.append(errors)
+                    continue
+            self._stage_add(server_type, record, batch)
+            outcomes.append(None)
+        return outcomes
+    
+    def iter_records(self, server_type):
+        """返回 (版本号, 记录的迭代器)，用于流式导出：先是已归档的记录，再是存储中的记录
+        
+        存储中的记录取当时的列表快照，之后的写入不影响本次导出；归档在导出过程中按月份读取，
+        期间新归档的记录已在快照中，按记录ID跳过
+        """
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            version = self._versions[server_type]
+            records = list(self._records[server_type])
+            months = self.archive.months(server_type)
+        ids = {record.get(ID_COLUMN) for record in records}
+        archived = (record for record in self._iter_archived(server_type, months) if record.get(ID_COLUMN) not in ids)
+        return version, itertools.chain(archived, records)
+    
+    @timed(MANAGER_SECONDS)
+    def get_records(self, server_type):
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            return list(self._records[server_type])
+    
+    @timed(MANAGER_SECONDS)
+    def query_records(self, server_type, page=1, size=RECORDS_PAGE_SIZE, status=None, name=None,
+                      start_from=None, start_to=None, after=None):
+        """按条件分页查询记录，最新登记的在前
+        
+        status 为 'done' 或 'pending'；start_from/start_to 为 date，按登记日期过滤（含两端），
+        此时还查询与日期范围重叠的归档月份，已归档的记录排在存储中的记录之后，行号为 None；
+        after 为分页游标：上一页最后一条记录的ID（已归档的记录加前缀 ARCHIVE_CURSOR），只返回排在它之后的记录，
+        滚动加载时后续页不会因新登记、归档而重复或遗漏；游标已失效时抛出 ValueError。
+        返回 {'version', 'total'（游标之后的记录数）, 'next'（下一页的游标，没有更多时为 None）, 'rows': [(row_index, 记录)]}
+        """
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            records = self._records[server_type]
+            limit = len(records)
+            archived_after = None
+            if after is not None and after.startswith(ARCHIVE_CURSOR):
+                # 上一页已翻到归档部分，存储中的记录已经翻完
+                limit, archived_after = 0, after[len(ARCHIVE_CURSOR):]
+            elif after is not None:
+                limit = self._cursor_limit(server_type, after)
+                if limit is None:
+                    raise ValueError('分页游标已失效，请刷新页面')
+            active = self._active[server_type]
+            low = start_from.toordinal() if start_from else None
+            high = start_to.toordinal() if start_to else None
             
-            if (pd.isna(record.get('是否完成')) or record.get('是否完成') != 'Yes') and \
-               record.get('是否使用远程桌面') == 'Yes':
-                return True
-        
-        return False
-
-    def backup_file(self, filename):
-        if os.path.exists(filename):
-            # 异步备份以提高性能
-            def async_backup():
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_name = f"{self.backup_dir}/{filename.split('.')[0]}_{timestamp}.xlsx"
-                shutil.copy2(filename, backup_name)
+            # 先用选择性最好的索引取出候选行，再逐行检查其余条件
+            if name:
+                candidates = [idx for idx in reversed(self._name_index[server_type].get(name, [])) if idx < limit]
+            elif low is not None or high is not None:
+                index = self._start_index[server_type]
+                lo = 0 if low is None else bisect.bisect_left(index, (low, -1))
+                hi = len(index) if high is None else bisect.bisect_left(index, (high + 1, -1))
+                candidates = sorted((idx for _, idx in index[lo:hi] if idx < limit), reverse=True)
+            elif status == 'pending':
+                candidates = sorted((idx for idx in active if idx < limit), reverse=True)
+            else:
+                candidates = range(limit - 1, -1, -1)
             
-            backup_thread = threading.Thread(target=async_backup)
-            backup_thread.daemon = True
-            backup_thread.start()
-    
-    def add_record_9755(self, data):
-        self.backup_file(self.excel_9755)
-        df = pd.read_excel(self.excel_9755)
-        new_row = pd.DataFrame([data])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_excel(self.excel_9755, index=False)
-        # 清除相关缓存
-        self._clear_cache('9755')
-        # 立即清除资源缓存以强制刷新
-        self._clear_cache('remaining_resources')
-    
-    def add_record_5520(self, data):
-        self.backup_file(self.excel_5520)
-        df = pd.read_excel(self.excel_5520)
-        new_row = pd.DataFrame([data])
-        df = pd.concat([df, new_row], ignore_index=True)
-        df.to_excel(self.excel_5520, index=False)
-        # 清除相关缓存
-        self._clear_cache('5520')
-        # 立即清除资源缓存以强制刷新
-        self._clear_cache('remaining_resources')
-    
-    def get_records_9755(self):
-        cache_key = 'records_9755'
-        
-        # 检查缓存
-        if self._is_cache_valid(cache_key):
-            current_modified = self._get_file_modified_time(self.excel_9755)
-            if cache_key in self._last_modified and self._last_modified[cache_key] == current_modified:
-                cached_data = self._get_cached_data(cache_key)
-                if cached_data is not None:
-                    return cached_data
-        
-        # 读取文件并缓存
-        if os.path.exists(self.excel_9755):
-            df = pd.read_excel(self.excel_9755)
-            records = df.to_dict('records')
+            checks = []
+            if status == 'pending':
+                checks.append(lambda idx: idx in active)
+            elif status == 'done':
+                checks.append(lambda idx: idx not in active)
+            if low is not None or high is not None:
+                checks.append(lambda idx: records[idx].start_day is not None
+                              and (low is None or records[idx].start_day >= low)
+                              and (high is None or records[idx].start_day <= high))
+            if checks:
+                candidates = [idx for idx in candidates if all(check(idx) for check in checks)]
+            rows = [(idx, records[idx]) for idx in candidates]
             
-            self._set_cache(cache_key, records)
-            self._last_modified[cache_key] = self._get_file_modified_time(self.excel_9755)
-            return records
-        return []
-    
-    def get_records_5520(self):
-        cache_key = 'records_5520'
-        
-        # 检查缓存
-        if self._is_cache_valid(cache_key):
-            current_modified = self._get_file_modified_time(self.excel_5520)
-            if cache_key in self._last_modified and self._last_modified[cache_key] == current_modified:
-                cached_data = self._get_cached_data(cache_key)
-                if cached_data is not None:
-                    return cached_data
-        
-        # 读取文件并缓存
-        if os.path.exists(self.excel_5520):
-            df = pd.read_excel(self.excel_5520)
-            records = df.to_dict('records')
+            # 归档中只有已完成的记录
+            if (low is not None or high is not None) and status != 'pending':
+                ids = self._ids[server_type]
+                for month in reversed(self.archive.months(server_type, start_from, start_to)):
+                    rows.extend((None, record) for record in reversed(self._archived_month(server_type, month))
+                                if (low is None or record.start_day >= low) and (high is None or record.start_day <= high)
+                                and (not name or record.name == name) and record.get(ID_COLUMN) not in ids)
+            if archived_after is not None:
+                position = next((i for i, (_, record) in enumerate(rows) if record.get(ID_COLUMN) == archived_after), None)
+                if position is None:
+                    raise ValueError('分页游标已失效，请刷新页面')
+                rows = rows[position + 1:]
             
-            self._set_cache(cache_key, records)
-            self._last_modified[cache_key] = self._get_file_modified_time(self.excel_5520)
-            return records
-        return []
-    
-    def update_completion_status_9755(self, row_index, status):
-        if os.path.exists(self.excel_9755):
-            df = pd.read_excel(self.excel_9755)
-            if 0 <= row_index < len(df):
-                record = df.iloc[row_index].to_dict()
-                
-                # 如果要从已完成改为进行中，检查是否允许（超时后禁止）
-                if status == 'No' and record.get('是否完成') == 'Yes' and not self._can_change_to_in_progress(record):
-                    return False
-                
-                self.backup_file(self.excel_9755)
-                df.at[row_index, '是否完成'] = status
-                
-                # 如果用户手动设置为已完成，自动计算实际使用时间
-                if status == 'Yes':
-                    start_time_str = record.get('时间', '')
-                    if start_time_str:
-                        try:
-                            start_time = datetime.strptime(str(start_time_str), '%Y-%m-%d %H:%M:%S')
-                            current_time = datetime.now()
-                            duration = current_time - start_time
-                            
-                            # 计算实际使用时间（小时）
-                            hours = duration.total_seconds() / 3600
-                            if hours < 1:
-                                actual_time = f"{int(duration.total_seconds() / 60)}分钟"
-                            elif hours < 24:
-                                actual_time = f"{hours:.1f}小时"
-                            else:
-                                days = int(hours / 24)
-                                remaining_hours = hours % 24
-                                if remaining_hours > 0:
-                                    actual_time = f"{days}天{remaining_hours:.1f}小时"
-                                else:
-                                    actual_time = f"{days}天"
-                            
-                            df.at[row_index, '实际使用时间'] = actual_time
-                        except (ValueError, TypeError):
-                            pass
-                
-                df.to_excel(self.excel_9755, index=False)
-                # 清除相关缓存
-                self._clear_cache('9755')
-                # 立即清除资源缓存以强制刷新
-                self._clear_cache('remaining_resources')
-                return True
-        return False
-    
-    def update_completion_status_5520(self, row_index, status):
-        if os.path.exists(self.excel_5520):
-            df = pd.read_excel(self.excel_5520)
-            if 0 <= row_index < len(df):
-                record = df.iloc[row_index].to_dict()
-                
-                # 如果要从已完成改为进行中，检查是否允许（超时后禁止）
-                if status == 'No' and record.get('是否完成') == 'Yes' and not self._can_change_to_in_progress(record):
-                    return False
-                
-                self.backup_file(self.excel_5520)
-                df.at[row_index, '是否完成'] = status
-                
-                # 如果用户手动设置为已完成，自动计算实际使用时间
-                if status == 'Yes':
-                    start_time_str = record.get('时间', '')
-                    if start_time_str:
-                        try:
-                            start_time = datetime.strptime(str(start_time_str), '%Y-%m-%d %H:%M:%S')
-                            current_time = datetime.now()
-                            duration = current_time - start_time
-                            
-                            # 计算实际使用时间（小时）
-                            hours = duration.total_seconds() / 3600
-                            if hours < 1:
-                                actual_time = f"{int(duration.total_seconds() / 60)}分钟"
-                            elif hours < 24:
-                                actual_time = f"{hours:.1f}小时"
-                            else:
-                                days = int(hours / 24)
-                                remaining_hours = hours % 24
-                                if remaining_hours > 0:
-                                    actual_time = f"{days}天{remaining_hours:.1f}小时"
-                                else:
-                                    actual_time = f"{days}天"
-                            
-                            df.at[row_index, '实际使用时间'] = actual_time
-                        except (ValueError, TypeError):
-                            pass
-                
-                df.to_excel(self.excel_5520, index=False)
-                # 清除相关缓存
-                self._clear_cache('5520')
-                # 立即清除资源缓存以强制刷新
-                self._clear_cache('remaining_resources')
-                return True
-        return False
+            offset = (page - 1) * size
+            page_rows = rows[offset:offset + size]
+            next_cursor = None
+            if page_rows and offset + size < len(rows):
+                row_index, record = page_rows[-1]
+                next_cursor = ('' if row_index is not None else ARCHIVE_CURSOR) + record.get(ID_COLUMN)
+            return {
+                'version': self._versions[server_type],
+                'total': len(rows),
+                'next': next_cursor,
+                'rows': page_rows
+            }
     
-    def calculate_remaining_resources(self):
-        cache_key = 'remaining_resources'
-        
-        # 检查缓存
-        if self._is_cache_valid(cache_key):
-            cached_data = self._get_cached_data(cache_key)
-            if cached_data is not None:
-                return cached_data
-        
-        # 计算资源使用情况
-        records_9755 = self.get_records_9755()
-        records_5520 = self.get_records_5520()
-        
-        # 9755服务器资源：4个节点(0,1,2,3)，2张GPU(0,1)
-        all_nodes_9755 = {0, 1, 2, 3}
-        all_gpus_9755 = {0, 1}
-        used_nodes_9755 = set()
-        used_gpus_9755 = set()
-        remote_desktop_9755_count = 0
-        
-        # 5520+服务器资源：56个核，1张GPU
-        cores_5520_total = 56
-        gpu_5520_total = 1
-        cores_5520_used = 0
-        gpu_5520_used = 0
-        remote_desktop_5520_count = 0
-        
-        # 计算9755使用情况（只计算未完成的任务）
-        for record in records_9755:
-            if pd.isna(record.get('是否完成')) or record.get('是否完成') != 'Yes':
-                # 优化节点解析
-                nodes = record.get('占用节点', '')
-                if nodes and str(nodes) not in ('', 'nan'):
-                    node_str = str(nodes).strip()
-                    try:
-                        if ',' in node_str:
-                            # 多个节点，如 "0,1,2"
-                            for node in node_str.split(','):
-                                node_num = int(node.strip())
-                                if 0 <= node_num <= 3:
-                                    used_nodes_9755.add(node_num)
-                        else:
-                            # 单个节点
-                            node_num = int(node_str)
-                            if 0 <= node_num <= 3:
-                                used_nodes_9755.add(node_num)
-                    except (ValueError, AttributeError):
-                        continue
-                
-                # 优化GPU解析
-                gpu_usage = record.get('占用GPU', '')
-                if gpu_usage and str(gpu_usage) not in ('', 'nan', 'No'):
-                    gpu_str = str(gpu_usage).strip()
-                    try:
-                        if ',' in gpu_str:
-                            # 多个GPU，如 "0,1"
-                            for gpu in gpu_str.split(','):
-                                gpu_num = int(gpu.strip())
-                                if 0 <= gpu_num <= 1:
-                                    used_gpus_9755.add(gpu_num)
-                        elif gpu_str.isdigit():
-                            # 单个GPU
-                            gpu_num = int(gpu_str)
-                            if 0 <= gpu_num <= 1:
-                                used_gpus_9755.add(gpu_num)
-                        elif gpu_str == 'Yes':
-                            # 处理旧数据中的 "Yes" 值
-                            if 0 not in used_gpus_9755:
-                                used_gpus_9755.add(0)
-                            elif 1 not in used_gpus_9755:
-                                used_gpus_9755.add(1)
-                    except (ValueError, AttributeError):
-                        continue
+    @timed(MANAGER_SECONDS)
+    def bookings(self, server_type, begin=None, end=None):
+        """与 [begin, end) 重叠的未完成记录 [(预约开始, 预约结束, row_index, 记录)]，按预约开始时间排列"""
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            records = self._records[server_type]
+            return [(start, stop, idx, records[idx])
+                    for start, stop, idx in self._schedules[server_type].overlapping(begin, end)]
+    
+    @timed(MANAGER_SECONDS)
+    def next_free_slot(self, server_type, needs, hours, after=None):
+        """after（默认现在）之后最早能连续 hours 小时满足 needs 的时间段，见 ServerSchedule.next_free_slot"""
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            return self._schedules[server_type].next_free_slot(
+                needs, hours, after, self._summaries[server_type], datetime.now())
+    
+    @timed(MANAGER_SECONDS)
+    def utilization(self, server_type, begin, end, bucket):
+        """各时间桶的资源利用率，以及按姓名、任务类型分组的使用量，见 ServerAnalytics.utilization"""
+        self._sync(server_type)
+        with self._locks[server_type].read():
+            return self._analytics[server_type].utilization(begin, end, bucket, datetime.now())
+    
+    def _status_fields(self, record, status):
+        """修改完成状态时写入的字段；超时自动完成的记录不能改回进行中，返回 None"""
+        # 如果要从已完成改为进行中，检查是否允许（超时后禁止）
+        if status != 'Yes' and record.completed and not self._can_change_to_in_progress(record):
+            return None
+        
+        fields = {'是否完成': status}
+        
+        # 如果用户手动设置为已完成，自动计算实际使用时间
+        if status == 'Yes':
+            if record.start_time is not None:
+                duration = datetime.now() - record.start_time
                 
-                if record.get('是否使用远程桌面') == 'Yes':
-                    remote_desktop_9755_count += 1
-        
-        # 计算5520+使用情况（只计算未完成的任务）
-        for record in records_5520:
-            if pd.isna(record.get('是否完成')) or record.get('是否完成') != 'Yes':
-                # 优化核数计算
-                cores = record.get('使用核数', '')
-                if cores and str(cores) not in ('', 'nan'):
-                    cores_str = str(cores).strip().lower()
-                    if cores_str == 'all':
-                        cores_5520_used = cores_5520_total
+                # 计算实际使用时间（小时）
+                hours = duration.total_seconds() / 3600
+                if hours < 1:
+                    actual_time = f"{int(duration.total_seconds() / 60)}分钟"
+                elif hours < 24:
+                    actual_time = f"{hours:.1f}小时"
+                else:
+                    days = int(hours / 24)
+                    remaining_hours = hours % 24
+                    if remaining_hours > 0:
+                        actual_time = f"{days}天{remaining_hours:.1f}小时"
                     else:
-                        try:
-                            cores_5520_used += int(cores)
-                        except (ValueError, TypeError):
-                            continue
-                
-                if record.get('占用GPU') == 'Yes':
-                    gpu_5520_used += 1
+                        actual_time = f"{days}天"
                 
-                if record.get('是否使用远程桌面') == 'Yes':
-                    remote_desktop_5520_count += 1
-        
-        # 计算9755剩余资源
-        remaining_nodes_9755 = all_nodes_9755 - used_nodes_9755
-        remaining_gpus_9755 = all_gpus_9755 - used_gpus_9755
-        
-        result = {
-            '9755': {
-                'nodes_remaining': len(remaining_nodes_9755),
-                'nodes_total': len(all_nodes_9755),
-                'nodes_used': len(used_nodes_9755),
-                'nodes_available': sorted(list(remaining_nodes_9755)),
-                'nodes_occupied': sorted(list(used_nodes_9755)),
-                'gpu_remaining': len(remaining_gpus_9755),
-                'gpu_total': len(all_gpus_9755),
-                'gpu_used': len(used_gpus_9755),
-                'gpu_available': sorted(list(remaining_gpus_9755)),
-                'gpu_occupied': sorted(list(used_gpus_9755)),
-                'remote_desktop_used': remote_desktop_9755_count
-            },
-            '5520': {
-                'cores_remaining': max(0, cores_5520_total - cores_5520_used),
-                'cores_total': cores_5520_total,
-                'cores_used': cores_5520_used,
-                'gpu_remaining': max(0, gpu_5520_total - gpu_5520_used),
-                'gpu_total': gpu_5520_total,
-                'gpu_used': gpu_5520_used,
-                'remote_desktop_used': remote_desktop_5520_count
-            }
-        }
+                fields['实际使用时间'] = actual_time
+        return fields
+    
+    @timed(MANAGER_SECONDS)
+    def update_record(self, server_type, record_id, revision, status=None, actual_time=None, by_row=False):
+        """按记录ID修改完成状态和/或实际使用时间（乐观并发）
         
-        # 缓存结果
-        self._set_cache(cache_key, result)
-        return result
+        revision 为客户端读取记录时的 Record.revision，在写锁内与当前记录比较，不一致说明记录已被修改，不做修改；
+        为 None 时不比较（兼容旧接口）。by_row 为 True 时（兼容旧接口），不是已有记录ID的数字按存储中的行号定位。
+        返回 (是否已修改, 行号, 当前记录)；记录不存在时抛出 KeyError，超时后改为进行中时抛出 ValueError
+        """
+        self.backup_file(server_type)
+        return self._submit(server_type, partial(self._stage_record_update, server_type, record_id, revision,
+                                                 status, actual_time, by_row))
+    
+    def _stage_record_update(self, server_type, record_id, revision, status, actual_time, by_row, batch):
+        records = self._records[server_type]
+        row_index = self._ids[server_type].get(record_id)
+        if row_index is None and by_row and record_id.isdigit() and int(record_id) < len(records):
+            row_index = int(record_id)
+        if row_index is None:
+            raise KeyError(record_id)
+        record = records[row_index]
+        if revision is not None and record.revision != revision:
+            return False, row_index, record
+        fields = {}
+        if status is not None:
+            fields = self._status_fields(record, status)
+            if fields is None:
+                raise ValueError('任务已超时自动完成，不能改为进行中')
+        if actual_time is not None:
+            fields['实际使用时间'] = actual_time
+        if fields:
+            self._stage_updates(server_type, {row_index: fields}, batch)
+        return True, row_index, records[row_index]
+    
+    @timed(MANAGER_SECONDS)
+    def calculate_remaining_resources(self):
+        """返回各服务器最近一次发布的资源占用快照，不加锁；快照只读，写入时整体替换"""
+        for server_type in SERVER_COLUMNS:
+            self._sync(server_type)
+        return dict(self._summaries)
     
-    def update_actual_time_9755(self, row_index, actual_time):
-        """更新9755服务器的实际使用时间"""
-        if os.path.exists(self.excel_9755):
-            self.backup_file(self.excel_9755)
-            df = pd.read_excel(self.excel_9755)
-            if 0 <= row_index < len(df):
-                df.at[row_index, '实际使用时间'] = actual_time
-                df.to_excel(self.excel_9755, index=False)
-                # 清除相关缓存
-                self._clear_cache('9755')
-                return True
-        return False
-    
-    def update_actual_time_5520(self, row_index, actual_time):
-        """更新5520服务器的实际使用时间"""
-        if os.path.exists(self.excel_5520):
-            self.backup_file(self.excel_5520)
-            df = pd.read_excel(self.excel_5520)
-            if 0 <= row_index < len(df):
-                df.at[row_index, '实际使用时间'] = actual_time
-                df.to_excel(self.excel_5520, index=False)
-                # 清除相关缓存
-                self._clear_cache('5520')
-                return True
-        return False
+    @timed(MANAGER_SECONDS)
+    def export_excel(self, server_type):
+        """把内存中的记录导出为 .xlsx，返回 (版本号, 文件内容)；数据未变化时直接返回缓存"""
+        version = self.data_version(server_type)
+        content = self._cache.get(('export', server_type), version)
+        if content is not None:
+            CACHE_REQUESTS.inc(cache='export_excel', key=server_type, result='hit')
+            return version, content
+        CACHE_REQUESTS.inc(cache='export_excel', key=server_type, result='miss')
+        version, records = self.iter_records(server_type)
+        buffer = io.BytesIO()
+        pd.DataFrame([record.fields for record in records], columns=SERVER_COLUMNS[server_type]).to_excel(buffer, index=False)
+        content = buffer.getvalue()
+        self._cache.put(('export', server_type), content, len(content), version=version, deps=[('records', server_type)])
+        return version, content
     
     def _start_periodic_check(self):
-        """启动定时检查任务"""
+        """启动定时检查任务，在最近的预计结束时间醒来；多进程时只有主进程执行检查"""
         def periodic_check():
             while True:
                 try:
-                    self._periodic_status_check()
+                    if self._coherence.is_leader():
+                        self._periodic_status_check()
+                        self._periodic_archive()
                 except Exception as e:
                     print(f"定时检查任务出错: {str(e)}")
-                time.sleep(300)  # 5分钟 = 300秒
+                with self._expiry_cond:
+                    self._expiry_cond.wait(self._next_check_delay())
         
         check_thread = threading.Thread(target=periodic_check)
         check_thread.daemon = True
         check_thread.start()
     
+    def _next_check_delay(self):
+        """距最近一个预计结束时间或预约开始时间的秒数，调用方需持有 self._expiry_cond
+        
+        到期堆只在检查线程中弹出，其他线程只会压入更早的条目并随后通知 self._expiry_cond，
+        所以这里不加服务器锁读取堆顶也不会错过唤醒。其他进程登记的任务不在本进程的堆中，
+        有其他进程共用存储时主进程至少每 coherence_poll_interval 秒醒来一次，在写事务中重新加载后检查；
+        只有一个进程时睡到最近的期限为止（最长 max_check_interval 秒）。
+        之后启动的进程最迟在 max_check_interval 秒后被发现
+        """
+        if not self._coherence.is_leader():
+            return self.leader_retry_interval
+        limit = self.max_check_interval
+        if self._coherence.other_processes():
+            limit = min(limit, self.coherence_poll_interval)
+        heaps = list(self._expiry_heaps.values()) + list(self._start_heaps.values())
+        deadlines = [heap[0][0] for heap in heaps if heap]
+        if not deadlines:
+            return limit
+        delay = (min(deadlines) - datetime.now()).total_seconds()
+        return min(max(delay, 0), limit)
+    
     def _periodic_status_check(self):
-        """每5分钟执行的状态检查"""
+        """处理所有已到预约开始时间或预计结束时间的任务"""
         current_time = datetime.now()
-        
-        # 检查9755服务器
-        self._check_and_update_records(self.excel_9755, '9755', current_time)
-        
-        # 检查5520服务器
-        self._check_and_update_records(self.excel_5520, '5520', current_time)
+        with CHECK_SECONDS.time():
+            for server_type in SERVERS:
+                self._check_and_update_records(server_type, current_time)
     
-    def _check_and_update_records(self, excel_file, server_type, current_time):
-        """检查并更新记录状态"""
-        if not os.path.exists(excel_file):
+    def _periodic_archive(self):
+        """启动后第一次检查时归档一次，之后每 ARCHIVE_INTERVAL 秒一次"""
+        if not ARCHIVE_AFTER_DAYS or not ARCHIVE_INTERVAL:
             return
-        
-        df = pd.read_excel(excel_file)
-        if df.empty:
+        now = time.monotonic()
+        if self._last_archive is not None and now - self._last_archive < ARCHIVE_INTERVAL:
             return
-        
-        updated = False
-        
-        for idx, row in df.iterrows():
-            start_time_str = row.get('时间', '')
-            estimated_time_str = row.get('预计使用时间', '')
-            completion_status = row.get('是否完成', '')
+        self._last_archive = now
+        for server_type in SERVERS:
+            self.archive_completed(server_type)
+    
+    @timed(MANAGER_SECONDS)
+    def _check_and_update_records(self, server_type, current_time):
+        """预约开始的任务计入当前占用；从到期堆中取出已超时的未完成任务，自动标记为已完成"""
+        updates = {}
+        with self._write_transaction(server_type):
+            heap = self._expiry_heaps[server_type]
+            active = self._active[server_type]
+            records = self._records[server_type]
             
-            if not start_time_str or not estimated_time_str:
-                continue
+            started = self._start_due(server_type, current_time)
+            if started:
+                # 版本号加一，其他进程同步时同样计入
+                self._notify_change(server_type, started)
+                CHECK_ROWS.inc(len(started), server=server_type, action='started')
             
-            try:
-                start_time = datetime.strptime(str(start_time_str), '%Y-%m-%d %H:%M:%S')
-                estimated_hours = self._parse_time_duration(estimated_time_str)
-                end_time = start_time + timedelta(hours=estimated_hours)
+            while heap and heap[0][0] <= current_time:
+                end_time, idx = heapq.heappop(heap)
+                # 记录已完成或结束时间已改变时，堆中的条目已过期
+                if active.get(idx) != end_time:
+                    continue
                 
-                # 首先检查是否超时
-                if current_time >= end_time and (pd.isna(completion_status) or completion_status != 'Yes'):
-                    # 任务超时，自动标记为已完成
-                    df.at[idx, '是否完成'] = 'Yes'
-                    # 设置实际使用时间为预计使用时间
-                    if pd.isna(df.at[idx, '实际使用时间']) or df.at[idx, '实际使用时间'] == '':
-                        df.at[idx, '实际使用时间'] = estimated_time_str
-                    updated = True
-                    
-                # 如果没有超时但状态为已完成，更新实际使用时间为当前时间
-                elif current_time < end_time and completion_status == 'Yes':
-                    duration = current_time - start_time
-                    hours = duration.total_seconds() / 3600
-                    
-                    if hours < 1:
-                        actual_time = f"{max(1, int(duration.total_seconds() / 60))}分钟"
-                    elif hours < 24:
-                        actual_time = f"{hours:.1f}小时"
-                    else:
-                        days = int(hours / 24)
-                        remaining_hours = hours % 24
-                        if remaining_hours > 0:
-                            actual_time = f"{days}天{remaining_hours:.1f}小时"
-                        else:
-                            actual_time = f"{days}天"
-                    
-                    df.at[idx, '实际使用时间'] = actual_time
-                    updated = True
-                    
-            except (ValueError, TypeError):
-                continue
-        
-        # 如果有更新，保存文件并清除缓存
-        if updated:
-            self.backup_file(excel_file)
-            df.to_excel(excel_file, index=False)
-            self._clear_cache(server_type)
-            self._clear_cache('remaining_resources')
+                record = records[idx]
+                # 任务超时，自动标记为已完成
+                fields = {'是否完成': 'Yes'}
+                # 设置实际使用时间为预计使用时间
+                if pd.isna(record.get('实际使用时间')) or record.get('实际使用时间') == '':
+                    fields['实际使用时间'] = record.get('预计使用时间', '')
+                updates[idx] = fields
+            
+            # 如果有更新，保存并同步资源占用
+            if updates:
+                self.backup_file(server_type)
+                self._apply_updates(server_type, updates)
+                CHECK_ROWS.inc(len(updates), server=server_type, action='completed')
 
-server_manager = ServerManager()
+server_manager = None
+_server_manager_lock = threading.Lock()
+render_cache = LRUCache('render', RENDER_CACHE_MAX_BYTES)
+
+def create_app():
+    """创建 ServerManager 并返回 WSGI 应用，供 gunicorn 等 WSGI 服务器使用（见 wsgi.py）
+    
+    每个 worker 进程各自调用一次；进程之间通过 coherence 模块同步数据，超时检查只在一个进程中运行
+    """
+    global server_manager
+    with _server_manager_lock:
+        if server_manager is None:
+            server_manager = ServerManager()
+    return app
+
+@app.before_request
+def _ensure_server_manager():
+    # 直接以 app:app 方式部署时，在第一个请求时初始化
+    if server_manager is None:
+        create_app()
+
+@app.before_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    if PROFILE_REQUESTS and request.args.get('profile') == '1':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他线程的请求正在分析（Python 3.12 起同一时间只能有一个分析器）
+            return
+        g.profiler = profiler
+
+@app.after_request
+def _finish_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}-{request.endpoint}.prof")
+        profiler.dump_stats(path)
+        response.headers['X-Profile'] = path
+    start = g.pop('request_start', None)
+    if start is not None:
+        # 按路由模板统计（/api/records/<server_type>），不按实际路径，避免标签无限增长
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, route=route, method=request.method,
+                                status=response.status_code)
+    return response
+
+def _record_counts():
+    if server_manager is None:
+        return
+    for server_type in SERVERS:
+        yield {'server': server_type, 'state': 'total'}, len(server_manager._records.get(server_type, ()))
+        yield {'server': server_type, 'state': 'active'}, len(server_manager._active.get(server_type, ()))
+
+def _backup_queue_depth():
+    if server_manager is not None:
+        yield {}, server_manager.backups.queue_depth()
+
+Gauge('records', '内存中的记录数，active 为未完成的记录', ['server', 'state'], callback=_record_counts)
+Gauge('backup_queue_depth', '等待执行的备份请求数', callback=_backup_queue_depth)
+
+def _not_modified(etag):
+    """客户端缓存的 ETag（包括压缩后响应的 ETag）仍然有效时返回 304，否则返回 None"""
+    key = etag.split('-', 1)[0]
+    for candidate in [etag] + [f'{etag}-{encoding}' for encoding in ENCODINGS]:
+        if candidate in request.if_none_match:
+            CACHE_REQUESTS.inc(cache='etag', key=key, result='hit')
+            response = Response(status=304)
+            response.set_etag(candidate)
+            response.vary.add('Accept-Encoding')
+            return response
+    CACHE_REQUESTS.inc(cache='etag', key=key, result='miss')
+    return None
+
+def _with_etag(response, etag):
+    response = app.make_response(response)
+    response.set_etag(etag)
+    # 允许缓存，但每次使用前都要向服务器验证 ETag
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _cached_response(key, etag, render):
+    """按 ETag 缓存渲染结果的响应
+    
+    render() 返回 (响应体文本, mimetype)，出错时返回 (响应, 状态码)（不缓存）。etag 同时作为缓存的版本号，
+    数据或查询参数变化后旧的结果自然失效；响应体按 Accept-Encoding 压缩，压缩结果随原文一起缓存。
+    """
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    entry = render_cache.get(key, etag)
+    CACHE_REQUESTS.inc(cache='render', key=key[0], result='miss' if entry is None else 'hit')
+    if entry is None:
+        result = render()
+        if not isinstance(result[0], str):
+            return result
+        body, mimetype = result
+        entry = CachedBody(body.encode('utf-8'), mimetype)
+        render_cache.put(key, entry, entry.size, version=etag)
+    encoding = choose_encoding(request.accept_encodings, len(entry.body))
+    if encoding is not None and not entry.has(encoding):
+        entry.encoded(encoding)
+        # 更新缓存占用的字节数
+        render_cache.put(key, entry, entry.size, version=etag)
+    response = Response(entry.encoded(encoding), mimetype=entry.mimetype)
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+        etag = f'{etag}-{encoding}'
+    return _with_etag(response, etag)
+
+def _json_body(payload):
+    return app.json.dumps(payload) + '\n', 'application/json'
+
+def _rows_html(server_type, rows):
+    """记录表格行：每行的片段按 Record.revision 缓存，内容不变的行不再渲染；行号为 None 的是已归档的记录，只读"""
+    spec = SERVERS[server_type]
+    record_row = None
+    parts = []
+    misses = 0
+    for row_index, record in rows:
+        archived = row_index is None
+        key = ('row', server_type, record.revision, archived)
+        html = render_cache.get(key)
+        if html is None:
+            if record_row is None:
+                record_row = get_template_attribute('_record_rows.html', 'record_row')
+            html = record_row(record, spec, archived)
+            render_cache.put(key, html, sys.getsizeof(html))
+            misses += 1
+        parts.append(html)
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache='render', key='row', result='miss')
+    if len(parts) > misses:
+        CACHE_REQUESTS.inc(len(parts) - misses, cache='render', key='row', result='hit')
+    return Markup(''.join(parts))
+
+def _resources_html(server_type):
+    """资源使用情况面板，按服务器的数据版本缓存"""
+    # 先取版本号再计算：缓存的内容不会比版本号旧
+    version = server_manager.data_version(server_type)
+    key = ('resources', server_type)
+    html = render_cache.get(key, version)
+    if html is None:
+        summary = server_manager.calculate_remaining_resources()[server_type]
+        html = get_template_attribute('_resources.html', 'resource_usage')(SERVERS[server_type], summary)
+        render_cache.put(key, html, sys.getsizeof(html), version=version)
+    return html
+
+@app.context_processor
+def _inject_servers():
+    # 导航栏、资源概览和页面脚本都按服务器清单生成
+    return {'servers': SERVERS, 'servers_config': {server_type: spec.client_config() for server_type, spec in SERVERS.items()}}
+
+def _resources_etag(prefix):
+    return '-'.join([prefix] + [str(server_manager.data_version(server_type)) for server_type in SERVERS])
 
 @app.route('/')
 def index():
-    resources = server_manager.calculate_remaining_resources()
-    return render_template('index.html', resources=resources)
+    def render():
+        resources_html = {server_type: _resources_html(server_type) for server_type in SERVERS}
+        return render_template('index.html', resources_html=resources_html), 'text/html; charset=utf-8'
+    return _cached_response(('index',), _resources_etag('index'), render)
 
-@app.route('/9755')
-def server_9755():
-    records = server_manager.get_records_9755()
-    return render_template('9755.html', records=records)
+def _query_etag(prefix, server_type, version=None):
+    """ETag 同时包含数据版本号和查询参数"""
+    if version is None:
+        version = server_manager.data_version(server_type)
+    return f"{prefix}-{server_type}-{version}-{zlib.crc32(request.query_string):08x}"
 
-@app.route('/5520')
-def server_5520():
-    records = server_manager.get_records_5520()
-    return render_template('5520.html', records=records)
+def _record_filters():
+    """解析记录列表的过滤与分页参数，格式错误时抛出 ValueError"""
+    args = request.args
+    page = args.get('page', 1, type=int)
+    size = args.get('size', RECORDS_PAGE_SIZE, type=int)
+    if page < 1 or not 1 <= size <= MAX_RECORDS_PAGE_SIZE:
+        raise ValueError(f'page 必须大于0，size 必须在1到{MAX_RECORDS_PAGE_SIZE}之间')
+    status = args.get('status') or None
+    if status not in (None, 'done', 'pending'):
+        raise ValueError('status 只能是 done 或 pending')
+    filters = {'page': page, 'size': size, 'after': args.get('after') or None, 'status': status,
+               'name': args.get('name', '').strip() or None}
+    for key, param in (('start_from', 'from'), ('start_to', 'to')):
+        value = args.get(param, '').strip()
+        filters[key] = parse_start_date(value) if value else None
+        if value and filters[key] is None:
+            raise ValueError(f'{param} 日期格式错误，例如: 2025.6.6')
+    return filters
 
-@app.route('/add_9755', methods=['POST'])
-def add_9755():
-    try:
-        # 获取表单数据
-        remote = request.form['remote']
-        nodes_str = request.form['nodes']
-        gpu_str = request.form['gpu']
-        
-        # 获取当前资源状态
-        resources = server_manager.calculate_remaining_resources()
-        errors = []
-        
-        # 检查远程桌面冲突
-        if remote == 'Yes' and server_manager._check_remote_desktop_conflict('9755'):
-            errors.append('远程桌面已被占用，请等待当前任务完成')
-        
-        # 检查节点冲突
-        if nodes_str:
-            try:
-                requested_nodes = [int(n.strip()) for n in nodes_str.split(',') if n.strip().isdigit()]
-                occupied_nodes = resources['9755']['nodes_occupied']
-                conflict_nodes = [n for n in requested_nodes if n in occupied_nodes]
-                
-                if conflict_nodes:
-                    errors.append(f'节点 {",".join(map(str, conflict_nodes))} 已被占用')
-                
-                if len(requested_nodes) > resources['9755']['nodes_remaining']:
-                    errors.append(f'请求节点数 ({len(requested_nodes)}) 超过剩余节点数 ({resources["9755"]["nodes_remaining"]})')
-            except ValueError:
-                errors.append('节点格式错误，请输入有效的节点编号')
-        
-        # 检查GPU冲突
-        if gpu_str and gpu_str != 'No':
-            try:
-                if gpu_str.isdigit():
-                    requested_gpus = [int(gpu_str)]
-                elif ',' in gpu_str:
-                    requested_gpus = [int(g.strip()) for g in gpu_str.split(',') if g.strip().isdigit()]
-                else:
-                    requested_gpus = []
-                
-                occupied_gpus = resources['9755']['gpu_occupied']
-                conflict_gpus = [g for g in requested_gpus if g in occupied_gpus]
-                
-                if conflict_gpus:
-                    errors.append(f'GPU {",".join(map(str, conflict_gpus))} 已被占用')
-                
-                if len(requested_gpus) > resources['9755']['gpu_remaining']:
-                    errors.append(f'请求GPU数 ({len(requested_gpus)}) 超过剩余GPU数 ({resources["9755"]["gpu_remaining"]})')
-            except ValueError:
-                errors.append('GPU格式错误，请选择有效的GPU')
-        
-        if errors:
-            return jsonify({'success': False, 'error': '\n'.join(errors)}), 400
-        
-        # 如果验证通过，添加记录
-        data = {
-            '时间': request.form['time'],
-            '姓名': request.form['name'],
-            '占用节点': request.form['nodes'],
-            '占用GPU': request.form['gpu'],
-            '是否使用远程桌面': request.form['remote'],
-            '任务类型': request.form['task_type'],
-            '预计使用时间': request.form['estimated_time'],
-            '实际使用时间': request.form.get('actual_time', ''),
-            '是否完成': request.form.get('completed', '')
-        }
-        server_manager.add_record_9755(data)
-        return redirect(url_for('server_9755'))
-        
-    except Exception as e:
-        return jsonify({'success': False, 'error': f'系统错误: {str(e)}'}), 500
+def _render_records_page(server_type):
+    def render():
+        try:
+            filters = _record_filters()
+            result = server_manager.query_records(server_type, **filters)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        return _render_server_html(server_type, filters, result), 'text/html; charset=utf-8'
+    # etag 在查询之前取得，查询结果不会比它旧
+    return _cached_response(('page', server_type, request.query_string), _query_etag('page', server_type), render)
+
+def _render_server_html(server_type, filters, result):
+    return render_template(
+        'server.html',
+        server_type=server_type,
+        spec=SERVERS[server_type],
+        resources_html=_resources_html(server_type),
+        rows_html=_rows_html(server_type, result['rows']),
+        total=result['total'],
+        next_cursor=result['next'],
+        filters=request.args
+    )
+
+@app.route('/<server_type>')
+def server_page(server_type):
+    if server_type not in SERVERS:
+        abort(404)
+    return _render_records_page(server_type)
 
-@app.route('/add_5520', methods=['POST'])
-def add_5520():
+@app.route('/add_<server_type>', methods=['POST'])
+def add_record(server_type):
+    if server_type not in SERVERS:
+        abort(404)
     try:
-        # 获取表单数据
-        remote = request.form['remote']
-        cores_str = request.form['cores']
-        gpu_str = request.form['gpu']
-        
-        # 获取当前资源状态
-        resources = server_manager.calculate_remaining_resources()
-        errors = []
-        
-        # 检查远程桌面冲突
-        if remote == 'Yes' and server_manager._check_remote_desktop_conflict('5520'):
-            errors.append('远程桌面已被占用，请等待当前任务完成')
-        
-        # 检查核数资源
-        if cores_str:
-            try:
-                if cores_str.lower() == 'all':
-                    requested_cores = resources['5520']['cores_total']
-                else:
-                    requested_cores = int(cores_str)
-                    if requested_cores <= 0:
-                        errors.append('核数必须大于0')
-                
-                if requested_cores > resources['5520']['cores_remaining']:
-                    errors.append(f'请求核数 ({requested_cores}) 超过剩余核数 ({resources["5520"]["cores_remaining"]})')
-            except ValueError:
-                errors.append('核数格式错误，请输入数字或"all"')
-        
-        # 检查GPU资源
-        if gpu_str == 'Yes' and resources['5520']['gpu_remaining'] == 0:
-            errors.append('GPU已被占用，请等待当前任务完成')
-        
+        data = SERVERS[server_type].form_data(request.form)
+        # 检查资源冲突并登记，两步在同一把锁内完成，并发提交不会重复占用
+        errors = server_manager.try_reserve(server_type, data)
         if errors:
             return jsonify({'success': False, 'error': '\n'.join(errors)}), 400
-        
-        # 如果验证通过，添加记录
-        data = {
-            '时间': request.form['time'],
-            '姓名': request.form['name'],
-            '使用核数': request.form['cores'],
-            '占用GPU': request.form['gpu'],
-            '是否使用远程桌面': request.form['remote'],
-            '任务类型': request.form['task_type'],
-            '预计使用时间': request.form['estimated_time'],
-            '实际使用时间': request.form.get('actual_time', ''),
-            '是否完成': request.form.get('completed', '')
-        }
-        server_manager.add_record_5520(data)
-        return redirect(url_for('server_5520'))
+        return redirect(url_for('server_page', server_type=server_type))
         
     except Exception as e:
         return jsonify({'success': False, 'error': f'系统错误: {str(e)}'}), 500
 
 @app.route('/api/resources')
 def api_resources():
-    return jsonify(server_manager.calculate_remaining_resources())
+    return _cached_response(('api_resources',), _resources_etag('resources'),
+                            lambda: _json_body(server_manager.calculate_remaining_resources()))
 
-@app.route('/api/update_status_9755/<int:row_index>', methods=['POST'])
-def update_status_9755(row_index):
-    data = request.get_json()
-    status = data.get('status', '')
-    if server_manager.update_completion_status_9755(row_index, status):
-        return jsonify({'success': True})
-    return jsonify({'success': False, 'error': '无法更新状态，可能是因为任务已超时自动完成'}), 400
+def _record_json(row_index, record):
+    """接口中的一条记录：字段文本，加上行号、记录ID（id）和修改时用于并发检查的校验值（revision）"""
+    return {'row_index': row_index, 'id': to_text(record.get(ID_COLUMN, '')), 'revision': record.revision,
+            **{k: to_text(v) for k, v in record.items()}}
 
-@app.route('/api/update_status_5520/<int:row_index>', methods=['POST'])
-def update_status_5520(row_index):
+@app.route('/api/records/<server_type>')
+def api_records(server_type):
+    """记录列表
+    
+    带 since=<版本号> 时只返回该版本之后新增或修改的行，再带 wait=<秒数> 时没有变化先等待（长轮询，最多
+    LONG_POLL_MAX_SECONDS 秒）；否则按 page/size/status/name/from/to 分页过滤，format=html 时返回渲染好的表格行，供页面滚动加载。
+    """
+    if server_type not in SERVER_COLUMNS:
+        abort(404)
+    since = request.args.get('since', type=int)
+    wait = min(request.args.get('wait', 0, type=float), LONG_POLL_MAX_SECONDS)
+    if since is not None and wait > 0:
+        # 同步部署时等待期间占用一个线程；异步入口（asgi.py）在事件循环中等待后再转发，不带 wait
+        server_manager.wait_for_data(server_type, since, wait)
+    return _cached_response(('records', server_type, request.query_string), _query_etag('records', server_type),
+                            partial(_records_body, server_type, since))
+
+def _records_body(server_type, since):
+    if since is not None:
+        version, changes = server_manager.get_changes(server_type, since)
+        payload = {
+            'server': server_type,
+            'version': version,
+            'since': since,
+            'records': [_record_json(idx, record) for idx, record in changes]
+        }
+        return _json_body(payload)
+    
+    try:
+        filters = _record_filters()
+        result = server_manager.query_records(server_type, **filters)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    payload = {
+        'server': server_type,
+        'version': result['version'],
+        'page': filters['page'],
+        'size': filters['size'],
+        'total': result['total'],
+        'next': result['next'],
+        'has_more': result['next'] is not None
+    }
+    if request.args.get('format') == 'html':
+        payload['html'] = _rows_html(server_type, result['rows'])
+    else:
+        payload['records'] = [_record_json(idx, record) for idx, record in result['rows']]
+    return _json_body(payload)
+
+def _time_arg(name, end_of_day=False):
+    """解析时间参数：2025.6.10、2025-06-10 08:00:00 等，只有日期且 end_of_day 时取次日零点；格式错误时抛出 ValueError"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    day = parse_start_date(value)
+    if day is None:
+        raise ValueError(f'{name} 时间格式错误，例如: 2025.6.10 或 2025-06-10 08:00')
+    moment = datetime.combine(day, datetime.min.time())
+    return moment + timedelta(days=1) if end_of_day else moment
+
+def _time_text(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+@app.route('/api/schedule/<server_type>')
+def api_schedule(server_type):
+    """与 from~to（含两端日期）重叠的未完成记录，按预约开始时间排列"""
+    if server_type not in SERVERS:
+        abort(404)
+    try:
+        begin = _time_arg('from')
+        end = _time_arg('to', end_of_day=True)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    bookings = server_manager.bookings(server_type, begin, end)
+    return jsonify({
+        'server': server_type,
+        'bookings': [{**_record_json(idx, record), 'start': _time_text(start), 'end': _time_text(stop)}
+                     for start, stop, idx, record in bookings]
+    })
+
+@app.route('/api/schedule/<server_type>/next_slot')
+def api_next_slot(server_type):
+    """最早的空闲时段：duration 为使用时长（如 48h、3天），after 为最早开始时间（默认现在），
+    其余参数按资源 key 给出需要的数量，如 ?duration=2天&cores=8&gpu=1
+    """
+    if server_type not in SERVERS:
+        abort(404)
+    try:
+        hours = parse_duration_hours(request.args.get('duration', ''))
+        if hours <= 0:
+            raise ValueError('duration 必须是有效的使用时长，例如: 48h、3天')
+        needs = SERVERS[server_type].parse_needs(request.args)
+        after = _time_arg('after')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    slot = server_manager.next_free_slot(server_type, needs, hours, after)
+    if slot is None:
+        return jsonify({'success': False, 'error': '没有满足条件的空闲时段'}), 404
+    start, end, available = slot
+    return jsonify({'success': True, 'server': server_type, 'start': _time_text(start), 'end': _time_text(end),
+                    'available': available})
+
+@app.route('/api/analytics/utilization')
+def api_utilization():
+    """资源利用率：server 为服务器（默认全部），bucket 为 hour/day/week（默认 day），
+    from/to 为时间范围（to 默认现在，from 默认往前若干个桶），按桶对齐
+    """
+    server_type = request.args.get('server') or None
+    if server_type is not None and server_type not in SERVERS:
+        abort(404)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        return jsonify({'success': False, 'error': f'bucket 只能是 {"、".join(BUCKETS)}'}), 400
+    try:
+        begin = _time_arg('from')
+        end = _time_arg('to', end_of_day=True)
+        reports = {server: server_manager.utilization(server, begin, end, bucket)
+                   for server in ([server_type] if server_type else SERVERS)}
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if server_type:
+        return jsonify({'server': server_type, **reports[server_type]})
+    return jsonify({'servers': reports})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/resources/stream')
+def api_resources_stream():
+    """以 Server-Sent Events 推送资源使用情况，数据变化时立即推送"""
+    def stream():
+        version = None
+        while True:
+            new_version = server_manager.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+            if new_version == version:
+                # 心跳注释，防止代理断开空闲连接
+                yield ': keep-alive\n\n'
+                continue
+            version = new_version
+            data = json.dumps(server_manager.calculate_remaining_resources(), ensure_ascii=False)
+            yield f'id: {version}\ndata: {data}\n\n'
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/records/<server_type>/<record_id>', methods=['PATCH'])
+def patch_record(server_type, record_id):
+    """按记录ID修改完成状态（status）和/或实际使用时间（actual_time）
+    
+    读取记录时得到的 revision 放在 If-Match 头或请求体中；记录在此期间被修改过时返回 409 和最新的记录，不做修改
+    """
+    if server_type not in SERVERS:
+        abort(404)
+    data = request.get_json(silent=True) or {}
+    revision = request.headers.get('If-Match', '').strip().strip('"') or data.get('revision')
+    if not revision:
+        return jsonify({'success': False, 'error': '缺少记录的 revision（If-Match 头或请求体）'}), 428
+    status = data.get('status')
+    actual_time = data.get('actual_time')
+    if status is None and actual_time is None:
+        return jsonify({'success': False, 'error': '没有要修改的字段（status、actual_time）'}), 400
+    if status is not None and status not in STATUS_VALUES:
+        return jsonify({'success': False, 'error': 'status 只能是 Yes（已完成）或空字符串（进行中）'}), 400
+    if actual_time is not None and not isinstance(actual_time, str):
+        return jsonify({'success': False, 'error': 'actual_time 必须是字符串，例如: 3小时'}), 400
+    try:
+        updated, row_index, record = server_manager.update_record(
+            server_type, record_id, revision, status=status, actual_time=actual_time)
+    except KeyError:
+        return jsonify({'success': False, 'error': '记录不存在'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    payload = {'success': updated, 'record': _record_json(row_index, record)}
+    if not updated:
+        payload['error'] = '记录已被其他人修改，请刷新后重试'
+        return jsonify(payload), 409
+    response = jsonify(payload)
+    response.headers['ETag'] = f'"{record.revision}"'
+    return response
+
+@app.route('/api/records/<server_type>/bulk', methods=['POST'])
+def import_records(server_type):
+    """批量导入 CSV、JSONL 或 XLSX：以表单字段 file 上传，或直接作为请求体（按 Content-Type 或 format 参数判断格式）
+    
+    CSV、JSONL 默认 UTF-8 编码，其他编码用 encoding 参数指定（如 gbk）
+    """
+    if server_type not in SERVERS:
+        abort(404)
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename, upload.mimetype)
+    else:
+        stream, fmt = request.stream, detect_format(content_type=request.content_type)
+    fmt = request.args.get('format') or fmt
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'error': f'无法判断文件格式，请用 format 参数指定: {"、".join(FORMATS)}'}), 400
+    encoding = request.args.get('encoding', 'utf-8-sig')
+    try:
+        codecs.lookup(encoding)
+        if fmt == 'xlsx' and upload is None:
+            # xlsx 需要随机访问，先把请求体写入临时文件（超过 1MB 时落盘）
+            spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+            shutil.copyfileobj(stream, spooled)
+            spooled.seek(0)
+            stream = spooled
+        result = server_manager.import_records(server_type, read_rows(stream, fmt, encoding))
+    except LookupError:
+        return jsonify({'success': False, 'error': f'未知的编码 {encoding}'}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if 'error' in result:
+        return jsonify({'success': False, 'server': server_type, **result}), 400
+    return jsonify({'success': True, 'server': server_type, **result})
+
+@app.route('/api/records/<server_type>/bulk')
+def export_records_stream(server_type):
+    """流式导出全部记录为 CSV（默认）或 JSONL，列与记录文件相同，可直接用于批量导入；xlsx 见 /export/<服务器>.xlsx"""
+    if server_type not in SERVERS:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt == 'xlsx':
+        return redirect(url_for('export_records', server_type=server_type))
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'error': f'format 只能是 {"、".join(FORMATS)}'}), 400
+    version, records = server_manager.iter_records(server_type)
+    headers = {'Content-Disposition': f'attachment; filename={server_type}_records.{fmt}', 'X-Data-Version': str(version)}
+    return Response(export_rows(SERVER_COLUMNS[server_type], records, fmt), content_type=CONTENT_TYPES[fmt], headers=headers)
+
+# 兼容旧客户端的修改接口，不做并发检查；页面和新的客户端使用上面的 PATCH 接口。
+# 按记录ID定位；旧客户端传入的行号（不是已有记录ID的数字）按当前存储中的行号定位，归档后行号重新编号，可能指向另一条记录
+@app.route('/api/update_status_<server_type>/<record_id>', methods=['POST'])
+def update_status(server_type, record_id):
+    if server_type not in SERVERS:
+        abort(404)
     data = request.get_json()
     status = data.get('status', '')
-    if server_manager.update_completion_status_5520(row_index, status):
-        return jsonify({'success': True})
-    return jsonify({'success': False, 'error': '无法更新状态，可能是因为任务已超时自动完成'}), 400
+    if status not in STATUS_VALUES:
+        return jsonify({'success': False, 'error': 'status 只能是 Yes（已完成）或空字符串（进行中）'}), 400
+    try:
+        server_manager.update_record(server_type, record_id, None, status=status, by_row=True)
+    except KeyError:
+        return jsonify({'success': False, 'error': '记录不存在'}), 404
+    except ValueError:
+        return jsonify({'success': False, 'error': '无法更新状态，可能是因为任务已超时自动完成'}), 400
+    return jsonify({'success': True})
 
-@app.route('/api/update_actual_time_9755/<int:row_index>', methods=['POST'])
-def update_actual_time_9755(row_index):
+@app.route('/api/update_actual_time_<server_type>/<record_id>', methods=['POST'])
+def update_actual_time(server_type, record_id):
+    if server_type not in SERVERS:
+        abort(404)
     data = request.get_json()
     actual_time = data.get('actual_time', '')
-    if server_manager.update_actual_time_9755(row_index, actual_time):
-        return jsonify({'success': True})
-    return jsonify({'success': False}), 400
+    try:
+        server_manager.update_record(server_type, record_id, None, actual_time=actual_time, by_row=True)
+    except KeyError:
+        return jsonify({'success': False, 'error': '记录不存在'}), 404
+    return jsonify({'success': True})
 
-@app.route('/api/update_actual_time_5520/<int:row_index>', methods=['POST'])
-def update_actual_time_5520(row_index):
-    data = request.get_json()
-    actual_time = data.get('actual_time', '')
-    if server_manager.update_actual_time_5520(row_index, actual_time):
-        return jsonify({'success': True})
-    return jsonify({'success': False}), 400
+@app.route('/export/<server_type>.xlsx')
+def export_records(server_type):
+    if server_type not in SERVER_COLUMNS:
+        abort(404)
+    etag = f"export-{server_type}-{server_manager.data_version(server_type)}"
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    version, content = server_manager.export_excel(server_type)
+    response = send_file(io.BytesIO(content), as_attachment=True, download_name=f'{server_type}_records.xlsx',
+                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    return _with_etag(response, f"export-{server_type}-{version}")
 
 if __name__ == '__main__':
+    # debug 模式下 werkzeug 在子进程中重新运行本文件并提供服务，父进程只监视文件变化，不需要初始化
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        create_app()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,96 @@
+"""已完成历史记录的归档
+
+登记日期早于 ARCHIVE_AFTER_DAYS 天、已完成且预计结束时间已过的记录由 ServerManager 定期移出存储，按登记月份写入归档目录：
+- <服务器>/<YYYY-MM>.json.gz：该月归档的记录，{"columns": 列名, "rows": [[字段文本]]} 的 JSON，gzip 压缩
+
+存储（Excel 工作簿、SQLite 表）只保留未完成和近期的记录，加载、写回、备份等操作的开销取决于这部分记录，
+不随历史记录的积累而增长。同一月份再次归档时读出原有内容，与新归档的记录合并（按记录ID去重）后整体替换。
+按登记日期查询时只读取与日期范围重叠的月份。
+"""
+import gzip
+import json
+import os
+from datetime import date
+
+import pandas as pd
+
+from inventory import ID_COLUMN
+from storage import to_text, write_atomic
+
+SUFFIX = '.json.gz'
+
+
+def month_of(day):
+    """登记日期（date 或序数）所在的月份，如 '2025-06'"""
+    if not isinstance(day, date):
+        day = date.fromordinal(day)
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+class ArchiveStore:
+    """按服务器、登记月份存放的归档文件；写入由调用方的跨进程写锁保护，读取不加锁（文件整体替换）"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _server_dir(self, server_type):
+        return os.path.join(self.directory, server_type)
+
+    def _path(self, server_type, month):
+        return os.path.join(self._server_dir(server_type), f'{month}{SUFFIX}')
+
+    def months(self, server_type, start=None, end=None):
+        """已归档的月份，按时间排列；start/end 为 date 时只返回与 [start, end] 重叠的月份"""
+        try:
+            names = os.listdir(self._server_dir(server_type))
+        except FileNotFoundError:
+            return []
+        months = sorted(name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX))
+        low = month_of(start) if start is not None else None
+        high = month_of(end) if end is not None else None
+        return [month for month in months if (low is None or month >= low) and (high is None or month <= high)]
+
+    def signature(self, server_type, month=None):
+        """归档文件的修改时间与大小，内容改变时改变；month 为空时为该服务器全部月份的签名"""
+        months = [month] if month is not None else self.months(server_type)
+        signature = []
+        for name in months:
+            try:
+                stat = os.stat(self._path(server_type, name))
+            except FileNotFoundError:
+                continue
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def read(self, server_type, month):
+        """读取一个月的归档，返回各列均为文本的 DataFrame；月份不存在时返回空表"""
+        try:
+            with open(self._path(server_type, month), 'rb') as f:
+                data = json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            return pd.DataFrame()
+        return pd.DataFrame(data['rows'], columns=data['columns'], dtype=object)
+
+    def add(self, server_type, columns, records):
+        """把记录按登记月份写入归档，与已归档的内容合并，记录ID相同的以新记录为准；返回写入的月份
+
+        返回时归档文件已落盘（文件与目录均已 fsync），调用方之后才能从存储中删除这些记录
+        """
+        groups = {}
+        for record in records:
+            groups.setdefault(month_of(record.start_day), []).append(record)
+        for month, group in groups.items():
+            existing = self.read(server_type, month)
+            merged_columns = list(columns) + [col for col in existing.columns if col not in columns]
+            rows = {}
+            for fields in existing.to_dict('records'):
+                rows[fields.get(ID_COLUMN) or len(rows)] = fields
+            for record in group:
+                rows[to_text(record.get(ID_COLUMN, '')) or len(rows)] = record.fields
+            data = {'columns': merged_columns,
+                    'rows': [[to_text(fields.get(col, '')) for col in merged_columns] for fields in rows.values()]}
+            # 调用方随后会从存储中删除这些记录，文件内容和目录项都落盘后才继续
+            write_atomic(self._path(server_type, month),
+                         gzip.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), mtime=0))
+        return sorted(groups)
+
@@ -0,0 +1,193 @@
+"""异步服务入口（ASGI）
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+同步部署（wsgi.py）时每个连接占用一个线程，资源看板的 SSE 连接和长轮询在等待数据变化期间一直占着线程，
+几百个空闲的看板就需要几百个线程。本入口以 Starlette 作为前端：
+- 长连接在事件循环中等待，不占用线程：/api/resources/stream（SSE）和带 since、wait 参数的
+  /api/records/<服务器>（长轮询）。一个后台线程调用 ServerManager.wait_for_change（包括其他进程的写入），
+  数据变化时唤醒全部等待的连接；资源使用情况每个版本只计算、序列化一次，由全部 SSE 连接共用
+- 其他请求（页面、登记、修改、导入导出）原样交给 Flask 应用，在有界的线程池（ASYNC_WORKERS 个线程）中执行，
+  读写 Excel、pandas 计算等阻塞操作不会阻塞事件循环；写入仍经过 ServerManager 的写锁和写入队列，与同步部署相同
+- AsyncServerManager 把 ServerManager 的方法包装为协程，在同一个线程池中执行
+
+需要额外安装：pip install starlette uvicorn a2wsgi（版本见 requirements-optional.txt）。与 wsgi.py 相同，每个 worker 进程各自初始化，
+多 worker（uvicorn --workers）部署需使用 SQLite 存储后端。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from urllib.parse import urlencode
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as app_module
+from app import LONG_POLL_MAX_SECONDS, SSE_KEEPALIVE_SECONDS, create_app
+from inventory import SERVERS
+from metrics import Gauge
+
+ASYNC_WORKERS = int(os.environ.get('ASYNC_WORKERS', 16))
+
+_CONNECTIONS = {'sse': 0, 'long_poll': 0}
+Gauge('async_connections', '异步入口中等待数据变化的长连接数', ['kind'],
+      callback=lambda: [({'kind': kind}, count) for kind, count in _CONNECTIONS.items()])
+
+
+class AsyncServerManager:
+    """ServerManager 的异步外观
+
+    manager.<方法>(...) 返回协程，在线程池中执行 ServerManager 的同名方法；
+    wait_for_change、wait_for_data 直接在事件循环中等待，由 start() 启动的后台线程在数据变化时唤醒
+    """
+
+    def __init__(self, manager, executor):
+        self.manager = manager
+        self.executor = executor
+        self.version = None
+        self.versions = {}
+        self._loop = None
+        self._changed = None
+        self._resources = (None, None)  # (版本号, 序列化后的资源使用情况)
+        self._resources_lock = None
+
+    def __getattr__(self, name):
+        method = getattr(self.manager, name)
+
+        async def call(*args, **kwargs):
+            return await self._loop.run_in_executor(self.executor, partial(method, *args, **kwargs))
+        return call
+
+    def start(self, loop):
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self._resources_lock = asyncio.Lock()
+        self.version = self.manager.wait_for_change(None)
+        self.versions = {server_type: self.manager.data_version(server_type) for server_type in SERVERS}
+        threading.Thread(target=self._watch, name='async-change-watcher', daemon=True).start()
+
+    def _watch(self):
+        version = self.version
+        while True:
+            try:
+                version = self.manager.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+                versions = {server_type: self.manager.data_version(server_type) for server_type in SERVERS}
+                self._loop.call_soon_threadsafe(self._publish, version, versions)
+            except Exception as e:
+                print(f"等待数据变化出错: {str(e)}")
+                time.sleep(1)
+
+    def _publish(self, version, versions):
+        """在事件循环中执行：更新版本号并唤醒全部等待者"""
+        if version == self.version and versions == self.versions:
+            return
+        self.version = version
+        self.versions = versions
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait_for_change(self, last_version, timeout=None):
+        """与 ServerManager.wait_for_change 相同，等待期间不占用线程"""
+        if self.version == last_version:
+            await self._wait(timeout)
+        return self.version
+
+    async def wait_for_data(self, server_type, since, timeout):
+        """与 ServerManager.wait_for_data 相同，等待期间不占用线程"""
+        deadline = time.monotonic() + timeout
+        while self.versions.get(server_type) == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self._wait(remaining)
+        return self.versions.get(server_type)
+
+    async def resources_json(self):
+        """当前版本的资源使用情况（JSON 文本），每个版本只计算一次"""
+        async with self._resources_lock:
+            version, data = self._resources
+            if version != self.version or data is None:
+                version = self.version
+                resources = await self.calculate_remaining_resources()
+                data = json.dumps(resources, ensure_ascii=False)
+                self._resources = (version, data)
+            return data
+
+
+create_app()
+wsgi = WSGIMiddleware(app_module.app, workers=ASYNC_WORKERS)
+server_manager = AsyncServerManager(app_module.server_manager, wsgi.executor)
+
+
+async def resources_stream(request):
+    """以 Server-Sent Events 推送资源使用情况，与 Flask 的同名接口相同"""
+    async def stream():
+        _CONNECTIONS['sse'] += 1
+        try:
+            version = None
+            while True:
+                new_version = await server_manager.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+                if new_version == version:
+                    # 心跳注释，防止代理断开空闲连接
+                    yield ': keep-alive\n\n'
+                    continue
+                version = new_version
+                data = await server_manager.resources_json()
+                yield f'id: {version}\ndata: {data}\n\n'
+        finally:
+            _CONNECTIONS['sse'] -= 1
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(stream(), media_type='text/event-stream', headers=headers)
+
+
+class LongPollRecords:
+    """/api/records/<服务器>：长轮询在事件循环中等待，之后去掉 wait 参数交给 Flask 应用"""
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope)
+        server_type = request.path_params['server_type']
+        params = request.query_params
+        if server_type in SERVERS and params.get('since', '').lstrip('-').isdigit() and 'wait' in params:
+            try:
+                wait = min(float(params['wait']), LONG_POLL_MAX_SECONDS)
+            except ValueError:
+                wait = 0
+            if wait > 0:
+                _CONNECTIONS['long_poll'] += 1
+                try:
+                    await server_manager.wait_for_data(server_type, int(params['since']), wait)
+                finally:
+                    _CONNECTIONS['long_poll'] -= 1
+            query = urlencode([(key, value) for key, value in params.multi_items() if key != 'wait'])
+            scope = {**scope, 'query_string': query.encode('latin-1')}
+        await wsgi(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    server_manager.start(asyncio.get_running_loop())
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/api/resources/stream', resources_stream),
+        Route('/api/records/{server_type}', LongPollRecords(), methods=['GET']),
+        Mount('/', app=wsgi),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,266 @@
+"""记录的增量备份
+
+备份目录结构：
+- objects/<哈希前两位>/<sha256>.gz：按内容寻址的数据块，每块是连续 CHUNK_ROWS 行记录的 JSON，gzip 压缩
+- snapshots/<服务器>/<时间>-<进程号>.json：快照清单，记录列名、行数和各数据块的哈希
+
+记录只会追加或修改少量行，相邻两次快照的数据块绝大多数相同，只有包含变化行的块需要写入，
+磁盘占用和写入量与修改量成正比，而不是每次复制整个文件。每份清单都是完整的快照，
+按保留策略删除任意一份都不影响其他快照，删除后不再被引用的数据块随之清理。
+数据块和清单都先写临时文件再替换（storage.write_atomic），文件和目录项 fsync 后才算写入，断电后不会留下引用不完整数据块的清单。
+
+用法：
+    python backup.py list 9755
+    python backup.py restore 9755 "2025-06-10 12:00" 9755_restored.xlsx
+"""
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from metrics import Counter, Histogram
+from storage import to_text, write_atomic
+
+CHUNK_ROWS = 256
+SNAPSHOT_TIME_FORMAT = '%Y%m%d_%H%M%S_%f'
+
+# 保留策略：最近1小时内的快照全部保留，更早的按小时、天、周各保留每个时间段内最新的一份
+DEFAULT_RETENTION = {'recent': timedelta(hours=1), 'hourly': 48, 'daily': 30, 'weekly': 26}
+
+# 清理未引用的数据块时跳过最近修改过的，避免删掉其他进程刚写入、清单尚未落盘的数据块
+GC_GRACE_SECONDS = 3600
+
+BACKUP_SECONDS = Histogram('backup_snapshot_seconds', '一次备份（快照与清理）的耗时（秒）', ['server'])
+BACKUP_CHUNKS = Counter('backup_chunks_total', '快照中的数据块，written 为新写入，reused 为已存在', ['result'])
+
+
+class BackupStore:
+    """内容寻址的快照存储
+
+    request() 只登记备份请求，由唯一的后台线程执行；同一服务器尚未执行的请求合并为一次，
+    待处理队列最多每台服务器一项，连续写入时也只在 coalesce_delay 秒后做一次快照。
+    snapshot() 也会在请求线程中直接调用（归档、恢复前），由 _snapshot_lock 与后台线程互斥。
+    """
+
+    def __init__(self, directory, coalesce_delay=2, retention=None):
+        self.directory = directory
+        self.coalesce_delay = coalesce_delay
+        self.retention = retention or DEFAULT_RETENTION
+        self._objects_dir = os.path.join(directory, 'objects')
+        self._snapshots_dir = os.path.join(directory, 'snapshots')
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._last_chunks = {}  # 每台服务器上一份快照的 (列名, 数据块)，由 _snapshot_lock 保护
+        self._snapshot_lock = threading.Lock()
+        self._worker = None
+        os.makedirs(self._objects_dir, exist_ok=True)
+        os.makedirs(self._snapshots_dir, exist_ok=True)
+        atexit.register(self.flush)
+
+    def request(self, server_type, provider):
+        """请求备份；provider() 在执行时调用，返回 (列名, 记录列表)，因此快照总是最新数据"""
+        with self._cond:
+            if server_type not in self._pending:
+                self._pending[server_type] = (time.monotonic() + self.coalesce_delay, provider)
+                self._cond.notify()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run)
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                server_type, (due, provider) = min(self._pending.items(), key=lambda item: item[1][0])
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                del self._pending[server_type]
+            self._backup(server_type, provider)
+
+    def queue_depth(self):
+        """等待执行的备份请求数"""
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        """立即执行所有待处理的备份（进程退出时调用）"""
+        with self._cond:
+            pending = list(self._pending.items())
+            self._pending.clear()
+        for server_type, (_, provider) in pending:
+            self._backup(server_type, provider)
+
+    def _backup(self, server_type, provider):
+        try:
+            with BACKUP_SECONDS.time(server=server_type):
+                columns, records = provider()
+                self.snapshot(server_type, columns, records)
+                self.prune(server_type)
+        except Exception as e:
+            print(f"备份 {server_type} 出错: {str(e)}")
+
+    def snapshot(self, server_type, columns, records):
+        """写入一份快照，只保存尚不存在的数据块；与上一份快照相同时跳过，返回清单路径或 None"""
+        rows = [[to_text(record.get(col, '')) for col in columns] for record in records]
+        chunks = [self._put_chunk(rows[start:start + CHUNK_ROWS]) for start in range(0, len(rows), CHUNK_ROWS)]
+        with self._snapshot_lock:
+            return self._write_snapshot(server_type, columns, rows, chunks)
+
+    def _write_snapshot(self, server_type, columns, rows, chunks):
+        """写入快照清单，调用方需持有 _snapshot_lock"""
+        if self._last_chunks.get(server_type) == (columns, chunks):
+            return None
+
+        server_dir = os.path.join(self._snapshots_dir, server_type)
+        created = datetime.now()
+        path = os.path.join(server_dir, f'{created.strftime(SNAPSHOT_TIME_FORMAT)}-{os.getpid()}.json')
+        manifest = {
+            'server': server_type,
+            'created': created.strftime('%Y-%m-%d %H:%M:%S'),
+            'columns': list(columns),
+            'rows': len(rows),
+            'chunks': chunks
+        }
+        write_atomic(path, json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        self._last_chunks[server_type] = (columns, chunks)
+        return path
+
+    def _chunk_path(self, digest):
+        return os.path.join(self._objects_dir, digest[:2], f'{digest}.gz')
+
+    def _put_chunk(self, rows):
+        data = json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            os.utime(path)  # 刷新修改时间，清理时不会误删刚被引用的数据块
+            BACKUP_CHUNKS.inc(result='reused')
+        else:
+            write_atomic(path, gzip.compress(data, mtime=0))
+            BACKUP_CHUNKS.inc(result='written')
+        return digest
+
+    def list_snapshots(self, server_type):
+        """返回 [(创建时间, 清单路径)]，按时间从新到旧排列"""
+        server_dir = os.path.join(self._snapshots_dir, server_type)
+        if not os.path.isdir(server_dir):
+            return []
+        snapshots = []
+        for name in os.listdir(server_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                created = datetime.strptime(name.split('-')[0], SNAPSHOT_TIME_FORMAT)
+            except ValueError:
+                continue
+            snapshots.append((created, os.path.join(server_dir, name)))
+        snapshots.sort(reverse=True)
+        return snapshots
+
+    def load(self, manifest_path):
+        """读取一份快照，返回 DataFrame"""
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        rows = []
+        for digest in manifest['chunks']:
+            with open(self._chunk_path(digest), 'rb') as f:
+                rows.extend(json.loads(gzip.decompress(f.read())))
+        return pd.DataFrame(rows, columns=manifest['columns'])
+
+    def restore(self, server_type, timestamp):
+        """返回 timestamp 时刻（含）之前最新一份快照的数据，没有快照时抛出 LookupError"""
+        if not isinstance(timestamp, datetime):
+            timestamp = pd.to_datetime(timestamp).to_pydatetime()
+        for created, path in self.list_snapshots(server_type):
+            if created <= timestamp:
+                return self.load(path)
+        raise LookupError(f'{server_type} 在 {timestamp} 之前没有备份')
+
+    def prune(self, server_type, now=None):
+        """按保留策略删除多余的快照，返回删除的数量"""
+        now = now or datetime.now()
+        snapshots = self.list_snapshots(server_type)
+        keep = {path for created, path in snapshots[:1]}
+        keep.update(path for created, path in snapshots if now - created <= self.retention['recent'])
+        buckets = {
+            'hourly': lambda t: t.strftime('%Y%m%d%H'),
+            'daily': lambda t: t.date(),
+            'weekly': lambda t: t.isocalendar()[:2],
+        }
+        for kind, bucket_of in buckets.items():
+            seen = []
+            for created, path in snapshots:
+                bucket = bucket_of(created)
+                if bucket in seen:
+                    continue
+                if len(seen) >= self.retention[kind]:
+                    break
+                seen.append(bucket)
+                keep.add(path)
+
+        removed = 0
+        for created, path in snapshots:
+            if path not in keep:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            self._collect_garbage()
+        return removed
+
+    def _collect_garbage(self):
+        """删除没有任何快照引用的数据块"""
+        referenced = set()
+        for server_type in os.listdir(self._snapshots_dir):
+            for created, path in self.list_snapshots(server_type):
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        referenced.update(json.load(f)['chunks'])
+                except (OSError, ValueError):
+                    continue
+        cutoff = time.time() - GC_GRACE_SECONDS
+        for prefix in os.listdir(self._objects_dir):
+            prefix_dir = os.path.join(self._objects_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                if name[:-len('.gz')] not in referenced and os.path.getmtime(path) < cutoff:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] not in ('list', 'restore'):
+        print(__doc__)
+        return 1
+    store = BackupStore(os.environ.get('BACKUP_DIR', 'backups'))
+    server_type = argv[1]
+    if argv[0] == 'list':
+        for created, path in store.list_snapshots(server_type):
+            print(f"{created.strftime('%Y-%m-%d %H:%M:%S')}  {os.path.basename(path)}")
+        return 0
+    if len(argv) < 4:
+        print(__doc__)
+        return 1
+    df = store.restore(server_type, argv[2])
+    df.to_excel(argv[3], index=False)
+    print(f"已把 {len(df)} 条记录恢复到 {argv[3]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
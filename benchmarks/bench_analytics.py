@@ -0,0 +1,98 @@
+"""利用率统计的性能对比
+
+对比逐个时间桶遍历全部记录（每个桶对每条记录重新解析时间、求重叠）与 analytics 模块的事件扫描，
+以及已结束的桶缓存后的再次查询。记录为 5520 服务器约半年的历史。
+
+用法：python benchmarks/bench_analytics.py [--rows 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ServerAnalytics  # noqa: E402
+from cache import LRUCache  # noqa: E402
+from duration import parse_duration_hours  # noqa: E402
+from inventory import SERVERS  # noqa: E402
+from records import Record  # noqa: E402
+
+SERVER = '5520'
+DAYS = 180
+
+
+def generate_records(count, now, seed=42):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        start = now - timedelta(hours=rng.uniform(0, DAYS * 24))
+        records.append({
+            '时间': start.strftime('%Y-%m-%d %H:%M:%S'),
+            '姓名': f'user{rng.randint(1, 30)}',
+            '使用核数': rng.choice(['4', '8', '16', '32', 'all']),
+            '占用GPU': rng.choice(['Yes', 'No']),
+            '是否使用远程桌面': rng.choice(['Yes', 'No']),
+            '任务类型': rng.choice(['vasp', 'gaussian', 'lammps']),
+            '预计使用时间': f'{rng.randint(1, 72)}小时',
+            '实际使用时间': f'{rng.randint(1, 72)}小时',
+            '是否完成': 'Yes',
+        })
+    return records
+
+
+def loop_utilization(records, begin, days):
+    """逐个桶遍历记录字典，累计核数×小时"""
+    result = []
+    for day in range(days):
+        lo = begin + timedelta(days=day)
+        hi = lo + timedelta(days=1)
+        used = 0.0
+        for fields in records:
+            start = datetime.strptime(fields['时间'], '%Y-%m-%d %H:%M:%S')
+            end = start + timedelta(hours=parse_duration_hours(fields['实际使用时间']))
+            overlap = (min(end, hi) - max(start, lo)).total_seconds()
+            if overlap > 0:
+                cores = 56 if fields['使用核数'] == 'all' else int(fields['使用核数'])
+                used += cores * overlap / 3600
+        result.append(used)
+    return result
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='利用率统计的性能对比')
+    parser.add_argument('--rows', type=int, default=20_000, help='记录条数')
+    args = parser.parse_args()
+    count = args.rows
+    now = datetime.now()
+    begin = (now - timedelta(days=DAYS)).replace(hour=0, minute=0, second=0, microsecond=0)
+    fields = generate_records(count, now)
+    spec = SERVERS[SERVER]
+    records = [Record(f, spec.resources) for f in fields]
+    analytics = ServerAnalytics(spec, LRUCache('bench', 1 << 30))
+    load_time, _ = timed(lambda: analytics.load(records))
+
+    loop_time, _ = timed(lambda: loop_utilization(fields, begin, DAYS))
+    day_cold, _ = timed(lambda: analytics.utilization(begin, now, 'day', now))
+    day_warm, _ = timed(lambda: analytics.utilization(begin, now, 'day', now))
+    hour_cold, _ = timed(lambda: analytics.utilization(now - timedelta(days=60), now, 'hour', now))
+    hour_warm, report = timed(lambda: analytics.utilization(now - timedelta(days=60), now, 'hour', now))
+
+    print(f'{count} 条记录，{DAYS} 天历史（建立数组 {load_time * 1000:.1f} ms）')
+    print(f'{"逐桶遍历记录（天）":<20} {loop_time * 1000:10.1f} ms')
+    print(f'{"事件扫描（天）":<20} {day_cold * 1000:10.1f} ms  {loop_time / day_cold:7.1f}x')
+    print(f'{"缓存后（天）":<20} {day_warm * 1000:10.1f} ms  {loop_time / day_warm:7.1f}x')
+    print(f'{"事件扫描（小时）":<20} {hour_cold * 1000:10.1f} ms  ({len(report["buckets"])} 个桶)')
+    print(f'{"缓存后（小时）":<20} {hour_warm * 1000:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
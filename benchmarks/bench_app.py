@@ -0,0 +1,332 @@
+"""整个应用的基准测试与压力测试
+
+对每种数据规模（默认 1k、10k、100k 行）：
+1. 按服务器清单生成模拟的历史记录，写成与线上相同格式的 .xlsx（列与 servers.json 一致），
+   由 ServerManager 启动时按配置的存储后端导入；
+2. 微基准：ServerManager 的常用方法（get_records、query_records、calculate_remaining_resources、
+   _check_and_update_records）和 parse_duration_hours，报告每次调用的平均值、p50 和 p99；
+3. 压力测试：多个线程用 Flask 测试客户端并发发送混合的读写请求（/、/api/resources、/<服务器>、
+   /add_<服务器>、/api/update_status_<服务器>），报告各接口的 p50/p99 延迟、状态码和总吞吐量。
+
+结果可用 --output 保存为 JSON，之后用 --compare 与保存的结果对比，比值大于1表示变慢。
+
+用法：python benchmarks/bench_app.py [--sizes 1000,10000,100000] [--threads 8] [--requests 2000]
+                                      [--backend sqlite] [--output result.json] [--compare baseline.json]
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402
+from duration import _parse_text, parse_duration_hours  # noqa: E402
+from inventory import ID_COLUMN, SERVERS  # noqa: E402
+
+# 压力测试中各类请求的比例
+WORKLOAD = [
+    ('GET /', 15),
+    ('GET /api/resources', 30),
+    ('GET /<server>', 20),
+    ('POST /add_<server>', 15),
+    ('POST /api/update_status_<server>', 20),
+]
+# 新登记的预约从这一天开始逐天排开，互不冲突
+BOOKING_BASE = datetime(2100, 1, 1)
+
+
+def _resource_value(resource, rng):
+    if resource.kind == 'discrete':
+        ids = rng.sample(resource.ids, rng.randint(0, min(2, len(resource.ids))))
+        return ','.join(map(str, sorted(ids))) or 'No'
+    if resource.kind == 'pool':
+        return 'all' if rng.random() < 0.05 else str(rng.randint(1, max(1, resource.total // 4)))
+    return rng.choice(['Yes', 'No'])
+
+
+def generate_rows(spec, count, now, seed=42):
+    """一台服务器最近一年的登记记录，按登记时间排列；最后几条为进行中，预计在十天后结束"""
+    rng = random.Random(seed)
+    starts = sorted(now - timedelta(hours=rng.uniform(24 * 10, 24 * 365)) for _ in range(count))
+    pending = min(5, count)
+    rows = []
+    for i, start in enumerate(starts):
+        if i >= count - pending:
+            start = now - timedelta(hours=1)
+        day = f'{start.year}.{start.month}.{start.day}'
+        end = start + timedelta(days=rng.randint(1, 3))
+        row = {
+            '时间': start.strftime('%Y-%m-%d %H:%M:%S'),
+            '姓名': f'user{rng.randint(1, 40)}',
+            '任务类型': rng.choice(['vasp', 'gaussian', 'lammps', 'cp2k']),
+            '预计使用时间': rng.choice([f'{rng.randint(1, 72)}小时', f'{rng.randint(1, 3)}天',
+                                     f'{day}~{end.year}.{end.month}.{end.day}']),
+            '实际使用时间': f'{rng.randint(1, 72)}小时',
+            '是否完成': 'Yes',
+        }
+        for resource in spec.resources:
+            row[resource.field] = _resource_value(resource, rng)
+        if i >= count - pending:
+            row.update({'预计使用时间': '10天', '实际使用时间': '', '是否完成': ''})
+            for resource in spec.resources:
+                row[resource.field] = 'No' if resource.kind != 'pool' else '1'
+        rows.append(row)
+    return rows
+
+
+def latency_stats(samples):
+    """样本为秒，结果为毫秒"""
+    values = np.array(samples) * 1000
+    return {
+        'count': len(values),
+        'mean_ms': round(float(values.mean()), 4),
+        'p50_ms': round(float(np.percentile(values, 50)), 4),
+        'p99_ms': round(float(np.percentile(values, 99)), 4),
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def microbenchmarks(manager, server_types, repeat):
+    results = {}
+    for server_type in server_types:
+        results[f'get_records[{server_type}]'] = measure(lambda: manager.get_records(server_type), repeat)
+        results[f'query_records[{server_type}]'] = measure(lambda: manager.query_records(server_type), repeat)
+        results[f'_check_and_update_records[{server_type}]'] = measure(
+            lambda: manager._check_and_update_records(server_type, datetime.now()), repeat)
+    results['calculate_remaining_resources'] = measure(manager.calculate_remaining_resources, repeat)
+
+    # 使用时间解析：对全部记录的预计使用时间逐个解析，报告每个值的耗时
+    values = [record.get('预计使用时间', '') for server_type in server_types
+              for record in manager.get_records(server_type)]
+    for label, clear in (('parse_duration_hours (cold)', True), ('parse_duration_hours (warm)', False)):
+        if clear:
+            _parse_text.cache_clear()
+        start = time.perf_counter()
+        for value in values:
+            parse_duration_hours(value)
+        elapsed = time.perf_counter() - start
+        results[label] = {'count': len(values), 'mean_ms': round(elapsed * 1000 / max(len(values), 1), 6)}
+    return results
+
+
+def load_test(flask_app, server_types, record_ids, threads, total_requests, seed=7):
+    """threads 个线程共发送 total_requests 个混合请求，返回各接口延迟、状态码与吞吐量"""
+    labels = [label for label, _ in WORKLOAD]
+    weights = [weight for _, weight in WORKLOAD]
+    booking_days = itertools.count()
+    samples = {label: [] for label in labels}
+    statuses = {label: {} for label in labels}
+    merge_lock = threading.Lock()
+    per_thread = [total_requests // threads + (1 if i < total_requests % threads else 0) for i in range(threads)]
+
+    def request(client, label, rng):
+        server_type = rng.choice(server_types)
+        spec = SERVERS[server_type]
+        if label == 'GET /':
+            return client.get('/')
+        if label == 'GET /api/resources':
+            return client.get('/api/resources')
+        if label == 'GET /<server>':
+            return client.get(f'/{server_type}')
+        if label == 'POST /add_<server>':
+            day = BOOKING_BASE + timedelta(days=next(booking_days))
+            end = day + timedelta(days=1)
+            form = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'name': 'bench', 'task_type': 'bench',
+                    'estimated_time': f'{day.year}.{day.month}.{day.day}~{end.year}.{end.month}.{end.day}'}
+            for resource in spec.resources:
+                if resource.kind == 'discrete':
+                    form[resource.input] = str(resource.ids[0])
+                elif resource.kind == 'pool':
+                    form[resource.input] = '1'
+                else:
+                    form[resource.input] = 'No'
+            return client.post(f'/add_{server_type}', data=form)
+        record_id = rng.choice(record_ids[server_type])
+        return client.post(f'/api/update_status_{server_type}/{record_id}', json={'status': 'Yes'})
+
+    def worker(count, worker_seed):
+        rng = random.Random(worker_seed)
+        client = flask_app.test_client()
+        local_samples = {label: [] for label in labels}
+        local_statuses = {label: {} for label in labels}
+        for label in rng.choices(labels, weights, k=count):
+            start = time.perf_counter()
+            response = request(client, label, rng)
+            local_samples[label].append(time.perf_counter() - start)
+            code = str(response.status_code)
+            local_statuses[label][code] = local_statuses[label].get(code, 0) + 1
+        with merge_lock:
+            for label in labels:
+                samples[label].extend(local_samples[label])
+                for code, n in local_statuses[label].items():
+                    statuses[label][code] = statuses[label].get(code, 0) + n
+
+    workers = [threading.Thread(target=worker, args=(count, seed + i)) for i, count in enumerate(per_thread)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {label: {**latency_stats(samples[label]), 'statuses': statuses[label]}
+                 for label in labels if samples[label]}
+    return {
+        'threads': threads,
+        'requests': total_requests,
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(total_requests / elapsed, 2),
+        'all': latency_stats([s for label in labels for s in samples[label]]),
+        'endpoints': endpoints,
+    }
+
+
+def run_size(count, args):
+    """在临时目录中生成 count 行/服务器的数据，启动新的 ServerManager 并运行微基准和压力测试"""
+    workdir = tempfile.mkdtemp(prefix=f'bench_app_{count}_')
+    os.chdir(workdir)
+    now = datetime.now()
+    server_types = list(SERVERS)
+
+    start = time.perf_counter()
+    for i, (server_type, spec) in enumerate(SERVERS.items()):
+        rows = generate_rows(spec, count, now, seed=i)
+        pd.DataFrame(rows, columns=spec.columns).to_excel(spec.excel_file, index=False)
+    seed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app_module.server_manager = None
+    app_module.create_app()
+    manager = app_module.server_manager
+    startup_seconds = time.perf_counter() - start
+
+    record_ids = {server_type: [record.get(ID_COLUMN) for record in manager.get_records(server_type)]
+                  for server_type in server_types}
+    micro = microbenchmarks(manager, server_types, args.repeat)
+    load = load_test(app_module.app, server_types, record_ids, args.threads, args.requests)
+    manager.backups.flush()
+    return {
+        'rows_per_server': count,
+        'seed_excel_s': round(seed_seconds, 3),
+        'startup_s': round(startup_seconds, 3),
+        'micro': micro,
+        'load': load,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metrics(result):
+    """把结果展开为 {指标名: 数值}，用于对比；数值越大越慢"""
+    metrics = {}
+    for size, data in result['sizes'].items():
+        metrics[f'{size} startup_s'] = data['startup_s']
+        for name, stats in data['micro'].items():
+            metrics[f'{size} {name} mean_ms'] = stats['mean_ms']
+            if 'p99_ms' in stats:
+                metrics[f'{size} {name} p99_ms'] = stats['p99_ms']
+        for label, stats in data['load']['endpoints'].items():
+            metrics[f'{size} {label} p50_ms'] = stats['p50_ms']
+            metrics[f'{size} {label} p99_ms'] = stats['p99_ms']
+        metrics[f'{size} 1/throughput'] = 1 / data['load']['throughput_rps']
+    return metrics
+
+
+def print_report(result):
+    for size, data in result['sizes'].items():
+        print(f'\n== 每台服务器 {size} 行：生成 .xlsx {data["seed_excel_s"]:.2f} s，启动 {data["startup_s"]:.2f} s')
+        print(f'{"方法":<44} {"mean ms":>10} {"p50 ms":>10} {"p99 ms":>10}')
+        for name, stats in data['micro'].items():
+            # 使用时间解析只有平均值
+            percentiles = ''.join(f' {stats[key]:10.4f}' if key in stats else f' {"-":>10}' for key in ('p50_ms', 'p99_ms'))
+            print(f'{name:<44} {stats["mean_ms"]:10.4f}{percentiles}')
+        load = data['load']
+        print(f'压力测试：{load["threads"]} 线程 {load["requests"]} 请求，{load["duration_s"]:.2f} s，'
+              f'{load["throughput_rps"]:.1f} 请求/秒')
+        print(f'{"接口":<44} {"count":>10} {"p50 ms":>10} {"p99 ms":>10}  状态码')
+        for label, stats in load['endpoints'].items():
+            print(f'{label:<44} {stats["count"]:10d} {stats["p50_ms"]:10.2f} {stats["p99_ms"]:10.2f}  {stats["statuses"]}')
+
+
+def print_comparison(result, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = _metrics(json.load(f))
+    current = _metrics(result)
+    print(f'\n== 与 {baseline_path} 对比（当前 / 基准，大于1表示变慢）')
+    for name, value in current.items():
+        if baseline.get(name):
+            ratio = value / baseline[name]
+            flag = '  <-- 变慢' if ratio > 1.2 else ''
+            print(f'{name:<64} {ratio:8.2f}{flag}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='服务器登记系统基准测试与压力测试')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='每台服务器的历史记录行数，逗号分隔')
+    parser.add_argument('--threads', type=int, default=8, help='压力测试的并发线程数')
+    parser.add_argument('--requests', type=int, default=2000, help='压力测试的总请求数')
+    parser.add_argument('--repeat', type=int, default=50, help='微基准每个方法的调用次数')
+    parser.add_argument('--backend', default=os.environ.get('STORAGE_BACKEND', 'sqlite'),
+                        help='存储后端（同 STORAGE_BACKEND）')
+    parser.add_argument('--output', help='把结果保存为 JSON')
+    parser.add_argument('--compare', help='与之前保存的 JSON 结果对比')
+    args = parser.parse_args()
+    # 每种规模在各自的临时目录中运行，先把路径转为绝对路径
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    os.environ['STORAGE_BACKEND'] = args.backend
+
+    result = {
+        'meta': {
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'backend': args.backend,
+            'threads': args.threads,
+            'requests': args.requests,
+            'repeat': args.repeat,
+        },
+        'sizes': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        result['sizes'][str(size)] = run_size(size, args)
+
+    print_report(result)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if compare:
+        print_comparison(result, compare)
+
+
+if __name__ == '__main__':
+    main()
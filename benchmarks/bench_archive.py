@@ -0,0 +1,120 @@
+"""归档：移出已完成的历史记录前后的对比
+
+生成 --rows 行最近一年的历史记录，分别在归档前后测量：从存储重新加载一台服务器（启动、其他进程写入后都要执行）、
+一次备份快照、逐条登记（try_reserve）的平均耗时，以及查询近期记录和查询一年前日期范围（读取归档月份）的耗时。
+登记日期早于 --days 天的已完成记录移入归档。每个存储后端在单独的子进程和临时目录中运行。
+
+用法：python benchmarks/bench_archive.py [--backends sqlite,excel-direct] [--rows 20000] [--days 30]
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVER = '9755'
+
+
+def timed(func, count=1):
+    """func 执行 count 次的平均毫秒数"""
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) / count * 1000
+
+
+def measure(manager, client, days, args):
+    from inventory import SERVER_COLUMNS
+
+    def reload(_):
+        with manager._write_transaction(SERVER):
+            manager._load_server(SERVER)
+
+    def query(path):
+        def request(_):
+            response = client.get(path)
+            assert response.status_code == 200, response.status_code
+        return request
+
+    year_ago = datetime.now() - timedelta(days=365)
+    old_range = f'/api/records/{SERVER}?from={year_ago:%Y.%m.%d}&to={year_ago + timedelta(days=30):%Y.%m.%d}&page=2'
+    return {
+        'live_rows': len(manager.get_records(SERVER)),
+        'reload_ms': timed(reload, 3),
+        'snapshot_ms': timed(lambda _: manager.backups.snapshot(SERVER, SERVER_COLUMNS[SERVER], manager.get_records(SERVER)), 3),
+        'reserve_ms': timed(lambda _: manager.try_reserve(SERVER, booking(next(days))), args.writes),
+        'recent_ms': timed(query(f'/api/records/{SERVER}?page=2'), 20),
+        'old_range_ms': timed(query(old_range), 20),
+    }
+
+
+def booking(day_offset):
+    from bench_writes import booking as make_booking
+    from inventory import SERVERS
+    return make_booking(SERVERS[SERVER], day_offset)
+
+
+def run(backend, args):
+    """在子进程中运行：STORAGE_BACKEND、ARCHIVE_AFTER_DAYS 由环境变量给出"""
+    os.chdir(tempfile.mkdtemp(prefix=f'bench_archive_{backend}_'))
+    import app as app_module
+    from bench_app import generate_rows
+    from inventory import SERVERS
+
+    now = datetime.now()
+    for spec in SERVERS.values():
+        pd.DataFrame(generate_rows(spec, args.rows, now), columns=spec.columns).to_excel(spec.excel_file, index=False)
+    app_module.create_app()
+    manager = app_module.server_manager
+    client = app_module.app.test_client()
+    days = itertools.count(1000)
+
+    result = {'before': measure(manager, client, days, args)}
+    start = time.perf_counter()
+    result['archived'] = manager.archive_completed(SERVER)
+    result['archive_ms'] = (time.perf_counter() - start) * 1000
+    result['after'] = measure(manager, client, days, args)
+    manager.backups.flush()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='归档前后的对比')
+    parser.add_argument('--backends', default='sqlite,excel-direct', help='存储后端，逗号分隔')
+    parser.add_argument('--rows', type=int, default=20000, help='每台服务器的历史记录数（最近一年）')
+    parser.add_argument('--days', type=int, default=30, help='登记日期早于该天数的已完成记录移入归档')
+    parser.add_argument('--writes', type=int, default=20, help='逐条登记的次数')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run(args.run, args)))
+        return
+
+    print(f'{args.rows} 行历史记录，归档 {args.days} 天以前的已完成记录')
+    print(f'{"后端":<14} {"":<6} {"存储中行数":>10} {"重新加载ms":>10} {"备份ms":>8} {"登记ms":>8} {"近期查询ms":>10} {"一年前查询ms":>12}')
+    for backend in args.backends.split(','):
+        # 归档只在测量中手动执行
+        env = dict(os.environ, STORAGE_BACKEND=backend, ARCHIVE_AFTER_DAYS=str(args.days), ARCHIVE_INTERVAL='0')
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', backend, '--rows', str(args.rows),
+                                 '--writes', str(args.writes)],
+                                env=env, capture_output=True, text=True, check=True)
+        # 后台线程退出时可能还有输出，取最后一个 JSON 行
+        result = json.loads([line for line in output.stdout.splitlines() if line.startswith('{')][-1])
+        for name in ('before', 'after'):
+            r = result[name]
+            print(f'{backend:<14} {"归档前" if name == "before" else "归档后":<6} {r["live_rows"]:10d} {r["reload_ms"]:10.1f} '
+                  f'{r["snapshot_ms"]:8.1f} {r["reserve_ms"]:8.2f} {r["recent_ms"]:10.2f} {r["old_range_ms"]:12.2f}')
+        print(f'{"":<14} 移入归档 {result["archived"]} 行，耗时 {result["archive_ms"]:.0f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""长连接：异步入口与同步部署对比
+
+分别启动异步入口（uvicorn asgi:app）和同步部署（wsgi.py 的 Flask 应用，多线程开发服务器），
+建立 --sse 个资源看板的 SSE 连接和 --polls 个长轮询（/api/records/<服务器>?since=&wait=），
+报告连接空闲时服务器进程的线程数和常驻内存，再登记一条记录，报告全部连接收到通知所需的时间。
+每种部署在单独的子进程和临时目录中运行，异步入口需要安装 starlette、uvicorn、a2wsgi。
+
+用法：python benchmarks/bench_async.py [--modes asgi,wsgi] [--sse 300] [--polls 100]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = '9755'
+PORT = 8765
+COMMANDS = {
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(PORT), '--log-level', 'warning'],
+    'wsgi': [sys.executable, '-c', f'from wsgi import app; app.run(port={PORT}, threaded=True)'],
+}
+
+
+def process_stats(pid):
+    """(线程数, 常驻内存 MB)，读取 /proc"""
+    fields = dict(line.split(':', 1) for line in open(f'/proc/{pid}/status'))
+    return int(fields['Threads']), int(fields['VmRSS'].split()[0]) / 1024
+
+
+def url(path):
+    return f'http://127.0.0.1:{PORT}{path}'
+
+
+async def sse(ready, notified, start):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    writer.write(b'GET /api/resources/stream HTTP/1.1\r\nHost: bench\r\n\r\n')
+    await writer.drain()
+    events = 0
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b'data:'):
+                events += 1
+                if events == 1:
+                    ready.append(1)
+                elif events == 2:
+                    notified.append(time.perf_counter() - start[0])
+    finally:
+        writer.close()
+
+
+async def poll(version, wait, notified, start):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    writer.write(f'GET /api/records/{SERVER}?since={version}&wait={wait} HTTP/1.1\r\n'
+                 f'Host: bench\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    await reader.read()
+    notified.append(time.perf_counter() - start[0])
+    writer.close()
+
+
+async def measure(pid, args):
+    version = json.load(urllib.request.urlopen(url(f'/api/records/{SERVER}?since=0')))['version']
+    idle_threads, idle_rss = process_stats(pid)
+    ready, sse_notified, poll_notified, start = [], [], [], [float('inf')]
+    streams = [asyncio.create_task(sse(ready, sse_notified, start)) for _ in range(args.sse)]
+    polls = [asyncio.create_task(poll(version, 60, poll_notified, start)) for _ in range(args.polls)]
+    deadline = time.monotonic() + 30
+    while len(ready) < args.sse and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    await asyncio.sleep(1)
+    threads, rss = process_stats(pid)
+
+    form = urllib.parse.urlencode({'time': '2100-01-01 00:00:00', 'name': 'bench', 'nodes': '1', 'gpu': 'No',
+                                   'remote': 'No', 'task_type': 'bench', 'estimated_time': '2100.1.1~2100.1.2'}).encode()
+    start[0] = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(None, urllib.request.urlopen, url(f'/add_{SERVER}'), form)
+    await asyncio.wait_for(asyncio.gather(*polls), 30)
+    while len(sse_notified) < len(ready) and time.perf_counter() - start[0] < 30:
+        await asyncio.sleep(0.05)
+    for task in streams:
+        task.cancel()
+    notified = sse_notified + poll_notified
+    return {
+        'connected': len(ready) + args.polls,
+        'idle_threads': idle_threads, 'idle_rss_mb': idle_rss,
+        'threads': threads, 'rss_mb': rss,
+        'notified': len(notified),
+        'notify_ms': max(notified) * 1000 if notified else None,
+    }
+
+
+def run(mode, args):
+    """启动服务器、测量、停止；服务器在临时目录中运行"""
+    directory = tempfile.mkdtemp(prefix=f'bench_async_{mode}_')
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    server = subprocess.Popen(COMMANDS[mode], cwd=directory, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(url('/api/resources'))
+                break
+            except OSError:
+                time.sleep(0.2)
+        return asyncio.run(measure(server.pid, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='长连接：异步入口与同步部署对比')
+    parser.add_argument('--modes', default='asgi,wsgi', help='部署方式，逗号分隔')
+    parser.add_argument('--sse', type=int, default=300, help='SSE 连接数')
+    parser.add_argument('--polls', type=int, default=100, help='长轮询连接数')
+    args = parser.parse_args()
+
+    print(f'{args.sse} 个 SSE 连接 + {args.polls} 个长轮询')
+    print(f'{"部署":<6} {"已连接":>6} {"空闲线程":>8} {"连接后线程":>10} {"空闲MB":>8} {"连接后MB":>8} {"收到通知":>8} {"通知ms":>8}')
+    for mode in args.modes.split(','):
+        r = run(mode, args)
+        notify = f'{r["notify_ms"]:8.1f}' if r['notify_ms'] is not None else f'{"-":>8}'
+        print(f'{mode:<6} {r["connected"]:6d} {r["idle_threads"]:8d} {r["threads"]:10d} {r["idle_rss_mb"]:8.1f} '
+              f'{r["rss_mb"]:8.1f} {r["notified"]:8d} {notify}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""批量导入与流式导出
+
+生成 --rows 行已完成的历史记录（CSV），分别用逐条登记（每条一次 try_reserve，与登记表单相同）和
+/api/records/<服务器>/bulk 批量导入，报告每秒导入的行数和存储写入次数；再流式导出为 CSV、JSONL，
+报告导出速度和导出期间的内存峰值（tracemalloc）。每个存储后端在单独的子进程和临时目录中运行。
+
+用法：python benchmarks/bench_bulk.py [--backends sqlite,excel] [--rows 20000] [--single 200]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402
+from bench_app import generate_rows  # noqa: E402
+from bench_writes import storage_writes  # noqa: E402
+from inventory import SERVERS  # noqa: E402
+
+SERVER = '9755'
+
+
+def history_csv(spec, rows):
+    """已完成的历史记录，CSV 内容（bytes）"""
+    buffer = io.StringIO()
+    columns = [column for column in spec.columns if column != '记录ID']
+    writer = csv.DictWriter(buffer, columns, extrasaction='ignore')
+    writer.writeheader()
+    for row in generate_rows(spec, rows, datetime.now()):
+        row.update({'是否完成': 'Yes', '实际使用时间': row['实际使用时间'] or '1小时'})
+        writer.writerow(row)
+    return buffer.getvalue().encode('utf-8')
+
+
+def run(backend, args):
+    """在子进程中运行：STORAGE_BACKEND 由环境变量给出"""
+    os.chdir(tempfile.mkdtemp(prefix=f'bench_bulk_{backend}_'))
+    spec = SERVERS[SERVER]
+    app_module.create_app()
+    manager = app_module.server_manager
+    client = app_module.app.test_client()
+    result = {}
+
+    rows = list(csv.DictReader(io.StringIO(history_csv(spec, args.single).decode('utf-8'))))
+    writes_before = storage_writes(backend)
+    start = time.perf_counter()
+    for row in rows:
+        assert not manager.try_reserve(SERVER, row)
+    elapsed = time.perf_counter() - start
+    result['single'] = {'rows': len(rows), 'per_second': len(rows) / elapsed,
+                        'storage_writes': storage_writes(backend) - writes_before}
+
+    body = history_csv(spec, args.rows)
+    writes_before = storage_writes(backend)
+    start = time.perf_counter()
+    response = client.post(f'/api/records/{SERVER}/bulk?format=csv', data=body)
+    elapsed = time.perf_counter() - start
+    payload = response.get_json()
+    assert response.status_code == 200 and payload['imported'] == args.rows, payload
+    result['bulk'] = {'rows': args.rows, 'per_second': args.rows / elapsed,
+                      'storage_writes': storage_writes(backend) - writes_before}
+
+    total = len(manager.get_records(SERVER))
+    for fmt in ('csv', 'jsonl'):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(f'/api/records/{SERVER}/bulk?format={fmt}')
+        size = sum(len(part) for part in response.response)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result[f'export_{fmt}'] = {'rows': total, 'per_second': total / elapsed, 'mb': size / 1e6, 'peak_mb': peak / 1e6}
+    manager.backups.flush()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量导入与流式导出')
+    parser.add_argument('--backends', default='sqlite,excel', help='存储后端，逗号分隔')
+    parser.add_argument('--rows', type=int, default=20000, help='批量导入的行数')
+    parser.add_argument('--single', type=int, default=200, help='逐条登记的行数')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run(args.run, args)))
+        return
+
+    print(f'批量导入 {args.rows} 行，逐条登记 {args.single} 行')
+    print(f'{"后端":<10} {"方式":<12} {"行/秒":>10} {"存储写入":>8} {"输出MB":>8} {"内存峰值MB":>10}')
+    for backend in args.backends.split(','):
+        env = dict(os.environ, STORAGE_BACKEND=backend)
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', backend,
+                                 '--rows', str(args.rows), '--single', str(args.single)],
+                                env=env, capture_output=True, text=True, check=True)
+        # 后台线程退出时可能还有输出，取最后一个 JSON 行
+        result = json.loads([line for line in output.stdout.splitlines() if line.startswith('{')][-1])
+        for name in ('single', 'bulk'):
+            print(f'{backend:<10} {name:<12} {result[name]["per_second"]:10.1f} {result[name]["storage_writes"]:8d}')
+        for name in ('export_csv', 'export_jsonl'):
+            print(f'{backend:<10} {name:<12} {result[name]["per_second"]:10.1f} {"":>8} '
+                  f'{result[name]["mb"]:8.1f} {result[name]["peak_mb"]:10.1f}')
+        print(f'{"":<10} 导入 {result["bulk"]["per_second"] / result["single"]["per_second"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
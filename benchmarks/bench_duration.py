@@ -0,0 +1,127 @@
+"""使用时间解析的性能对比
+
+对比原 ServerManager._parse_time_duration（逐个 re.search）与 duration 模块中的
+单值解析（带/不带 LRU 缓存）和整列向量化解析，输入为 10 万条混合格式字符串。
+
+用法：python benchmarks/bench_duration.py [--count 100000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from duration import _parse_text, parse_duration_column, parse_duration_hours  # noqa: E402
+
+
+def legacy_parse_time_duration(time_str):
+    """原 ServerManager._parse_time_duration 的实现，作为基准"""
+    if not time_str or pd.isna(time_str):
+        return 0
+
+    time_str = str(time_str).strip().lower()
+
+    date_range_patterns = [
+        r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})\s*[~\-到至]\s*(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})',
+        r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})\s*[~\-到至]\s*(\d{1,2})[.\-/](\d{1,2})',
+    ]
+
+    for pattern in date_range_patterns:
+        match = re.search(pattern, time_str)
+        if match:
+            try:
+                groups = match.groups()
+                if len(groups) == 6:
+                    start_year, start_month, start_day, end_year, end_month, end_day = groups
+                    start_date = datetime(int(start_year), int(start_month), int(start_day))
+                    end_date = datetime(int(end_year), int(end_month), int(end_day))
+                else:
+                    start_year, start_month, start_day, end_month, end_day = groups
+                    start_date = datetime(int(start_year), int(start_month), int(start_day))
+                    end_date = datetime(int(start_year), int(end_month), int(end_day))
+
+                delta = end_date - start_date
+                return max(delta.days * 24, 24)
+            except (ValueError, TypeError):
+                continue
+
+    single_date_pattern = r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})'
+    match = re.search(single_date_pattern, time_str)
+    if match:
+        return 24
+
+    time_unit_patterns = [
+        (r'(\d+(?:\.\d+)?)\s*小时', 1),
+        (r'(\d+(?:\.\d+)?)\s*h', 1),
+        (r'(\d+(?:\.\d+)?)\s*hour', 1),
+        (r'(\d+(?:\.\d+)?)\s*天', 24),
+        (r'(\d+(?:\.\d+)?)\s*day', 24),
+        (r'(\d+(?:\.\d+)?)\s*分钟', 1/60),
+        (r'(\d+(?:\.\d+)?)\s*min', 1/60),
+        (r'(\d+(?:\.\d+)?)\s*minute', 1/60),
+    ]
+
+    for pattern, multiplier in time_unit_patterns:
+        match = re.search(pattern, time_str)
+        if match:
+            return float(match.group(1)) * multiplier
+
+    try:
+        return float(time_str)
+    except ValueError:
+        return 0
+
+
+def generate_inputs(count, seed=42):
+    """生成覆盖各种格式的测试字符串"""
+    rng = random.Random(seed)
+    generators = [
+        lambda: f'2025.{rng.randint(1, 12)}.{rng.randint(1, 28)}~2025.{rng.randint(1, 12)}.{rng.randint(1, 28)}',
+        lambda: f'2025.{rng.randint(1, 12)}.{rng.randint(1, 28)}~{rng.randint(1, 12)}.{rng.randint(1, 28)}',
+        lambda: f'{rng.randint(1, 14)}天',
+        lambda: f'{rng.randint(1, 600)}min',
+        lambda: f'{rng.randint(1, 72)}小时',
+        lambda: f'{rng.randint(1, 48)}h',
+        lambda: str(rng.randint(1, 100)),
+        lambda: f'{rng.randint(1, 10) / 2}',
+    ]
+    return [rng.choice(generators)() for _ in range(count)]
+
+
+def timed(label, func, results):
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    results.append((label, elapsed))
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用时间解析的性能对比')
+    parser.add_argument('--count', type=int, default=100_000, help='输入字符串的条数')
+    args = parser.parse_args()
+    inputs = generate_inputs(args.count)
+    results = []
+
+    expected = timed('legacy re.search', lambda: [legacy_parse_time_duration(v) for v in inputs], results)
+    _parse_text.cache_clear()
+    timed('tokenizer (cold cache)', lambda: [parse_duration_hours(v) for v in inputs], results)
+    scalar = timed('tokenizer (warm cache)', lambda: [parse_duration_hours(v) for v in inputs], results)
+    column = timed('vectorized column', lambda: parse_duration_column(pd.Series(inputs)), results)
+
+    mismatches = sum(1 for a, b, c in zip(expected, scalar, column) if abs(a - b) > 1e-9 or abs(a - c) > 1e-9)
+
+    baseline = results[0][1]
+    print(f'{args.count} 条输入，{len(set(inputs))} 种不同字符串，结果不一致 {mismatches} 条')
+    for label, elapsed in results:
+        print(f'{label:<24} {elapsed * 1000:10.1f} ms  {baseline / elapsed:6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
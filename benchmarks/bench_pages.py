@@ -0,0 +1,86 @@
+"""页面渲染：数据不变时的重复访问与每次登记后的访问
+
+生成 --rows 行历史记录后，用 Flask 测试客户端（不带 If-None-Match，模拟没有浏览器缓存的访问）
+分别计时：数据不变时重复访问服务器页面、滚动加载的下一页（format=html）、资源概览页；
+每次登记一条记录后访问一次服务器页面。报告每次请求的平均耗时和响应大小（带 Accept-Encoding 时为压缩后的大小）。
+
+用法：python benchmarks/bench_pages.py [--rows 10000] [--requests 200] [--writes 50] [--backend sqlite]
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVER = '9755'
+
+
+def timed_requests(client, path, count, headers, before=None):
+    """请求 count 次，返回 (平均毫秒, 最后一次响应的字节数, 压缩方式)；before 在每次请求前调用（不计时）"""
+    elapsed = 0.0
+    size = 0
+    encoding = '-'
+    for i in range(count):
+        if before is not None:
+            before(i)
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        elapsed += time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+        size = len(response.data)
+        encoding = response.headers.get('Content-Encoding', '-')
+    return elapsed / count * 1000, size, encoding
+
+
+def main():
+    parser = argparse.ArgumentParser(description='页面渲染：重复访问与登记后的访问')
+    parser.add_argument('--rows', type=int, default=10000, help='每台服务器已有的记录数')
+    parser.add_argument('--requests', type=int, default=200, help='数据不变时每个页面的请求数')
+    parser.add_argument('--writes', type=int, default=50, help='登记后访问的次数')
+    parser.add_argument('--backend', default='sqlite', help='存储后端')
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix='bench_pages_'))
+    os.environ['STORAGE_BACKEND'] = args.backend
+    import app as app_module
+    from bench_app import generate_rows
+    from bench_writes import booking
+    from inventory import SERVERS
+
+    now = datetime.now()
+    for spec in SERVERS.values():
+        pd.DataFrame(generate_rows(spec, args.rows, now), columns=spec.columns).to_excel(spec.excel_file, index=False)
+    app_module.create_app()
+    manager = app_module.server_manager
+    client = app_module.app.test_client()
+    spec = SERVERS[SERVER]
+
+    days = itertools.count(1000)
+
+    def write(_):
+        assert not manager.try_reserve(SERVER, booking(spec, next(days)))
+
+    print(f'{args.rows} 行，{args.backend} 后端')
+    print(f'{"页面":<28} {"编码":<6} {"ms/请求":>10} {"字节":>10}')
+    cases = [
+        ('服务器页面', f'/{SERVER}', args.requests, None),
+        ('滚动加载 page=2', f'/api/records/{SERVER}?page=2&format=html', args.requests, None),
+        ('资源概览', '/', args.requests, None),
+        ('登记后的服务器页面', f'/{SERVER}', args.writes, write),
+    ]
+    for label, path, count, before in cases:
+        for encoding in ('', 'gzip, br'):
+            headers = {'Accept-Encoding': encoding} if encoding else {}
+            ms, size, used = timed_requests(client, path, count, headers, before)
+            print(f'{label:<24} {used:<6} {ms:10.2f} {size:10d}')
+
+
+if __name__ == '__main__':
+    main()
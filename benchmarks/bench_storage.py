@@ -0,0 +1,102 @@
+"""存储后端冷启动性能对比
+
+分别用 Excel、SQLite 和 Feather 后端保存同一份记录，然后在新的存储对象上计时 init_server + load_typed，
+以及再由 records_from_frame 转换为 Record（Feather 取用文件中的类型化列，其他后端解析文本），
+即 ServerManager 启动或重新加载一台服务器所需的读取时间。
+
+用法：python benchmarks/bench_storage.py [--rows 20000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inventory import SERVER_COLUMNS  # noqa: E402
+from records import records_from_frame  # noqa: E402
+from storage import ExcelStorage, FeatherStorage, SQLiteStorage  # noqa: E402
+
+SERVER = '9755'
+
+
+def generate_records(count, seed=42):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        day = rng.randint(1, 28)
+        records.append({
+            '时间': f'2025-06-{day:02d} {rng.randint(0, 23):02d}:00:00',
+            '姓名': f'user{rng.randint(1, 30)}',
+            '占用节点': ','.join(str(n) for n in sorted(rng.sample(range(4), rng.randint(1, 2)))),
+            '占用GPU': rng.choice(['No', '0', '1']),
+            '是否使用远程桌面': rng.choice(['Yes', 'No']),
+            '任务类型': rng.choice(['vasp', 'gaussian', 'lammps']),
+            '预计使用时间': f'2025.6.{day}~2025.6.{min(day + rng.randint(0, 3), 28)}',
+            '实际使用时间': f'{rng.randint(1, 72)}小时',
+            '是否完成': 'Yes' if i < count - 10 else '',
+        })
+    return records
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='存储后端冷启动性能对比')
+    parser.add_argument('--rows', type=int, default=20_000, help='记录条数')
+    args = parser.parse_args()
+    count = args.rows
+    records = generate_records(count)
+    columns = SERVER_COLUMNS[SERVER]
+    workdir = tempfile.mkdtemp()
+    excel_file = os.path.join(workdir, f'{SERVER}_records.xlsx')
+    pd.DataFrame(records, columns=columns).to_excel(excel_file, index=False)
+
+    db_path = os.path.join(workdir, 'records.db')
+    sqlite = SQLiteStorage(db_path)
+    sqlite.init_server(SERVER, columns)
+    sqlite.write_batch(SERVER, [('append', record) for record in records])
+
+    feather_dir = os.path.join(workdir, 'data')
+    FeatherStorage(feather_dir, legacy_files={SERVER: excel_file},
+                   journal_dir=os.path.join(workdir, 'journal')).init_server(SERVER, columns)
+
+    def cold_load(make_storage):
+        def run():
+            storage = make_storage()
+            storage.init_server(SERVER, columns)
+            df, typed = storage.load_typed(SERVER)
+            start = time.perf_counter()
+            records_from_frame(df, typed=typed)
+            return df, time.perf_counter() - start
+        return run
+
+    backends = [
+        ('excel (openpyxl)', cold_load(lambda: ExcelStorage({SERVER: excel_file}))),
+        ('sqlite', cold_load(lambda: SQLiteStorage(db_path))),
+        ('feather (mmap)', cold_load(lambda: FeatherStorage(
+            feather_dir, legacy_files={SERVER: excel_file}, journal_dir=os.path.join(workdir, 'journal')))),
+    ]
+    results = [(label, *timed(func, repeat=1 if label.startswith('excel') else 3)) for label, func in backends]
+
+    baseline = results[0][1]
+    print(f'{count} 条记录，冷启动 init_server + load_typed + records_from_frame（括号内为 records_from_frame）')
+    for label, elapsed, (df, convert) in results:
+        print(f'{label:<18} {elapsed * 1000:10.1f} ms  {baseline / elapsed:7.1f}x  '
+              f'({convert * 1000:.1f} ms, {len(df)} 行)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""突发写入的吞吐量：组提交与逐个提交对比
+
+模拟组会时大家同时登记：多个线程同时调用 ServerManager.try_reserve 登记互不冲突的预约，
+分别在开启（默认）和关闭组提交（GROUP_COMMIT=0）时计时，报告每秒登记数、存储写入次数和请求延迟。
+每种配置在单独的子进程和临时目录中运行。
+
+用法：python benchmarks/bench_writes.py [--backends sqlite,excel,excel-direct] [--threads 32] [--writes 320] [--rows 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import app as app_module  # noqa: E402
+from bench_app import BOOKING_BASE, generate_rows  # noqa: E402
+from inventory import SERVERS  # noqa: E402
+
+SERVER = '5520'
+
+
+def booking(spec, day_offset):
+    """day_offset 天的一天预约，各资源只占最少的量"""
+    day = BOOKING_BASE + timedelta(days=day_offset)
+    end = day + timedelta(days=1)
+    data = {'时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), '姓名': 'bench', '任务类型': 'bench',
+            '预计使用时间': f'{day.year}.{day.month}.{day.day}~{end.year}.{end.month}.{end.day}',
+            '实际使用时间': '', '是否完成': ''}
+    for resource in spec.resources:
+        if resource.kind == 'discrete':
+            data[resource.field] = str(resource.ids[0])
+        elif resource.kind == 'pool':
+            data[resource.field] = '1'
+        else:
+            data[resource.field] = 'No'
+    return data
+
+
+def storage_writes(backend):
+    """到目前为止存储后端的写入调用次数（write_batch，不含其内部调用）"""
+    samples = dict(app_module.STORAGE_SECONDS._samples())
+    return samples.get((backend, 'write_batch'), [None, 0, 0])[2]
+
+
+def run(backend, args):
+    """在子进程中运行：STORAGE_BACKEND 和 GROUP_COMMIT 由环境变量给出"""
+    os.chdir(tempfile.mkdtemp(prefix=f'bench_writes_{backend}_'))
+    spec = SERVERS[SERVER]
+    now = datetime.now()
+    for other in SERVERS.values():
+        pd.DataFrame(generate_rows(other, args.rows, now), columns=other.columns).to_excel(other.excel_file, index=False)
+    app_module.create_app()
+    manager = app_module.server_manager
+
+    per_thread = args.writes // args.threads
+    barrier = threading.Barrier(args.threads)
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = []
+        barrier.wait()
+        for i in range(per_thread):
+            data = booking(spec, index * per_thread + i)
+            start = time.perf_counter()
+            errors = manager.try_reserve(SERVER, data)
+            local.append(time.perf_counter() - start)
+            if errors:
+                failures.append(errors)
+        with lock:
+            latencies.extend(local)
+
+    writes_before = storage_writes(backend)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    manager.backups.flush()
+
+    total = per_thread * args.threads
+    assert not failures, failures[:3]
+    assert len(manager.get_records(SERVER)) == args.rows + total
+    values = np.array(latencies) * 1000
+    return {
+        'writes': total,
+        'seconds': elapsed,
+        'per_second': total / elapsed,
+        'storage_writes': storage_writes(backend) - writes_before,
+        'p50_ms': float(np.percentile(values, 50)),
+        'p99_ms': float(np.percentile(values, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='突发写入吞吐量：组提交与逐个提交对比')
+    parser.add_argument('--backends', default='sqlite,excel,excel-direct', help='存储后端，逗号分隔')
+    parser.add_argument('--threads', type=int, default=32, help='同时登记的线程数')
+    parser.add_argument('--writes', type=int, default=320, help='登记总数')
+    parser.add_argument('--rows', type=int, default=1000, help='每台服务器已有的记录数')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run(args.run, args)))
+        return
+
+    print(f'{args.threads} 线程同时登记 {args.writes} 条，已有 {args.rows} 行')
+    print(f'{"后端":<14} {"组提交":<6} {"登记/秒":>10} {"存储写入":>8} {"p50 ms":>10} {"p99 ms":>10}')
+    for backend in args.backends.split(','):
+        results = {}
+        for group_commit in (False, True):
+            env = dict(os.environ, STORAGE_BACKEND=backend, GROUP_COMMIT='1' if group_commit else '0')
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', backend,
+                                     '--threads', str(args.threads), '--writes', str(args.writes),
+                                     '--rows', str(args.rows)], env=env, capture_output=True, text=True, check=True)
+            result = results[group_commit] = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f'{backend:<14} {"开" if group_commit else "关":<6} {result["per_second"]:10.1f} '
+                  f'{result["storage_writes"]:8d} {result["p50_ms"]:10.2f} {result["p99_ms"]:10.2f}')
+        print(f'{"":<14} 吞吐量 {results[True]["per_second"] / results[False]["per_second"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""批量导入与导出
+
+管理员合并或补录使用记录时，原来只能经登记表单逐条提交。/api/records/<服务器>/bulk 接受 CSV、JSONL、XLSX 文件：
+- 读取：逐行流式解析（read_rows），按 CHUNK_ROWS 行分块（chunks），内存占用与文件大小无关；
+  XLSX 是 zip 格式，需要可随机访问的文件，以 openpyxl 只读模式逐行读取
+- 检查：每块按列向量化检查一次（validate_chunk），必填项、完成状态、资源取值格式和编号，格式错误的行不导入
+- 写入：每块在一个写事务中检查资源冲突并登记，一次写入存储（见 ServerManager.import_records），
+  块与块之间其他请求的写操作照常进行
+
+导出（export_rows）以生成器逐块产生 CSV 或 JSONL，不在内存中拼出整个文件。
+列名与记录文件相同，导出的文件可以直接导入；记录ID已存在的行视为重复并跳过，重复导入同一文件不会产生重复记录。
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from duration import parse_duration_column
+from inventory import ID_COLUMN
+from storage import to_text
+
+CHUNK_ROWS = int(os.environ.get('BULK_CHUNK_ROWS', 1000))
+FORMATS = ('csv', 'jsonl', 'xlsx')
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+REQUIRED_COLUMNS = ('时间', '姓名', '预计使用时间')
+COMPLETED_VALUES = ('', 'Yes', 'No')
+
+_DATE_PATTERN = r'\d{4}[.\-/]\d{1,2}[.\-/]\d{1,2}'
+
+
+def detect_format(filename='', content_type=''):
+    """按文件扩展名或 Content-Type 判断格式，无法判断时返回 None"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('ndjson', 'json'):
+        extension = 'jsonl'
+    if extension in FORMATS:
+        return extension
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    for fmt, known in CONTENT_TYPES.items():
+        if content_type == known.split(';')[0]:
+            return fmt
+    if content_type in ('application/jsonl', 'application/json-lines'):
+        return 'jsonl'
+    return None
+
+
+def _lines(stream, encoding, block_size=64 * 1024):
+    """按块读取并解码，逐行产生文本（保留换行符）
+
+    请求体是未缓冲的流，逐行读取时每次只读一个字节；只按 \\n 分行，字段中的其他换行符不受影响
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    while True:
+        block = stream.read(block_size)
+        lines = (pending + decoder.decode(block, final=not block)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if not block:
+            if pending:
+                yield pending
+            return
+
+
+def read_rows(stream, fmt, encoding='utf-8-sig'):
+    """逐行读取上传的文件，产生 {列名: 文本}；第一行（JSONL 为各行的键）为列名，空行跳过
+
+    格式错误（无法解码、JSON 不是对象等）时抛出 ValueError
+    """
+    try:
+        if fmt == 'csv':
+            reader = csv.reader(_lines(stream, encoding))
+            header = [column.strip() for column in next(reader, [])]
+            for values in reader:
+                if any(value.strip() for value in values):
+                    yield dict(zip(header, values))
+        elif fmt == 'jsonl':
+            for number, line in enumerate(_lines(stream, encoding), 1):
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError(f'第 {number} 行不是 JSON 对象')
+                yield {str(key).strip(): to_text(value) for key, value in row.items()}
+        elif fmt == 'xlsx':
+            from openpyxl import load_workbook
+            try:
+                workbook = load_workbook(stream, read_only=True, data_only=True)
+            except (zipfile.BadZipFile, KeyError, OSError) as e:
+                raise ValueError(f'不是有效的 xlsx 文件: {e}')
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = [to_text(column).strip() for column in next(rows, ())]
+                for values in rows:
+                    texts = [to_text(value) for value in values]
+                    if any(text.strip() for text in texts):
+                        yield dict(zip(header, texts))
+            finally:
+                workbook.close()
+        else:
+            raise ValueError(f'不支持的格式 {fmt}，可用 {"、".join(FORMATS)}')
+    except UnicodeDecodeError:
+        raise ValueError(f'文件不是 {"UTF-8" if encoding == "utf-8-sig" else encoding} 编码，可用 encoding 参数指定（如 gbk）')
+    except json.JSONDecodeError as e:
+        raise ValueError(f'JSON 格式错误: {e}')
+
+
+def chunks(rows, size=CHUNK_ROWS):
+    """把逐行产生的记录分为每块最多 size 行的列表"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def check_columns(spec, row):
+    """检查文件的列名（取第一行的键），缺少必填列或有未知列时抛出 ValueError"""
+    missing = [column for column in REQUIRED_COLUMNS if column not in row]
+    if missing:
+        raise ValueError(f'缺少列: {"、".join(missing)}')
+    unknown = [column for column in row if column not in spec.columns]
+    if unknown:
+        raise ValueError(f'未知的列: {"、".join(unknown)}，{spec.name} 的列为 {"、".join(spec.columns)}')
+
+
+def _blank(series):
+    return series.str.strip() == ''
+
+
+def _resource_errors(resource, values):
+    """一项资源的取值是否有效（布尔数组）与错误说明；与登记时相同，按资源的 parse/is_invalid 判断，
+    每个不同的取值只解析一次"""
+    bad = [value for value in values.unique() if resource.is_invalid(resource.parse(value))]
+    return ~values.isin(bad).to_numpy(), resource.format_error()
+
+
+def validate_chunk(spec, rows):
+    """按列向量化检查一块记录，返回 (有效的行, 预计使用小时数, {块内序号: [错误说明]})
+
+    有效的行为 DataFrame，包含服务器的全部列（缺少的列为空串），索引为块内序号；
+    预计使用小时数与之一一对应，可直接传给 records_from_frame
+    """
+    errors = {}
+    # JSONL 各行的键可以不同，逐行检查未知的列
+    known = set(spec.columns)
+    for position, row in enumerate(rows):
+        unknown = [column for column in row if column not in known]
+        if unknown:
+            errors[position] = [f'未知的列: {"、".join(unknown)}']
+    df = pd.DataFrame([[to_text(row.get(column)) for column in spec.columns] for row in rows],
+                      columns=spec.columns, dtype=object)
+    checks = [
+        (_blank(df['时间']).to_numpy(), '缺少时间'),
+        (_blank(df['姓名']).to_numpy(), '缺少姓名'),
+        (~_blank(df['时间']).to_numpy() & ~df['时间'].str.contains(_DATE_PATTERN).to_numpy(), '时间中没有日期'),
+        (~df['是否完成'].str.strip().isin(COMPLETED_VALUES).to_numpy(), '是否完成只能是 Yes、No 或空'),
+    ]
+    # 未完成的记录占用资源，需要能算出预约时间段
+    pending = df['是否完成'].str.strip().to_numpy() != 'Yes'
+    hours = parse_duration_column(df['预计使用时间'])
+    checks.append((pending & ~(hours > 0), '未完成的记录需要有效的预计使用时间'))
+    for resource in spec.resources:
+        valid, message = _resource_errors(resource, df[resource.field])
+        checks.append((~valid, message))
+
+    for failed, message in checks:
+        for position in np.flatnonzero(failed):
+            errors.setdefault(int(position), []).append(message)
+    df['是否完成'] = df['是否完成'].str.strip()
+    df[ID_COLUMN] = df[ID_COLUMN].str.strip()
+    valid = np.ones(len(df), dtype=bool)
+    valid[list(errors)] = False
+    return df[valid], hours[valid], errors
+
+
+def export_rows(columns, records, fmt, size=CHUNK_ROWS):
+    """逐块产生导出文件的内容（bytes），records 为 Record 的可迭代对象"""
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')  # 让 Excel 按 UTF-8 打开
+        writer.writerow(columns)
+    count = 0
+    for record in records:
+        values = [to_text(record.get(column, '')) for column in columns]
+        if fmt == 'csv':
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+            buffer.write('\n')
+        count += 1
+        if count % size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,114 @@
+"""进程内缓存
+
+LRUCache 是有界的 LRU：每个条目带估计的字节数，总量超过上限时淘汰最久未使用的条目。
+- 版本号：put 时可记录数据版本号，get 时版本号不一致视为未命中并删除条目
+- 依赖标签：条目可依赖若干标签，invalidate(标签) 作废依赖它的全部条目；
+  标签之间可用 depend(派生标签, 上游标签) 声明依赖，作废上游标签时连带作废派生标签，
+  例如 ('records', '9755') 依赖 ('data', '9755')：重新加载时作废 data，依赖记录的导出缓存也随之作废
+
+作废由写入事件驱动（ServerManager 在写入和重新加载时调用 invalidate），不按时间过期，也不检查文件修改时间。
+"""
+import threading
+from collections import OrderedDict
+
+from metrics import Gauge
+
+_CACHES = []
+
+
+class LRUCache:
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, version, deps)
+        self._tagged = {}  # 标签 -> 依赖它的条目 key 集合
+        self._children = {}  # 标签 -> 派生标签集合
+        self._lock = threading.Lock()
+        _CACHES.append(self)
+
+    def get(self, key, version=None):
+        """返回缓存的值；不存在或版本号不一致时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] != version:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size, version=None, deps=()):
+        """放入条目，size 为估计的字节数；单个条目超过上限时不缓存"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size, version, tuple(deps))
+            self.bytes += size
+            for tag in deps:
+                self._tagged.setdefault(tag, set()).add(key)
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def depend(self, tag, parent):
+        """声明 tag 派生自 parent：作废 parent 时同时作废 tag"""
+        with self._lock:
+            self._children.setdefault(parent, set()).add(tag)
+
+    def invalidate(self, tag):
+        """作废依赖 tag（及其派生标签）的全部条目，返回作废的条目数"""
+        with self._lock:
+            removed = 0
+            pending = [tag]
+            seen = set()
+            while pending:
+                current = pending.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                for key in list(self._tagged.get(current, ())):
+                    self._remove(key)
+                    removed += 1
+                pending.extend(self._children.get(current, ()))
+            return removed
+
+    def _remove(self, key):
+        """调用方需持有 self._lock"""
+        _, size, _, deps = self._entries.pop(key)
+        self.bytes -= size
+        for tag in deps:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _cache_sizes():
+    for cache in _CACHES:
+        yield {'cache': cache.name, 'kind': 'bytes'}, cache.bytes
+        yield {'cache': cache.name, 'kind': 'max_bytes'}, cache.max_bytes
+        yield {'cache': cache.name, 'kind': 'entries'}, len(cache)
+
+
+def _cache_evictions():
+    for cache in _CACHES:
+        yield {'cache': cache.name}, cache.evictions
+
+
+Gauge('cache_size', '缓存占用：bytes 为估计的字节数，entries 为条目数', ['cache', 'kind'], callback=_cache_sizes)
+Gauge('cache_evictions_total', '因超过容量上限被淘汰的条目数', ['cache'], callback=_cache_evictions, kind='counter')
@@ -0,0 +1,168 @@
+"""多进程部署时的进程间协调
+
+用 gunicorn 等多 worker 方式运行时，每个进程各自在内存中持有一份记录与资源占用：
+- SharedVersions：mmap 映射的版本号文件，每台服务器一个 64 位计数器。任何进程写入后加一，
+  其他进程在读取前比较计数器，发现变化就从存储重新加载
+- ProcessLock：每台服务器一把 fcntl 文件锁，写入（含冲突检查）在锁内进行，跨进程也不会重复占用资源
+- LeaderLock：只有拿到文件锁的进程运行超时检查线程；该进程退出后锁自动释放，由其他进程接替
+- processes/ 目录：每个进程持有一个以自己命名的文件锁，other_processes() 据此判断是否有其他进程共用存储，
+  只有一个进程时超时检查线程不必定时检查其他进程的写入
+
+没有 fcntl 的平台（Windows）上文件锁退化为空操作，只支持单进程运行。
+"""
+import mmap
+import os
+import struct
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_SLOT = struct.Struct('<Q')
+
+MULTIPROCESS_SUPPORTED = fcntl is not None
+
+
+class SharedVersions:
+    """mmap 共享的版本号，新建文件时以当前毫秒时间戳为初值，重建后版本号也不会与旧值重复"""
+
+    def __init__(self, path, keys):
+        self._offsets = {key: i * _SLOT.size for i, key in enumerate(keys)}
+        size = len(self._offsets) * _SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < size:
+                seed = _SLOT.pack(int(time.time() * 1000))
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, seed * len(self._offsets))
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def get(self, key):
+        return _SLOT.unpack_from(self._mmap, self._offsets[key])[0]
+
+    def bump(self, key):
+        """版本号加一并返回新值，调用方需持有该服务器的 ProcessLock"""
+        value = self.get(key) + 1
+        _SLOT.pack_into(self._mmap, self._offsets[key], value)
+        return value
+
+
+class ProcessLock:
+    """跨进程的互斥文件锁，可重入
+
+    同一进程内的线程之间不互斥（flock 属于打开的文件），调用方需先持有进程内的锁。
+    """
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._depth = 0
+
+    def __enter__(self):
+        if not self._depth and fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if not self._depth and fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class LeaderLock:
+    """非阻塞的独占文件锁，拿到后一直持有到进程退出"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None:
+            return True
+        if not fcntl:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+
+class Coherence:
+    """一个进程的协调状态：共享版本号、每台服务器的写锁和超时检查的主进程锁"""
+
+    def __init__(self, directory, server_types):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.versions = SharedVersions(os.path.join(directory, 'versions'), server_types)
+        self._locks = {server_type: ProcessLock(os.path.join(directory, f'{server_type}.lock'))
+                       for server_type in server_types}
+        self._leader = LeaderLock(os.path.join(directory, 'leader.lock'))
+        self._claims = {}
+        self._processes_dir = os.path.join(directory, 'processes')
+        os.makedirs(self._processes_dir, exist_ok=True)
+        self._process = self._register()
+
+    def _register(self):
+        """登记本进程，返回 (文件路径, 持有锁的文件描述符)；先加锁再改名，其他进程看到的文件都已加锁"""
+        if not fcntl:
+            return None
+        path = os.path.join(self._processes_dir, f'{os.getpid()}-{uuid.uuid4().hex[:8]}')
+        fd = os.open(f'{path}.tmp', os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.replace(f'{path}.tmp', f'{path}.lock')
+        return f'{path}.lock', fd
+
+    def other_processes(self):
+        """共用同一协调目录、仍在运行的其他进程数；已退出进程留下的文件（锁已释放）顺便删除"""
+        if self._process is None:
+            return 0
+        count = 0
+        for name in os.listdir(self._processes_dir):
+            path = os.path.join(self._processes_dir, name)
+            if not name.endswith('.lock') or path == self._process[0]:
+                continue
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                count += 1
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            finally:
+                os.close(fd)
+        return count
+
+    def lock(self, server_type):
+        return self._locks[server_type]
+
+    def is_leader(self):
+        """当前进程是否负责超时检查；尚未成为主进程时尝试获取"""
+        return self._leader.try_acquire()
+
+    def claim_exclusive(self, name):
+        """独占某项资源（如 Excel 存储），已被其他进程占用时返回 False"""
+        claim = self._claims.setdefault(name, LeaderLock(os.path.join(self.directory, f'{name}.lock')))
+        return claim.try_acquire()
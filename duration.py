@@ -0,0 +1,207 @@
+"""使用时间字符串解析
+
+支持的格式（与原 ServerManager._parse_time_duration 完全一致）：
+- 日期范围：2025.6.10~2025.6.12、2025.6.10~6.12，按天数换算为小时，至少24小时
+- 单一日期：2025.6.10，按24小时计
+- 带单位的时长：3小时、2h、1.5hour、3天、2day、90分钟、90min、30minute
+- 纯数字：默认单位为小时
+
+parse_duration_hours 解析单个值并按原始字符串做 LRU 缓存；
+parse_duration_column 对整列（如 DataFrame['预计使用时间']）做向量化解析；
+parse_start_date 解析登记时间中的日期，用于按日期过滤记录；
+parse_record_columns 由整表的文本列解析出加载记录时用到的类型化列。
+"""
+import math
+import re
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from metrics import Gauge
+
+_DATE = r'(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})'
+_FULL_RANGE_RE = re.compile(_DATE + r'\s*[~\-到至]\s*(\d{4})[.\-/](\d{1,2})[.\-/](\d{1,2})')  # 2025.6.10~2025.6.12
+_SHORT_RANGE_RE = re.compile(_DATE + r'\s*[~\-到至]\s*(\d{1,2})[.\-/](\d{1,2})')  # 2025.6.10~6.12
+_SINGLE_DATE_RE = re.compile(_DATE)
+
+# 一次扫描取出所有“数字+单位”，再按单位优先级选取；优先级顺序与原来逐个 re.search 的顺序相同
+_UNIT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(小时|hours?|h|天|days?|分钟|minutes?|min)')
+_UNITS = {
+    '小时': (0, 1),
+    'h': (1, 1), 'hour': (1, 1), 'hours': (1, 1),
+    '天': (2, 24),
+    'day': (3, 24), 'days': (3, 24),
+    '分钟': (4, 1 / 60),
+    'min': (5, 1 / 60), 'minute': (5, 1 / 60), 'minutes': (5, 1 / 60),
+}
+
+# 向量化解析时按同样的优先级逐个提取
+_UNIT_COLUMN_PATTERNS = [
+    (r'(\d+(?:\.\d+)?)\s*小时', 1),
+    (r'(\d+(?:\.\d+)?)\s*h', 1),
+    (r'(\d+(?:\.\d+)?)\s*天', 24),
+    (r'(\d+(?:\.\d+)?)\s*day', 24),
+    (r'(\d+(?:\.\d+)?)\s*分钟', 1 / 60),
+    (r'(\d+(?:\.\d+)?)\s*min', 1 / 60),
+]
+
+DURATION_CACHE_SIZE = 4096
+
+START_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# parse_record_columns 返回的类型化列，与其所依据的文本列一一对应
+TYPED_COLUMNS = ('登记时间', '预计使用小时', '实际使用小时', '已完成')
+TYPED_SOURCES = ('时间', '预计使用时间', '实际使用时间', '是否完成')
+
+
+def parse_duration_hours(value):
+    """解析时间字符串，返回小时数"""
+    if not value or pd.isna(value):
+        return 0
+    return _parse_text(str(value).strip().lower())
+
+
+@lru_cache(maxsize=DURATION_CACHE_SIZE)
+def _parse_text(text):
+    # 首先检查是否是日期范围格式
+    for pattern in (_FULL_RANGE_RE, _SHORT_RANGE_RE):
+        match = pattern.search(text)
+        if match:
+            try:
+                groups = match.groups()
+                if len(groups) == 6:  # 完整日期范围
+                    start_year, start_month, start_day, end_year, end_month, end_day = groups
+                else:  # 简化日期范围 (同年)
+                    start_year, start_month, start_day, end_month, end_day = groups
+                    end_year = start_year
+                start_date = datetime(int(start_year), int(start_month), int(start_day))
+                end_date = datetime(int(end_year), int(end_month), int(end_day))
+
+                # 计算天数差异并转换为小时
+                delta = end_date - start_date
+                return max(delta.days * 24, 24)  # 至少1天(24小时)
+            except (ValueError, TypeError):
+                continue
+
+    # 匹配单一日期格式 (默认为1天)
+    if _SINGLE_DATE_RE.search(text):
+        return 24
+
+    # 匹配各种时间单位格式
+    best = None
+    for match in _UNIT_RE.finditer(text):
+        priority, multiplier = _UNITS[match.group(2)]
+        if best is None or priority < best[0]:
+            best = (priority, float(match.group(1)) * multiplier)
+            if priority == 0:
+                break
+    if best is not None:
+        return best[1]
+
+    # 如果没有匹配到单位，尝试解析纯数字（默认为小时）
+    try:
+        hours = float(text)
+    except ValueError:
+        return 0
+    return hours if math.isfinite(hours) else 0
+
+
+def _range_hours(parts, same_year):
+    """把提取出的日期范围列换算为小时，无效日期返回 NaN"""
+    start = pd.to_datetime(
+        pd.DataFrame({'year': parts[0], 'month': parts[1], 'day': parts[2]}).astype(float),
+        errors='coerce'
+    )
+    if same_year:
+        end_parts = {'year': parts[0], 'month': parts[3], 'day': parts[4]}
+    else:
+        end_parts = {'year': parts[3], 'month': parts[4], 'day': parts[5]}
+    end = pd.to_datetime(pd.DataFrame(end_parts).astype(float), errors='coerce')
+    days = (end - start).dt.days.to_numpy(dtype=float)
+    return np.maximum(days * 24, 24)  # NaN 保持为 NaN
+
+
+def parse_duration_column(values):
+    """向量化解析一整列时间字符串，返回 float 小时数的 NumPy 数组
+
+    先按取值去重（同一列中重复的字符串很多），再对不同取值逐个格式做 str.extract。
+    """
+    series = pd.Series(values, dtype=object)
+    codes, uniques = pd.factorize(series.where(series.notna(), ''))
+    hours = _parse_unique_column(pd.Series(uniques, dtype=object).astype(str))
+    return hours[codes] if len(hours) else np.zeros(len(codes))
+
+
+def _parse_unique_column(raw):
+    text = raw.str.strip().str.lower()
+    hours = np.full(len(text), np.nan)
+
+    for pattern, same_year in ((_FULL_RANGE_RE, False), (_SHORT_RANGE_RE, True)):
+        pending = np.isnan(hours)
+        if not pending.any():
+            break
+        parts = text[pending].str.extract(pattern)
+        matched = parts[0].notna().to_numpy()
+        if matched.any():
+            range_hours = np.full(len(parts), np.nan)
+            range_hours[matched] = _range_hours(parts[matched], same_year)
+            hours[np.flatnonzero(pending)] = range_hours
+        # 日期范围匹配但日期无效时与原逻辑一样继续尝试后续格式
+
+    pending = np.isnan(hours)
+    single = text.str.contains(r'\d{4}[.\-/]\d{1,2}[.\-/]\d{1,2}').to_numpy() & pending
+    hours[single] = 24
+
+    for pattern, multiplier in _UNIT_COLUMN_PATTERNS:
+        pending = np.isnan(hours)
+        if not pending.any():
+            break
+        number = pd.to_numeric(text[pending].str.extract(pattern)[0], errors='coerce').to_numpy()
+        hours[np.flatnonzero(pending)] = number * multiplier
+
+    pending = np.isnan(hours)
+    if pending.any():
+        hours[pending] = pd.to_numeric(text[pending], errors='coerce').to_numpy()
+    hours[~np.isfinite(hours)] = 0
+    return hours
+
+
+@lru_cache(maxsize=DURATION_CACHE_SIZE)
+def _parse_date_text(text):
+    match = _SINGLE_DATE_RE.search(text)
+    if not match:
+        return None
+    try:
+        return date(*(int(part) for part in match.groups()))
+    except ValueError:
+        return None
+
+
+def _cache_stats():
+    for name, func in (('duration', _parse_text), ('start_date', _parse_date_text)):
+        info = func.cache_info()
+        yield {'cache': name, 'result': 'hit'}, info.hits
+        yield {'cache': name, 'result': 'miss'}, info.misses
+
+
+CACHE_STATS = Gauge('parse_cache_requests_total', '使用时间、登记日期解析的 LRU 缓存查询次数', ['cache', 'result'],
+                    callback=_cache_stats, kind='counter')
+
+
+def parse_start_date(value):
+    """解析登记时间（2025.6.6、2025-06-06 00:00:00 等）中的日期，无法解析时返回 None"""
+    if not value or pd.isna(value):
+        return None
+    return _parse_date_text(str(value).strip())
+
+
+def parse_record_columns(df, hours=None):
+    """整表解析类型化列，返回索引与 df 相同的 DataFrame：登记时间（datetime64，只有日期或格式错误时为 NaT）、
+    预计/实际使用小时（float）、已完成（bool），与 Record 逐条解析的结果一致；hours 为已解析的预计使用小时数"""
+    return pd.DataFrame({
+        '登记时间': pd.to_datetime(df['时间'], format=START_TIME_FORMAT, errors='coerce'),
+        '预计使用小时': parse_duration_column(df['预计使用时间']) if hours is None else np.asarray(hours, dtype=float),
+        '实际使用小时': parse_duration_column(df['实际使用时间']),
+        '已完成': (df['是否完成'] == 'Yes').to_numpy(dtype=bool),
+    }, index=df.index)
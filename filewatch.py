@@ -0,0 +1,124 @@
+"""监视记录文件被外部程序修改
+
+Excel 存储后端以 .xlsx 为数据源，有人直接用 Excel 打开、修改并保存时，进程内常驻的记录会与文件不一致。
+FileWatcher 监视这些文件，发生变化时回调 callback(key)，由 ServerManager 判断是否为外部修改并重新加载。
+
+Linux 上通过 inotify（ctypes 调用 libc，不需要额外依赖）监视文件所在目录：Excel 保存时先写临时文件再改名，
+只监视文件本身会在改名后失效。其他平台或 inotify 不可用时按 poll_interval 定时检查。
+是否变化以文件签名 (inode, 大小, 修改时间纳秒) 判断，改名保存时 inode 改变，不依赖修改时间的精度；
+收到事件后等待 debounce 秒再比较，避免在保存过程中读取写了一半的文件。
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# inotify 事件（见 inotify(7)）
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def file_signature(path):
+    """文件的 (inode, 大小, 修改时间纳秒)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class _Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+
+    def add_watch(self, directory):
+        if self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            raise OSError(ctypes.get_errno(), f'无法监视目录 {directory}')
+
+    def read_names(self):
+        """读取已到达的事件，返回涉及的文件名集合"""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset + _EVENT.size <= len(data):
+                _, _, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+                offset += length
+
+
+class FileWatcher:
+    """监视 {key: 文件路径}，文件签名变化时在后台线程中调用 callback(key)"""
+
+    def __init__(self, paths, callback, poll_interval=2.0, debounce=0.5):
+        self.paths = {key: os.path.abspath(path) for key, path in paths.items()}
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._signatures = {key: file_signature(path) for key, path in self.paths.items()}
+        self._names = {os.path.basename(path) for path in self.paths.values()}
+        self._inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                self._inotify = _Inotify()
+                for directory in {os.path.dirname(path) for path in self.paths.values()}:
+                    self._inotify.add_watch(directory)
+            except (OSError, AttributeError) as e:
+                print(f"inotify 不可用，改为每 {poll_interval} 秒检查记录文件: {e}")
+                self._inotify = None
+
+    @property
+    def mode(self):
+        return 'inotify' if self._inotify else 'poll'
+
+    def start(self):
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+        return self
+
+    def check(self):
+        """比较文件签名，对变化的文件调用回调"""
+        for key, path in self.paths.items():
+            signature = file_signature(path)
+            if signature == self._signatures[key]:
+                continue
+            self._signatures[key] = signature
+            try:
+                self.callback(key)
+            except Exception as e:
+                print(f"处理 {path} 的修改时出错: {str(e)}")
+
+    def _run(self):
+        if self._inotify is None:
+            while True:
+                time.sleep(self.poll_interval)
+                self.check()
+        due = None
+        while True:
+            timeout = None if due is None else max(0.0, due - time.monotonic())
+            ready, _, _ = select.select([self._inotify.fd], [], [], timeout)
+            if ready and self._inotify.read_names() & self._names:
+                # 连续的事件（写入、改名、修改属性）合并为一次检查
+                due = time.monotonic() + self.debounce
+            if due is not None and time.monotonic() >= due:
+                due = None
+                self.check()
@@ -0,0 +1,291 @@
+"""服务器清单
+
+servers.json 描述每台服务器的记录文件和可分配的资源，记录列、登记表单、资源统计和冲突检查（schedule.py）都按清单生成，
+新增服务器只需在清单中添加一项。资源分三类：
+- discrete：有编号的资源（节点、GPU），登记时填写编号列表如 "0,1"；旧数据中的 "Yes" 表示不指定编号的一个
+- pool：可分割的数量（核数、内存），登记时填写数量或 "all"（占用全部）
+- seat：按是/否占用的名额（远程桌面、独占的GPU），total 为同时可用的名额数
+
+清单路径可用环境变量 SERVER_INVENTORY 指定，默认为程序目录下的 servers.json。
+"""
+import json
+import os
+
+from storage import to_text
+
+# 每台服务器共有的记录列：(表单字段名, 列名)，资源列位于两组之间
+LEADING_FIELDS = [('time', '时间'), ('name', '姓名')]
+TRAILING_FIELDS = [('task_type', '任务类型'), ('estimated_time', '预计使用时间'),
+                   ('actual_time', '实际使用时间'), ('completed', '是否完成')]
+OPTIONAL_INPUTS = ('actual_time', 'completed')
+# 记录ID：登记时分配，之后不变，修改记录时按ID定位（见 ServerManager.update_record）；不在登记表单中
+ID_COLUMN = '记录ID'
+
+# 登记值中无法解析或不在清单中的部分：编号资源中不存在的编号，数量、名额资源中无法解析的取值。
+# 登记和批量导入都按 is_invalid() 拒绝（见 schedule.py、bulk.py），已有记录中的这部分不占用资源
+INVALID = object()
+
+
+def _text(value):
+    """登记值转为去掉首尾空白的字符串，空值和 NaN 为空串"""
+    return to_text(value).strip()
+
+
+class DiscreteResource:
+    kind = 'discrete'
+
+    def __init__(self, key, label, field, input, ids, header=None, placeholder='', help='', options=None):
+        self.key = key
+        self.label = label
+        self.field = field
+        self.input = input
+        self.ids = tuple(ids)
+        self.header = header or field
+        self.placeholder = placeholder
+        self.help = help
+        self.options = options
+
+    def parse(self, value):
+        """返回 (编号元组, 是否为不指定编号的 Yes)；无法解析或不在清单中的编号为 INVALID，忽略空的部分"""
+        text = _text(value)
+        if text == 'Yes':
+            return (), True
+        if text in ('', 'No'):
+            return (), False
+        return tuple(self._parse_id(part.strip()) for part in text.split(',') if part.strip()), False
+
+    def _parse_id(self, text):
+        try:
+            i = int(text)
+        except ValueError:
+            return INVALID
+        return i if i in self.ids else INVALID
+
+    def is_invalid(self, demand):
+        return INVALID in demand[0]
+
+    def format_error(self):
+        return f'{self.label}编号只能是 {"、".join(map(str, self.ids))}（多个用逗号分隔）、Yes 或 No'
+
+    def parse_need(self, text):
+        """空闲时段查询中的需求：需要的编号数量"""
+        return int(text)
+
+    def counter(self):
+        return DiscreteCounter(self)
+
+
+class DiscreteCounter:
+    """按编号记录引用次数"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.refs = dict.fromkeys(resource.ids, 0)
+        self.unnamed = 0
+
+    def apply(self, demand, sign):
+        ids, unnamed = demand
+        for i in ids:
+            if i in self.refs:
+                self.refs[i] += sign
+        if unnamed:
+            self.unnamed += sign
+
+    def summary(self):
+        used = {i for i, refs in self.refs.items() if refs > 0}
+        # 未指定编号的占用依次占用空闲的编号
+        free = [i for i in self.resource.ids if i not in used]
+        used.update(free[:max(self.unnamed, 0)])
+        occupied = [i for i in self.resource.ids if i in used]
+        available = [i for i in self.resource.ids if i not in used]
+        key = self.resource.key
+        return {
+            f'{key}_remaining': len(available),
+            f'{key}_total': len(self.resource.ids),
+            f'{key}_used': len(occupied),
+            f'{key}_available': available,
+            f'{key}_occupied': occupied
+        }
+
+
+class PoolResource:
+    kind = 'pool'
+
+    def __init__(self, key, label, field, input, total, header=None, placeholder='', help=''):
+        self.key = key
+        self.label = label
+        self.field = field
+        self.input = input
+        self.total = total
+        self.header = header or field
+        self.placeholder = placeholder
+        self.help = help
+        self.options = None
+
+    def parse(self, value):
+        """返回数量、'all'、None（未填写）或 INVALID"""
+        text = _text(value)
+        if not text:
+            return None
+        if text.lower() == 'all':
+            return 'all'
+        try:
+            return int(text)
+        except ValueError:
+            return INVALID
+
+    def is_invalid(self, demand):
+        return demand is INVALID or (isinstance(demand, int) and demand <= 0)
+
+    def format_error(self):
+        return f'{self.label}必须是大于0的数字或"all"'
+
+    def parse_need(self, text):
+        if text.strip().lower() == 'all':
+            return self.total
+        return int(text)
+
+    def counter(self):
+        return PoolCounter(self)
+
+
+class PoolCounter:
+    """数量总和与申请 "all" 的任务数"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.amount = 0
+        self.all_count = 0
+
+    def apply(self, demand, sign):
+        if demand == 'all':
+            self.all_count += sign
+        elif isinstance(demand, int):
+            self.amount += sign * demand
+
+    def summary(self):
+        total = self.resource.total
+        used = total if self.all_count > 0 else self.amount
+        key = self.resource.key
+        return {
+            f'{key}_remaining': max(0, total - used),
+            f'{key}_total': total,
+            f'{key}_used': used
+        }
+
+
+class SeatResource:
+    kind = 'seat'
+
+    def __init__(self, key, label, field, input, total=1, header=None):
+        self.key = key
+        self.label = label
+        self.field = field
+        self.input = input
+        self.total = total
+        self.header = header or field
+        self.placeholder = ''
+        self.help = ''
+        self.options = [['Yes', '是'], ['No', '否']]
+
+    def parse(self, value):
+        """返回 True（Yes）、False（No 或未填写）或 INVALID"""
+        text = _text(value)
+        if text in ('', 'No'):
+            return False
+        return True if text == 'Yes' else INVALID
+
+    def is_invalid(self, demand):
+        return demand is INVALID
+
+    def format_error(self):
+        return f'{self.label}只能是 Yes 或 No'
+
+    def parse_need(self, text):
+        return 1 if text.strip() in ('1', 'Yes') else 0
+
+    def counter(self):
+        return SeatCounter(self)
+
+
+class SeatCounter:
+    """占用名额的任务数"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.used = 0
+
+    def apply(self, demand, sign):
+        if demand is True:
+            self.used += sign
+
+    def summary(self):
+        key = self.resource.key
+        return {
+            f'{key}_remaining': max(0, self.resource.total - self.used),
+            f'{key}_total': self.resource.total,
+            f'{key}_used': self.used
+        }
+
+
+RESOURCE_KINDS = {'discrete': DiscreteResource, 'pool': PoolResource, 'seat': SeatResource}
+
+
+class ServerSpec:
+    """清单中的一台服务器"""
+
+    def __init__(self, id, name, excel_file, resources, description='', color='primary', examples=None):
+        self.id = id
+        self.name = name
+        self.excel_file = excel_file
+        self.description = description
+        self.color = color
+        self.examples = examples or {}
+        self.resources = tuple(RESOURCE_KINDS[res['kind']](**{k: v for k, v in res.items() if k != 'kind'})
+                               for res in resources)
+        self.inputs = LEADING_FIELDS + [(res.input, res.field) for res in self.resources] + TRAILING_FIELDS
+        self.columns = [column for _, column in self.inputs] + [ID_COLUMN]
+
+    def form_data(self, form):
+        """从登记表单取出一条记录的字段，缺少必填项时抛出 KeyError"""
+        return {column: form.get(name, '') if name in OPTIONAL_INPUTS else form[name]
+                for name, column in self.inputs}
+
+    def parse_needs(self, values):
+        """空闲时段查询的需求 {资源 key: 数量}，values 按资源 key 取值；格式错误时抛出 ValueError"""
+        needs = {}
+        for resource in self.resources:
+            text = values.get(resource.key)
+            if text:
+                needs[resource.key] = resource.parse_need(text)
+                if needs[resource.key] < 0:
+                    raise ValueError(f'{resource.key} 不能小于0')
+        return needs
+
+    def client_config(self):
+        """页面脚本使用的资源描述"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'resources': [{'key': res.key, 'kind': res.kind, 'label': res.label, 'input': res.input}
+                          for res in self.resources]
+        }
+
+
+def load_inventory(path):
+    """读取清单，返回 {服务器: ServerSpec}，按清单中的顺序排列"""
+    with open(path, encoding='utf-8') as f:
+        config = json.load(f)
+    servers = {}
+    for server in config['servers']:
+        spec = ServerSpec(**server)
+        if spec.id in servers:
+            raise ValueError(f'服务器清单 {path} 中 {spec.id} 重复')
+        servers[spec.id] = spec
+    return servers
+
+
+SERVERS = load_inventory(os.environ.get('SERVER_INVENTORY',
+                                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'servers.json')))
+
+SERVER_COLUMNS = {server_type: spec.columns for server_type, spec in SERVERS.items()}
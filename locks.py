@@ -0,0 +1,75 @@
+"""读写锁
+
+ServerManager 为每台服务器各持有一把：查询记录时加读锁可以并发，登记、修改状态和超时处理加写锁独占。
+"""
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """写者优先的读写锁
+
+    有写者在等待时新的读者会排队，避免持续的查询请求让写入一直拿不到锁。
+    写锁可重入，持有写锁的线程也可以再加读锁；读锁不可重入。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                self._write_depth += 1
+                return
+            self._cond.wait_for(lambda: self._writer is None and not self._waiting_writers)
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            if self._writer == threading.get_ident():
+                self._write_depth -= 1
+                return
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            self._waiting_writers += 1
+            try:
+                self._cond.wait_for(lambda: self._writer is None and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
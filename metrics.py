@@ -0,0 +1,191 @@
+"""运行指标
+
+计数器（Counter）、瞬时值（Gauge）和直方图（Histogram），按 Prometheus 文本格式输出，由 /metrics 接口提供，
+不依赖 prometheus_client。指标在使用它的模块中定义，创建时自动登记到 REGISTRY：
+
+    REQUEST_SECONDS = Histogram('http_request_duration_seconds', '请求耗时', ['route', 'method', 'status'])
+    REQUEST_SECONDS.observe(0.012, route='/api/resources', method='GET', status='200')
+
+Gauge 可以传入 callback，在输出时取值（如队列长度、缓存统计），不需要在代码各处更新。
+每个进程各自统计；多进程部署时 Prometheus 需要分别抓取每个 worker，或只作为单进程的诊断工具使用。
+"""
+import threading
+import time
+from functools import wraps
+
+# 耗时直方图的默认分桶（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def _samples(self):
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = self._header()
+        for key, value in self._samples():
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """瞬时值；有 callback 时输出时调用 callback()，返回 [(标签字典, 值)]"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), callback=None, kind=None):
+        super().__init__(name, help, labels)
+        self.callback = callback
+        # 由其他组件累计、只能按回调读取的计数（如 lru_cache 的命中数）以 counter 类型输出
+        if kind:
+            self.kind = kind
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.callback is None:
+            return super()._samples()
+        return sorted((self._key(labels), value) for labels, value in self.callback())
+
+
+class Histogram(_Metric):
+    """按分桶累计的分布，输出 _bucket（累计）、_sum 和 _count"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """用作上下文管理器，记录 with 块的耗时"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            return sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self._values.items())
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total, count) in self._samples():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", _format_value(bound))])} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timed(histogram, **labels):
+    """方法装饰器：按方法名（method 标签）记录每次调用的耗时"""
+    def decorator(func):
+        call_labels = dict(labels, method=func.__name__)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **call_labels)
+        return wrapper
+    return decorator
+
+
+def instrument(obj, methods, histogram, **labels):
+    """把 obj 上存在的 methods 替换为计时的版本（只影响该实例，包括对象内部的调用），返回 obj"""
+    for name in methods:
+        method = getattr(obj, name, None)
+        if method is not None:
+            setattr(obj, name, timed(histogram, **labels)(method))
+    return obj
+
+
+# 各模块共用：缓存命中（result=hit）与未命中（result=miss），key 为缓存中的分类（接口、服务器、桶大小等）
+CACHE_REQUESTS = Counter('cache_requests_total', '缓存查询次数', ['cache', 'key', 'result'])
+
+
+def render():
+    """全部指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            lines.append(f'# {metric.name} 输出出错: {_escape(e)}')
+    return '\n'.join(lines) + '\n'
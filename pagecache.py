@@ -0,0 +1,62 @@
+"""渲染结果的缓存与压缩
+
+页面和记录接口的响应体按数据版本缓存在有界 LRU 中（键为页面与查询参数，版本号不一致时视为未命中），
+数据不变时不再查询和渲染；压缩后的响应体（gzip，安装了 brotli 时还有 br）在第一次被请求时生成，
+与原文一起缓存，之后同一版本的请求直接返回压缩结果。
+
+记录表格的每一行按记录内容（Record.revision）单独缓存：内容不变的行在任何页面、任何版本中都复用同一片段，
+登记一条新记录后重新渲染页面时只需渲染这一行。资源使用情况面板按服务器的数据版本缓存。
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩
+COMPRESS_MIN_BYTES = 1024
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+class CachedBody:
+    """缓存的响应体：原文和按需生成的压缩结果"""
+
+    __slots__ = ('body', 'mimetype', '_encoded')
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self._encoded = {}
+
+    @property
+    def size(self):
+        return len(self.body) + sum(len(data) for data in self._encoded.values())
+
+    def has(self, encoding):
+        return encoding in self._encoded
+
+    def encoded(self, encoding):
+        """按 encoding 压缩后的内容，encoding 为 None 时返回原文"""
+        if encoding is None:
+            return self.body
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = _compress(self.body, encoding)
+        return data
+
+
+def choose_encoding(accept_encodings, size):
+    """按客户端的 Accept-Encoding 选择压缩方式（优先 br），不压缩时返回 None"""
+    if size < COMPRESS_MIN_BYTES:
+        return None
+    for encoding in ENCODINGS:
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
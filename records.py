@@ -0,0 +1,140 @@
+"""规范化的登记记录
+
+Record 在写入或加载时一次性解析原始字段：登记时间、预计和实际使用小时数、预计结束时间、预约时间段，
+以及按服务器清单（inventory.py）解析的各项资源占用。
+之后资源统计、超时检查、状态修改和冲突检查都直接读取这些属性，不再反复解析字符串。
+原始字段保存在 fields 中，模板和 JSON 接口仍按字段名读取（record['时间']、record.get(...)）。
+"""
+import hashlib
+import uuid
+from datetime import datetime, time, timedelta
+
+import pandas as pd
+
+from duration import START_TIME_FORMAT, parse_duration_hours, parse_record_columns, parse_start_date
+from storage import to_text
+
+_UNSET = object()
+
+
+def new_record_id():
+    """新的记录ID：12位十六进制随机串"""
+    return uuid.uuid4().hex[:12]
+
+
+def _parse_start_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(str(value), START_TIME_FORMAT)
+    except (ValueError, TypeError):
+        return None
+
+
+class Record:
+    """一条登记记录：原始字段 + 解析结果，创建后不再修改，修改字段时用 with_fields 生成新记录
+
+    resources 为该服务器清单中的资源，demand 与其一一对应，是各资源 parse() 的结果。
+    booking_start/booking_end 为预约占用的时间段：预计使用时间中写了日期（如 2025.6.10~2025.6.12）时从该日期开始，
+    否则从登记时间开始，时长为预计使用小时数；无法确定的一端为 None
+    """
+
+    __slots__ = ('fields', 'resources', 'demand', 'name', 'completed', 'start_time', 'start_day',
+                 'duration_hours', 'actual_hours', 'end_time', 'booking_start', 'booking_end', '_revision')
+
+    def __init__(self, fields, resources=(), start_time=_UNSET, duration_hours=_UNSET, actual_hours=_UNSET,
+                 completed=_UNSET):
+        self.fields = fields
+        self.resources = resources
+        self._revision = None
+        self.demand = tuple(resource.parse(fields.get(resource.field, '')) for resource in resources)
+        self.name = to_text(fields.get('姓名', '')).strip()
+        self.completed = fields.get('是否完成') == 'Yes' if completed is _UNSET else completed
+
+        time_value = fields.get('时间', '')
+        self.start_time = _parse_start_time(time_value) if start_time is _UNSET else start_time
+        day = parse_start_date(time_value)
+        self.start_day = day.toordinal() if day else None
+
+        estimated = fields.get('预计使用时间', '')
+        if duration_hours is _UNSET:
+            duration_hours = parse_duration_hours(estimated)
+        self.duration_hours = duration_hours
+        if actual_hours is _UNSET:
+            actual_hours = parse_duration_hours(fields.get('实际使用时间', ''))
+        self.actual_hours = actual_hours
+
+        booking_day = parse_start_date(estimated)
+        if booking_day is not None:
+            self.booking_start = datetime.combine(booking_day, time())
+        elif self.start_time is not None:
+            self.booking_start = self.start_time
+        elif day is not None:
+            self.booking_start = datetime.combine(day, time())
+        else:
+            self.booking_start = None
+        if self.booking_start is not None and duration_hours > 0:
+            self.booking_end = self.booking_start + timedelta(hours=duration_hours)
+        else:
+            self.booking_end = None
+
+        if self.start_time is not None and estimated:
+            self.end_time = self.start_time + timedelta(hours=duration_hours)
+            # 提前预约的记录到预约结束时才算超时
+            if self.booking_end is not None and self.booking_end > self.end_time:
+                self.end_time = self.booking_end
+        else:
+            self.end_time = None
+
+    def with_fields(self, updates):
+        return Record({**self.fields, **updates}, self.resources)
+
+    @property
+    def revision(self):
+        """字段内容的校验值，任一字段变化时改变，用于修改记录时的乐观并发检查
+
+        只取决于非空字段的文本，与存储后端、重新加载和进程无关
+        """
+        if self._revision is None:
+            text = '\x1f'.join(f'{key}\x1e{value}' for key, value in sorted(
+                (str(key), to_text(value)) for key, value in self.fields.items()) if value)
+            self._revision = hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+        return self._revision
+
+    def __getitem__(self, key):
+        return self.fields[key]
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    def keys(self):
+        return self.fields.keys()
+
+    def items(self):
+        return self.fields.items()
+
+    def __repr__(self):
+        return f'Record({self.fields!r})'
+
+
+def records_from_frame(df, resources=(), hours=None, typed=None):
+    """把存储读出的整表转换为 Record 列表
+
+    typed 为存储中保存的类型化列（见 duration.parse_record_columns），没有时按列向量化解析；
+    hours 为已解析的预计使用小时数
+    """
+    if df.empty:
+        return []
+    if typed is None:
+        typed = parse_record_columns(df, hours)
+    start_times = [None if pd.isna(t) else t.to_pydatetime() for t in typed['登记时间']]
+    return [
+        Record(fields, resources, start_time=start_time, duration_hours=duration, actual_hours=actual,
+               completed=completed)
+        for fields, start_time, duration, actual, completed in zip(
+            df.to_dict('records'), start_times, typed['预计使用小时'].tolist(), typed['实际使用小时'].tolist(),
+            typed['已完成'].tolist())
+    ]
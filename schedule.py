@@ -0,0 +1,355 @@
+"""预约时间段与冲突检查
+
+每条未完成的记录占用一个时间段 [预约开始, 预约结束)，见 Record.booking_start / booking_end；
+时间段未知的一端视为无限。每项资源按时间段建区间树：编号资源每个编号一棵，数量和名额资源各一棵，
+登记时只查询与请求时间段重叠的记录，O(log n + k)，预约数量增多也不需要扫描全部记录。
+
+登记请求的时间段已经开始时，还要与当前占用（Usage.summary()）比较：
+时间段已过但尚未标记完成的记录仍在占用资源，区间树中查不到它们。
+"""
+import math
+import random
+from datetime import datetime, timedelta
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_seconds(value, default):
+    """datetime 转为秒数，便于在区间树中比较；None 取 default（-inf 或 inf）"""
+    if value is None:
+        return default
+    return (value - _EPOCH).total_seconds()
+
+
+def from_seconds(seconds):
+    if not math.isfinite(seconds):
+        return None
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def _format_window(begin, end):
+    begin, end = from_seconds(begin), from_seconds(end)
+    begin_text = begin.strftime('%Y-%m-%d %H:%M') if begin else '现在'
+    end_text = end.strftime('%Y-%m-%d %H:%M') if end else '以后'
+    return f'{begin_text}~{end_text}'
+
+
+class _Node:
+    __slots__ = ('begin', 'end', 'key', 'value', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, begin, end, key, value, priority):
+        self.begin = begin
+        self.end = end
+        self.key = key
+        self.value = value
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+
+
+def _split(node, sort_key, inclusive):
+    """按 (开始, 键) 拆分为小于（inclusive 时小于等于）sort_key 的部分和其余部分"""
+    if node is None:
+        return None, None
+    node_key = (node.begin, node.key)
+    if node_key < sort_key or (inclusive and node_key == sort_key):
+        left, right = _split(node.right, sort_key, inclusive)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, sort_key, inclusive)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _collect(node, begin, end, out):
+    if node is None or node.max_end <= begin:
+        return
+    _collect(node.left, begin, end, out)
+    if node.begin >= end:
+        return  # 右子树的开始时间都不早于该节点
+    if node.end > begin:
+        out.append((node.begin, node.end, node.key, node.value))
+    _collect(node.right, begin, end, out)
+
+
+class IntervalTree:
+    """区间树：按 (开始, 键) 排序的 treap，每个节点记录子树中最大的结束时间
+
+    插入、删除期望 O(log n)；查询与 [begin, end) 重叠的区间 O(log n + k)。键在同一棵树中唯一。
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+        self._random = random.Random(0)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, begin, end, key, value=None):
+        left, right = _split(self._root, (begin, key), False)
+        node = _Node(begin, end, key, value, self._random.random())
+        self._root = _merge(_merge(left, node), right)
+        self._size += 1
+
+    def remove(self, begin, key):
+        """删除开始时间为 begin、键为 key 的区间，不存在时返回 False"""
+        left, right = _split(self._root, (begin, key), False)
+        middle, right = _split(right, (begin, key), True)
+        self._root = _merge(left, right)
+        if middle is None:
+            return False
+        self._size -= 1
+        return True
+
+    def overlapping(self, begin, end):
+        """与 [begin, end) 重叠的区间 [(开始, 结束, 键, 值)]，按开始时间排列"""
+        out = []
+        _collect(self._root, begin, end, out)
+        return out
+
+
+def _peak(intervals, begin, end):
+    """[begin, end) 内同时占用量的最大值，intervals 为区间树的查询结果，值为占用量"""
+    events = []
+    for start, stop, _, amount in intervals:
+        events.append((max(start, begin), amount))
+        events.append((min(stop, end), -amount))
+    events.sort()  # 同一时刻先释放再占用
+    peak = current = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+class DiscreteSchedule:
+    """编号资源：每个编号一棵区间树；旧数据中不指定编号的 "Yes" 单独一棵，按数量计"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.trees = {i: IntervalTree() for i in resource.ids}
+        self.unnamed = IntervalTree()
+
+    def add(self, row_index, demand, begin, end):
+        ids, unnamed = demand
+        for i in set(ids):
+            if i in self.trees:
+                self.trees[i].add(begin, end, row_index)
+        if unnamed:
+            self.unnamed.add(begin, end, row_index, 1)
+
+    def remove(self, row_index, demand, begin):
+        ids, unnamed = demand
+        for i in set(ids):
+            if i in self.trees:
+                self.trees[i].remove(begin, row_index)
+        if unnamed:
+            self.unnamed.remove(begin, row_index)
+
+    def _free_ids(self, begin, end):
+        """整个时间段内都空闲的编号，以及扣除不指定编号的占用后还能再分配的数量"""
+        free = [i for i, tree in self.trees.items() if not tree.overlapping(begin, end)]
+        return free, max(0, len(free) - _peak(self.unnamed.overlapping(begin, end), begin, end))
+
+    def errors(self, demand, begin, end, summary):
+        requested, _ = demand
+        if not requested:
+            return []
+        if self.resource.is_invalid(demand):
+            return [self.resource.format_error()]
+        key = self.resource.key
+        label = self.resource.label
+        errors = []
+        free, remaining = self._free_ids(begin, end)
+        occupied_now = summary[f'{key}_occupied'] if summary else []
+        busy_now = [i for i in requested if i in occupied_now]
+        busy_later = [i for i in requested if i not in occupied_now and i in self.trees and i not in free]
+        if busy_now:
+            errors.append(f'{label} {",".join(map(str, busy_now))} 已被占用')
+        if busy_later:
+            errors.append(f'{label} {",".join(map(str, busy_later))} 在 {_format_window(begin, end)} 内已被预约')
+        if summary and len(requested) > summary[f'{key}_remaining']:
+            errors.append(f'请求{label}数 ({len(requested)}) 超过剩余{label}数 ({summary[f"{key}_remaining"]})')
+        elif len(requested) > remaining:
+            errors.append(f'请求{label}数 ({len(requested)}) 超过 {_format_window(begin, end)} 内剩余{label}数 ({remaining})')
+        return errors
+
+    def fits(self, need, begin, end, summary):
+        free, remaining = self._free_ids(begin, end)
+        if summary:
+            free = [i for i in free if i not in summary[f'{self.resource.key}_occupied']]
+            remaining = min(remaining, summary[f'{self.resource.key}_remaining'], len(free))
+        return remaining >= need, free
+
+    def ends_after(self, begin):
+        for tree in list(self.trees.values()) + [self.unnamed]:
+            for _, end, _, _ in tree.overlapping(begin, math.inf):
+                yield end
+
+
+class PoolSchedule:
+    """数量资源：一棵区间树，值为占用量（"all" 为总量）"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.tree = IntervalTree()
+
+    def _amount(self, demand):
+        if demand == 'all':
+            return self.resource.total
+        if isinstance(demand, int):
+            return demand
+        return 0
+
+    def add(self, row_index, demand, begin, end):
+        amount = self._amount(demand)
+        if amount > 0:
+            self.tree.add(begin, end, row_index, amount)
+
+    def remove(self, row_index, demand, begin):
+        if self._amount(demand) > 0:
+            self.tree.remove(begin, row_index)
+
+    def _remaining(self, begin, end):
+        return max(0, self.resource.total - _peak(self.tree.overlapping(begin, end), begin, end))
+
+    def errors(self, demand, begin, end, summary):
+        if demand is None:
+            return []
+        if self.resource.is_invalid(demand):
+            return [self.resource.format_error()]
+        label = self.resource.label
+        errors = []
+        requested = self._amount(demand)
+        if summary and requested > summary[f'{self.resource.key}_remaining']:
+            errors.append(f'请求{label} ({requested}) 超过剩余{label} ({summary[f"{self.resource.key}_remaining"]})')
+        else:
+            remaining = self._remaining(begin, end)
+            if requested > remaining:
+                errors.append(f'请求{label} ({requested}) 超过 {_format_window(begin, end)} 内剩余{label} ({remaining})')
+        return errors
+
+    def fits(self, need, begin, end, summary):
+        remaining = self._remaining(begin, end)
+        if summary:
+            remaining = min(remaining, summary[f'{self.resource.key}_remaining'])
+        return remaining >= need, remaining
+
+    def ends_after(self, begin):
+        for _, end, _, _ in self.tree.overlapping(begin, math.inf):
+            yield end
+
+
+class SeatSchedule(PoolSchedule):
+    """名额资源：与数量资源相同，每条记录占用一个名额"""
+
+    def _amount(self, demand):
+        return 1 if demand is True else 0
+
+    def errors(self, demand, begin, end, summary):
+        if self.resource.is_invalid(demand):
+            return [self.resource.format_error()]
+        if not demand:
+            return []
+        label = self.resource.label
+        if summary and summary[f'{self.resource.key}_remaining'] < 1:
+            return [f'{label}已被占用，请等待当前任务完成']
+        if self._remaining(begin, end) < 1:
+            return [f'{label}在 {_format_window(begin, end)} 内已被预约']
+        return []
+
+
+SCHEDULE_KINDS = {'discrete': DiscreteSchedule, 'pool': PoolSchedule, 'seat': SeatSchedule}
+
+
+class ServerSchedule:
+    """一台服务器的预约表，调用方需持有该服务器的锁"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.schedules = [SCHEDULE_KINDS[resource.kind](resource) for resource in spec.resources]
+        self.bookings = IntervalTree()  # 全部未完成记录的时间段，用于按时间查询
+
+    @staticmethod
+    def window(record):
+        return to_seconds(record.booking_start, -math.inf), to_seconds(record.booking_end, math.inf)
+
+    def add(self, row_index, record):
+        begin, end = self.window(record)
+        self.bookings.add(begin, end, row_index)
+        for schedule, demand in zip(self.schedules, record.demand):
+            schedule.add(row_index, demand, begin, end)
+
+    def remove(self, row_index, record):
+        begin, _ = self.window(record)
+        if not self.bookings.remove(begin, row_index):
+            return
+        for schedule, demand in zip(self.schedules, record.demand):
+            schedule.remove(row_index, demand, begin)
+
+    def reservation_errors(self, record, summary, now):
+        """检查登记请求与其时间段内其他记录的冲突；时间段已开始时同时检查当前占用 summary"""
+        begin, end = self.window(record)
+        current = summary if begin <= to_seconds(now, 0) else None
+        errors = []
+        for schedule, demand in zip(self.schedules, record.demand):
+            errors.extend(schedule.errors(demand, begin, end, current))
+        return errors
+
+    def overlapping(self, begin, end):
+        """与 [begin, end) 重叠的记录 [(开始, 结束, 行号)]，时间为 datetime，未知的一端为 None"""
+        return [(from_seconds(start), from_seconds(stop), row_index)
+                for start, stop, row_index, _ in self.bookings.overlapping(to_seconds(begin, -math.inf),
+                                                                           to_seconds(end, math.inf))]
+
+    def next_free_slot(self, needs, hours, after, summary, now):
+        """after 之后最早能连续 hours 小时满足 needs（ServerSpec.parse_needs）的时间段
+
+        候选开始时间为 after 和其后各段预约的结束时间，逐个检查，返回 (开始, 结束, {资源: 空闲编号或余量})，
+        没有满足的时间段（被无结束时间的记录占用）时返回 None
+        """
+        length = hours * 3600
+        after = max(to_seconds(after, 0), to_seconds(now, 0))
+        relevant = [schedule for schedule in self.schedules if needs.get(schedule.resource.key)]
+        candidates = {after}
+        for schedule in relevant:
+            candidates.update(end for end in schedule.ends_after(after) if math.isfinite(end))
+        now_seconds = to_seconds(now, 0)
+        for begin in sorted(candidates):
+            end = begin + length
+            current = summary if begin <= now_seconds else None
+            available = {}
+            for schedule in relevant:
+                ok, free = schedule.fits(needs[schedule.resource.key], begin, end, current)
+                if not ok:
+                    break
+                available[schedule.resource.key] = free
+            else:
+                return from_seconds(begin), from_seconds(end), available
+        return None
@@ -0,0 +1,835 @@
+"""记录存储后端
+
+ServerManager 通过 RecordStorage 接口读写记录，不再直接整表读写 Excel：
+- ExcelStorage：原有方式，每次修改整表重写 .xlsx
+- JournaledExcelStorage：Excel 仍是数据源，写入先追加到日志并立即生效，后台线程批量合并回 .xlsx
+- SQLiteStorage：嵌入式 SQLite（WAL 模式），每批写入一个事务，Excel 仅作为导出目标
+- FeatherStorage：与 JournaledExcelStorage 相同的日志机制，合并目标为列式的 Arrow IPC（Feather）文件，
+  启动时内存映射读取，Excel 仅作为导出目标（需要 pyarrow）
+
+行号(row_index)的含义与原来一致：按插入顺序排列的第几条记录（从0开始）。
+"""
+import atexit
+import bisect
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from duration import TYPED_COLUMNS, TYPED_SOURCES, parse_record_columns
+from filewatch import file_signature
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:
+    pa = None
+
+def to_text(value):
+    """把 Excel/pandas 读出的单元格值规范化为字符串"""
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        if pd.isna(value):
+            return ''
+        if value.is_integer():
+            return str(int(value))
+        return str(value)
+    if isinstance(value, (pd.Timestamp, datetime)):
+        if pd.isna(value):
+            return ''
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def write_atomic(path, data):
+    """写入临时文件后替换 path，文件内容和目录项都 fsync 后才返回；所在目录不存在时先创建，并 fsync 其上级目录"""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        fsync_dir(os.path.dirname(directory) or '.')
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(directory)
+
+
+def fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class RecordStorage:
+    """存储后端接口"""
+
+    def init_server(self, server_type, columns):
+        raise NotImplementedError
+
+    def load(self, server_type):
+        """读取全部记录，返回 DataFrame"""
+        raise NotImplementedError
+
+    def load_typed(self, server_type):
+        """读取全部记录，返回 (DataFrame, 类型化列)，类型化列见 duration.parse_record_columns；
+        不保存类型化列的后端第二项为 None，由调用方解析"""
+        return self.load(server_type), None
+
+    def write_batch(self, server_type, operations):
+        """按顺序执行一批写入（组提交），operations 为 ('append', 记录) 或 ('update', row_index, {字段: 值})；
+        各后端以一次事务、一次日志 fsync 或一次重写文件完成"""
+        raise NotImplementedError
+
+    def replace(self, server_type, records):
+        """用 records 整体替换该服务器的全部记录（从备份恢复、归档时使用）"""
+        raise NotImplementedError
+
+    def watched_files(self):
+        """可能被外部程序修改的数据源文件 {server_type: 路径}，由 ServerManager 监视"""
+        return {}
+
+    def changed_externally(self, server_type):
+        """数据源文件是否在本进程最后一次读写之后被外部修改"""
+        return False
+
+    def reload(self, server_type):
+        """数据源文件被外部修改后重新读取"""
+
+    def load_changes(self, server_type):
+        """本进程最后一次 load（或 load_changes）之后其他进程新增或修改的行 [(row_index, {字段: 文本})]，按行号排列；
+        无法确定时（如整表替换后，或后端不支持）返回 None，调用方改为完整加载"""
+        return None
+
+
+class ExcelStorage(RecordStorage):
+    """直接读写 Excel 文件的存储后端"""
+
+    def __init__(self, files):
+        self.files = files
+        self._columns = {}
+        # 本进程最后一次读写后文件的签名，与当前签名不同说明被外部修改过；
+        # _external 为写入前发现被外部修改、但尚未重新加载的服务器
+        self._written = {}
+        self._external = set()
+
+    def init_server(self, server_type, columns):
+        self._columns[server_type] = columns
+        filename = self.files[server_type]
+        if not os.path.exists(filename):
+            df = pd.DataFrame(columns=columns)
+            df.to_excel(filename, index=False)
+        else:
+            # 检查并添加新列
+            _add_missing_columns(filename, columns)
+        self._written[server_type] = file_signature(filename)
+
+    def load(self, server_type):
+        filename = self.files[server_type]
+        if not os.path.exists(filename):
+            return pd.DataFrame(columns=self._columns.get(server_type, []))
+        return pd.read_excel(filename)
+
+    def write_batch(self, server_type, operations):
+        """读取一次、依次应用、重写一次；返回生效的写入数"""
+        filename = self.files[server_type]
+        appended = [op[1] for op in operations if op[0] == 'append']
+        if not appended and not os.path.exists(filename):
+            return 0
+        self._check_external(server_type)
+        df = pd.read_excel(filename)
+        if appended:
+            df = pd.concat([df, pd.DataFrame(appended)], ignore_index=True)
+        applied = len(appended)
+        for op in operations:
+            if op[0] != 'update':
+                continue
+            _, row_index, fields = op
+            if 0 <= row_index < len(df):
+                for column, value in fields.items():
+                    if column in df.columns and df[column].dtype != object:
+                        df[column] = df[column].astype(object)
+                    df.at[row_index, column] = value
+                applied += 1
+        if applied:
+            df.to_excel(filename, index=False)
+            self._written[server_type] = file_signature(filename)
+        return applied
+
+    def replace(self, server_type, records):
+        pd.DataFrame(records, columns=self._columns[server_type]).to_excel(self.files[server_type], index=False)
+        self._written[server_type] = file_signature(self.files[server_type])
+
+    def _check_external(self, server_type):
+        """读取-修改-写回之前调用：文件已被外部修改时记下，写回后签名虽与本进程一致，仍需要重新加载"""
+        if file_signature(self.files[server_type]) != self._written.get(server_type):
+            self._external.add(server_type)
+
+    def watched_files(self):
+        return dict(self.files)
+
+    def changed_externally(self, server_type):
+        return (server_type in self._external
+                or file_signature(self.files[server_type]) != self._written.get(server_type))
+
+    def reload(self, server_type):
+        # 每次 load 都读取文件，只需要以当前文件为准
+        self._external.discard(server_type)
+        self._written[server_type] = file_signature(self.files[server_type])
+
+
+class JournaledExcelStorage(ExcelStorage):
+    """带预写日志的 Excel 存储后端
+
+    每次写入以 JSON 行追加到 journal/<服务器>.jsonl（逐条 fsync），同时作用于内存中的表，
+    因此登记请求只需一次 O(1) 追加。后台合并线程定期把内存表整体写回 .xlsx 并截断日志；
+    启动时先读取 .xlsx 再重放日志，崩溃后不会丢失已确认的写入。
+
+    日志条目可重复重放：追加记录带有目标行号，行号小于当前行数时说明已写入 .xlsx，直接跳过；
+    更新记录是对字段赋值，按顺序重放结果不变。
+    """
+
+    def __init__(self, files, journal_dir='journal', compact_interval=10, compact_batch=100):
+        super().__init__(files)
+        self.journal_dir = journal_dir
+        self.compact_interval = compact_interval
+        self.compact_batch = compact_batch
+        self._rows = {}
+        self._pending = {}
+        self._journal_handles = {}
+        self._base_rows = {}  # 最后一次读取或合并时 .xlsx 的行数
+        self._locks = {}  # 每台服务器一把锁，两台服务器的日志写入（含 fsync）互不阻塞
+        self._compact_lock = threading.Lock()  # 合并之间、合并与重新加载互斥
+        self._compact_event = threading.Event()
+
+        if not os.path.exists(self.journal_dir):
+            os.makedirs(self.journal_dir)
+
+        compactor = threading.Thread(target=self._compact_loop)
+        compactor.daemon = True
+        compactor.start()
+        atexit.register(self.compact)
+
+    def _journal_path(self, server_type):
+        return os.path.join(self.journal_dir, f'{server_type}.jsonl')
+
+    def init_server(self, server_type, columns):
+        self._open(server_type, columns)
+
+    def changed_externally(self, server_type):
+        # 合并持有该服务器的锁替换文件并更新签名，加锁后读取不会看到替换了文件、签名尚未更新的中间状态
+        with self._locks[server_type]:
+            return super().changed_externally(server_type)
+
+    def reload(self, server_type):
+        """.xlsx 被外部修改后重新读取，再重放尚未合并的日志"""
+        with self._compact_lock:
+            with self._locks[server_type]:
+                self._journal_handles[server_type].close()
+            self._external.discard(server_type)
+            self._open(server_type, self._columns[server_type], self._base_rows.get(server_type))
+
+    def _open(self, server_type, columns, base_rows=None):
+        """读取合并目标并重放日志，打开日志文件
+
+        base_rows 为外部修改前 .xlsx 的行数：外部在末尾增删了行时，日志中本进程追加的行（行号不小于 base_rows）
+        按行数的变化平移，仍追加在末尾，不会因为行号已存在被当作已合并而跳过
+        """
+        self._init_base(server_type, columns)
+        self._written[server_type] = file_signature(self.files[server_type])
+        rows = self._read_base(server_type)
+        offset = len(rows) - base_rows if base_rows is not None else 0
+        self._base_rows[server_type] = len(rows)
+
+        # 先重放上次未完成合并的日志，再重放当前日志
+        replayed = 0
+        journal_path = self._journal_path(server_type)
+        for path in (journal_path + '.compacting', journal_path):
+            for entry in _read_journal(path):
+                if entry['op'] == 'replace':
+                    offset = 0
+                elif offset and entry['row'] >= base_rows:
+                    entry = dict(entry, row=entry['row'] + offset)
+                _apply_entry(rows, entry)
+                replayed += 1
+
+        self._locks.setdefault(server_type, threading.Lock())
+        with self._locks[server_type]:
+            self._rows[server_type] = rows
+            self._pending[server_type] = replayed
+            self._journal_handles[server_type] = open(journal_path, 'a', encoding='utf-8')
+        if replayed:
+            print(f"已从日志重放 {server_type} 的 {replayed} 条写入")
+            self._compact_event.set()
+
+    def _init_base(self, server_type, columns):
+        """确保合并目标文件存在且包含所有列"""
+        ExcelStorage.init_server(self, server_type, columns)
+
+    def _read_base(self, server_type):
+        return pd.read_excel(self.files[server_type]).to_dict('records')
+
+    def _write_base(self, server_type, rows, path):
+        pd.DataFrame(rows, columns=self._columns[server_type]).to_excel(path, index=False)
+
+    def _write_entry(self, server_type, entry):
+        """追加日志并作用于内存表，调用方需持有该服务器的锁"""
+        self._write_entries(server_type, [entry])
+
+    def _write_entries(self, server_type, entries):
+        """追加多条日志（一次 fsync）并依次作用于内存表，调用方需持有该服务器的锁"""
+        handle = self._journal_handles[server_type]
+        handle.write(''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in entries))
+        handle.flush()
+        os.fsync(handle.fileno())
+        for entry in entries:
+            _apply_entry(self._rows[server_type], entry)
+        self._pending[server_type] += len(entries)
+        if self._pending[server_type] >= self.compact_batch:
+            self._compact_event.set()
+
+    def load(self, server_type):
+        with self._locks[server_type]:
+            rows = list(self._rows[server_type])
+        return pd.DataFrame(rows, columns=self._columns[server_type])
+
+    def write_batch(self, server_type, operations):
+        with self._locks[server_type]:
+            size = len(self._rows[server_type])
+            entries = []
+            for op in operations:
+                if op[0] == 'append':
+                    entries.append({'op': 'append', 'row': size, 'record': op[1]})
+                    size += 1
+                elif 0 <= op[1] < size:
+                    entries.append({'op': 'update', 'row': op[1], 'fields': op[2]})
+            if entries:
+                self._write_entries(server_type, entries)
+
+    def replace(self, server_type, records):
+        with self._locks[server_type]:
+            self._write_entry(server_type, {'op': 'replace', 'records': [dict(record) for record in records]})
+
+    def _compact_loop(self):
+        while True:
+            self._compact_event.wait(self.compact_interval)
+            self._compact_event.clear()
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"日志合并出错: {str(e)}")
+
+    def compact(self):
+        """把日志合并回 .xlsx"""
+        for server_type in list(self._rows):
+            self._compact_server(server_type)
+
+    def _compact_server(self, server_type):
+        with self._compact_lock:
+            self._compact_locked(server_type)
+
+    def _compact_locked(self, server_type):
+        journal_path = self._journal_path(server_type)
+        compacting_path = journal_path + '.compacting'
+        filename = self.files[server_type]
+
+        with self._locks[server_type]:
+            if not self._pending.get(server_type):
+                return
+            if file_signature(filename) != self._written.get(server_type):
+                # 文件被外部修改、尚未重新加载，此时合并会覆盖外部的修改
+                return
+            # 轮换日志：合并期间的新写入进入新日志，不会丢失
+            self._journal_handles[server_type].close()
+            if os.path.exists(compacting_path):
+                with open(journal_path, 'rb') as src, open(compacting_path, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(journal_path)
+            else:
+                os.replace(journal_path, compacting_path)
+            self._journal_handles[server_type] = open(journal_path, 'a', encoding='utf-8')
+            rows = self._snapshot_rows(server_type)
+            self._pending[server_type] = 0
+
+        root, ext = os.path.splitext(filename)
+        tmp_name = f'{root}.tmp{ext}'
+        try:
+            self._write_base(server_type, rows, tmp_name)
+            # 替换文件与更新签名在同一把锁内完成，见 changed_externally
+            with self._locks[server_type]:
+                os.replace(tmp_name, filename)
+                self._written[server_type] = file_signature(filename)
+                self._base_rows[server_type] = len(rows)
+                self._compacted(server_type, rows)
+        except Exception:
+            # 保留 .compacting 日志，下一轮重试
+            with self._locks[server_type]:
+                self._pending[server_type] += 1
+            raise
+        os.remove(compacting_path)
+
+    def _snapshot_rows(self, server_type):
+        """合并时写回的内存表副本，调用方需持有该服务器的锁"""
+        return [dict(row) for row in self._rows[server_type]]
+
+    def _compacted(self, server_type, rows):
+        """rows 已写回合并目标之后调用，调用方需持有该服务器的锁"""
+
+
+class FeatherStorage(JournaledExcelStorage):
+    """Arrow IPC（Feather v2）文件 + 预写日志的存储后端
+
+    写入与 JournaledExcelStorage 相同：先追加日志，后台线程批量合并。合并目标换成不压缩的 .arrow 文件，
+    启动和重新加载时内存映射读取，不再经过 openpyxl 解析。
+
+    文本列原样保存（是数据的唯一来源），另外附带由其解析的类型化列（duration.TYPED_COLUMNS：登记时间 datetime、
+    预计/实际使用小时 float、已完成 bool）。内存表是 _ArrowRows：文件中的行留在内存映射的 Arrow 表中，
+    不逐行转换为字典，日志中的写入另外保存；load() 整列转换文本列，load_typed() 直接取用文件中的类型化列，
+    只解析日志中追加的行和修改过来源列的行。首次启动时如果存在旧的 .xlsx，会导入其中的记录。
+    """
+
+    def __init__(self, directory, legacy_files=None, **kwargs):
+        if pa is None:
+            raise RuntimeError('feather 存储后端需要安装 pyarrow：pip install pyarrow')
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.legacy_files = legacy_files or {}
+        files = {server_type: os.path.join(directory, f'{server_type}_records.arrow') for server_type in self.legacy_files}
+        super().__init__(files, **kwargs)
+
+    def watched_files(self):
+        # .arrow 文件不会被手工编辑
+        return {}
+
+    def _init_base(self, server_type, columns):
+        self._columns[server_type] = columns
+        filename = self.files[server_type]
+        if os.path.exists(filename):
+            return
+        rows = []
+        legacy_file = self.legacy_files.get(server_type)
+        if legacy_file and os.path.exists(legacy_file):
+            df = pd.read_excel(legacy_file)
+            if '实际使用时间' not in df.columns and '预计使用时间' in df.columns:
+                df['实际使用时间'] = df['预计使用时间']
+            rows = df.reindex(columns=columns).to_dict('records')
+            print(f"已从 {legacy_file} 导入 {len(rows)} 条记录到 {filename}")
+        root, ext = os.path.splitext(filename)
+        self._write_base(server_type, rows, f'{root}.tmp{ext}')
+        os.replace(f'{root}.tmp{ext}', filename)
+
+    def _read_base(self, server_type):
+        return _ArrowRows(feather.read_table(self.files[server_type], memory_map=True), self._columns[server_type])
+
+    def _write_base(self, server_type, rows, path):
+        columns = self._columns[server_type]
+        if isinstance(rows, _ArrowRows):
+            text = rows.frame()
+            typed = rows.typed(text)
+        else:
+            text = pd.DataFrame(rows, columns=columns).map(to_text) if rows else pd.DataFrame(columns=columns, dtype=object)
+            typed = parse_record_columns(text)
+        arrays = {col: pa.array(text[col].tolist(), type=pa.string()) for col in columns}
+        arrays.update({
+            '登记时间': pa.array(typed['登记时间'], type=pa.timestamp('s'), from_pandas=True),
+            '预计使用小时': pa.array(typed['预计使用小时'], type=pa.float64()),
+            '实际使用小时': pa.array(typed['实际使用小时'], type=pa.float64()),
+            '已完成': pa.array(typed['已完成'], type=pa.bool_()),
+        })
+        # 不压缩，读取时才能直接内存映射
+        feather.write_feather(pa.table(arrays), path, compression='uncompressed')
+
+    def _snapshot(self, server_type):
+        with self._locks[server_type]:
+            return self._snapshot_rows(server_type)
+
+    def _snapshot_rows(self, server_type):
+        return self._rows[server_type].snapshot()
+
+    def _compacted(self, server_type, rows):
+        # 合并期间没有新的写入时改为映射新文件，之前的修改和追加都已在文件中，不再单独保存
+        current = self._rows[server_type]
+        if rows.origin is current and rows.version == current.version:
+            self._rows[server_type] = self._read_base(server_type)
+
+    def load(self, server_type):
+        return self._snapshot(server_type).frame()
+
+    def load_typed(self, server_type):
+        rows = self._snapshot(server_type)
+        df = rows.frame()
+        return df, rows.typed(df)
+
+
+class _ArrowRows:
+    """FeatherStorage 的内存表：文件中的行（Arrow 表）加上之后日志中的写入
+
+    文件中的行不逐行转换为字典；日志修改的字段按行号保存在 changed 中，追加的记录保存在 appended 中。
+    由 _apply_entry 按日志条目修改，修改只在该服务器的锁内进行，读取和合并使用 snapshot() 的副本
+    """
+
+    def __init__(self, table, columns):
+        self.table = table  # 整表替换后为 None
+        self.columns = columns
+        self.base_count = table.num_rows if table is not None else 0
+        self.changed = {}
+        self.appended = []
+        self.version = 0  # 每作用一条日志加一，合并完成时据此判断期间是否有新的写入
+        self.origin = self
+        self._base = None  # 文件中各行的文本列（DataFrame），第一次需要时整列转换，快照之间共用
+
+    def __len__(self):
+        return self.base_count + len(self.appended)
+
+    def apply(self, entry):
+        self.version += 1
+        if entry['op'] == 'replace':
+            self.table, self.base_count, self._base = None, 0, None
+            self.changed = {}
+            self.appended = [dict(record) for record in entry['records']]
+            return
+        row_index = entry['row']
+        if entry['op'] == 'append':
+            if row_index >= len(self):
+                self.appended.append(dict(entry['record']))
+        elif entry['op'] == 'update':
+            if 0 <= row_index < self.base_count:
+                self.changed.setdefault(row_index, {}).update(entry['fields'])
+            elif self.base_count <= row_index < len(self):
+                self.appended[row_index - self.base_count].update(entry['fields'])
+
+    def snapshot(self):
+        self._base_frame()
+        copy = _ArrowRows(self.table, self.columns)
+        copy.changed = {row_index: dict(fields) for row_index, fields in self.changed.items()}
+        copy.appended = [dict(record) for record in self.appended]
+        copy.version, copy.origin, copy._base = self.version, self, self._base
+        return copy
+
+    def _base_frame(self):
+        if self._base is None:
+            if self.table is None:
+                self._base = pd.DataFrame(columns=self.columns, dtype=object)
+            else:
+                present = [col for col in self.columns if col in self.table.column_names]
+                self._base = self.table.select(present).to_pandas().reindex(columns=self.columns, fill_value='')
+        return self._base
+
+    def frame(self):
+        """全部记录的文本列"""
+        # 浅复制：调用方替换列时不影响共用的基础文本列
+        df = self._base_frame().copy(deep=False)
+        if self.changed:
+            touched = {col for fields in self.changed.values() for col in fields if col in self.columns}
+            for col in touched:
+                values = df[col].to_numpy(dtype=object, copy=True)
+                for row_index, fields in self.changed.items():
+                    if col in fields:
+                        values[row_index] = to_text(fields[col])
+                df[col] = values
+        if self.appended:
+            appended = pd.DataFrame([[to_text(record.get(col, '')) for col in self.columns] for record in self.appended],
+                                    columns=self.columns, index=range(self.base_count, len(self)), dtype=object)
+            df = pd.concat([df, appended]) if self.base_count else appended
+        return df
+
+    def typed(self, df):
+        """df（frame() 的结果）对应的类型化列：文件中的行直接取用，只解析追加的行和修改过来源列的行"""
+        if self.table is None or not all(col in self.table.column_names for col in TYPED_COLUMNS):
+            # 旧版本写入的文件没有类型化列
+            return parse_record_columns(df)
+        base = self.table.select(list(TYPED_COLUMNS)).to_pandas()
+        stale = [row_index for row_index, fields in sorted(self.changed.items())
+                 if any(col in fields for col in TYPED_SOURCES)]
+        stale.extend(range(self.base_count, len(self)))
+        if not stale:
+            base.index = df.index
+            return base
+        columns = {}
+        for col in TYPED_COLUMNS:
+            values = np.empty(len(df), dtype=base[col].dtype)
+            values[:self.base_count] = base[col].to_numpy()
+            columns[col] = values
+        parsed = parse_record_columns(df.iloc[stale])
+        for col in TYPED_COLUMNS:
+            columns[col][stale] = parsed[col].to_numpy()
+        return pd.DataFrame(columns, index=df.index)
+
+
+def _read_journal(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 崩溃时最后一行可能只写了一半，之前的条目都已 fsync
+                print(f"忽略日志 {path} 中不完整的条目")
+
+
+def _apply_entry(rows, entry):
+    if isinstance(rows, _ArrowRows):
+        rows.apply(entry)
+        return
+    if entry['op'] == 'replace':
+        rows[:] = [dict(record) for record in entry['records']]
+        return
+    row_index = entry['row']
+    if entry['op'] == 'append':
+        if row_index >= len(rows):
+            rows.append(dict(entry['record']))
+    elif entry['op'] == 'update':
+        if 0 <= row_index < len(rows):
+            rows[row_index].update(entry['fields'])
+
+
+class SQLiteStorage(RecordStorage):
+    """SQLite 存储后端（WAL 模式）
+
+    每台服务器一张表，自增主键 id 决定记录顺序；所有字段以文本保存，空值保存为空字符串。
+    行号到主键的对应保存在内存中（_row_ids），按行号读写不需要 OFFSET 扫描；
+    其他进程新增的行在查不到时从数据库补全，整表替换后主键全部改变，找不到行时重新读取。
+
+    每次写入的行带上递增的写入序号 _seq（有索引），整表替换时 meta 中该服务器的代数加一。
+    _seen 记下本进程已读到的 (代数, 最大序号)，load_changes 只读取序号更大的行，其他进程写入后不必重新读取整表。
+    """
+
+    def __init__(self, db_path, legacy_files=None):
+        self.db_path = db_path
+        self.legacy_files = legacy_files or {}
+        self._columns = {}
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._row_ids = {}
+        self._row_ids_lock = threading.Lock()
+        self._seen = {}
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _table(server_type):
+        return f'records_{server_type}'
+
+    def init_server(self, server_type, columns):
+        self._columns[server_type] = columns
+        conn = self._connect()
+        table = self._table(server_type)
+        column_defs = ', '.join(f'"{col}" TEXT NOT NULL DEFAULT \'\'' for col in columns)
+        with self._write_lock, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, {column_defs})')
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for col in columns:
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN "{col}" TEXT NOT NULL DEFAULT \'\'')
+            if '_seq' not in existing:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN _seq INTEGER NOT NULL DEFAULT 0')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {table}_seq ON {table} (_seq)')
+
+        legacy_file = self.legacy_files.get(server_type)
+        if legacy_file and os.path.exists(legacy_file):
+            migrate_excel_to_sqlite(self, server_type, legacy_file)
+
+    def _select_columns(self, server_type):
+        return ', '.join(f'"{col}"' for col in self._columns[server_type])
+
+    def _generation(self, conn, server_type):
+        row = conn.execute('SELECT value FROM meta WHERE key = ?', (f'generation_{server_type}',)).fetchone()
+        return int(row[0]) if row else 0
+
+    def _read(self, conn, server_type, since_seq=None):
+        """在一个读事务中读取代数和 (id, _seq, 各列) 行，since_seq 不为 None 时只读序号更大的行"""
+        query = f'SELECT id, _seq, {self._select_columns(server_type)} FROM {self._table(server_type)}'
+        params = ()
+        if since_seq is not None:
+            query += ' WHERE _seq > ?'
+            params = (since_seq,)
+        conn.execute('BEGIN')
+        try:
+            return self._generation(conn, server_type), conn.execute(query + ' ORDER BY id', params).fetchall()
+        finally:
+            conn.commit()
+
+    def load(self, server_type):
+        conn = self._connect()
+        columns = self._columns[server_type]
+        generation, rows = self._read(conn, server_type)
+        with self._row_ids_lock:
+            self._row_ids[server_type] = [row[0] for row in rows]
+            self._seen[server_type] = (generation, max((row[1] for row in rows), default=0))
+        return pd.DataFrame([row[2:] for row in rows], columns=columns)
+
+    def load_changes(self, server_type):
+        conn = self._connect()
+        columns = self._columns[server_type]
+        with self._row_ids_lock:
+            seen = self._seen.get(server_type)
+        if seen is None:
+            return None
+        generation, rows = self._read(conn, server_type, since_seq=seen[1])
+        if generation != seen[0]:
+            return None
+        changes = []
+        with self._row_ids_lock:
+            ids = self._row_ids.setdefault(server_type, [])
+            if rows and rows[-1][0] > (ids[-1] if ids else 0):
+                ids.extend(row[0] for row in conn.execute(
+                    f'SELECT id FROM {self._table(server_type)} WHERE id > ? ORDER BY id', (ids[-1] if ids else 0,)))
+            for row in rows:
+                row_index = bisect.bisect_left(ids, row[0])
+                if row_index == len(ids) or ids[row_index] != row[0]:
+                    return None
+                changes.append((row_index, dict(zip(columns, row[2:]))))
+            self._seen[server_type] = (generation, max((row[1] for row in rows), default=seen[1]))
+        return changes
+
+    def _row_id(self, conn, server_type, row_index, refresh=False):
+        if row_index < 0:
+            return None
+        with self._row_ids_lock:
+            ids = self._row_ids.setdefault(server_type, [])
+            if refresh:
+                ids.clear()
+            if row_index >= len(ids):
+                ids.extend(row[0] for row in conn.execute(
+                    f'SELECT id FROM {self._table(server_type)} WHERE id > ? ORDER BY id', (ids[-1] if ids else 0,)))
+            return ids[row_index] if row_index < len(ids) else None
+
+    def _insert_rows(self, conn, server_type, records, seq=0):
+        columns = self._columns[server_type]
+        placeholders = ', '.join('?' for _ in columns)
+        values = [(*(to_text(record.get(col, '')) for col in columns), seq) for record in records]
+        conn.executemany(
+            f'INSERT INTO {self._table(server_type)} ({self._select_columns(server_type)}, _seq) '
+            f'VALUES ({placeholders}, ?)',
+            values
+        )
+
+    def write_batch(self, server_type, operations):
+        """一个事务内执行，连续的追加合并为一次 executemany；本批写入的行使用同一个新的写入序号"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            seq = conn.execute(f'SELECT COALESCE(MAX(_seq), 0) + 1 FROM {self._table(server_type)}').fetchone()[0]
+            appended = []
+            for op in operations:
+                if op[0] == 'append':
+                    appended.append(op[1])
+                    continue
+                if appended:
+                    self._insert_rows(conn, server_type, appended, seq)
+                    appended = []
+                self._update_row(conn, server_type, op[1], op[2], seq)
+            if appended:
+                self._insert_rows(conn, server_type, appended, seq)
+        with self._row_ids_lock:
+            # 上次读取之后没有其他进程写入时，本批之前的行都已读到，不必再读本批写入的行
+            seen = self._seen.get(server_type)
+            if seen is not None and seen[1] == seq - 1:
+                self._seen[server_type] = (seen[0], seq)
+
+    def _update_row(self, conn, server_type, row_index, fields, seq=0):
+        columns = [col for col in fields if col in self._columns[server_type]]
+        assignments = ', '.join([f'"{col}" = ?' for col in columns] + ['_seq = ?'])
+        values = [to_text(fields[col]) for col in columns] + [seq]
+        for refresh in (False, True):
+            row_id = self._row_id(conn, server_type, row_index, refresh)
+            if row_id is None:
+                continue
+            if not columns:
+                return True
+            cursor = conn.execute(f'UPDATE {self._table(server_type)} SET {assignments} WHERE id = ?', (*values, row_id))
+            if cursor.rowcount:
+                return True
+        return False
+
+    def replace(self, server_type, records):
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute(f'DELETE FROM {self._table(server_type)}')
+            self._insert_rows(conn, server_type, records)
+            # 主键全部改变，其他进程的 load_changes 随之改为完整加载
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, 1) "
+                         "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1",
+                         (f'generation_{server_type}',))
+        with self._row_ids_lock:
+            self._row_ids.pop(server_type, None)
+            self._seen.pop(server_type, None)
+
+
+def _add_missing_columns(filename, expected_columns):
+    """为现有Excel文件添加缺失的列"""
+    df = pd.read_excel(filename)
+    current_columns = list(df.columns)
+
+    # 检查是否需要添加新列
+    missing_columns = [col for col in expected_columns if col not in current_columns]
+
+    if missing_columns:
+        for col in missing_columns:
+            if col == '实际使用时间':
+                # 如果没有实际使用时间列，用预计使用时间填充
+                df[col] = df.get('预计使用时间', '')
+            else:
+                df[col] = ''
+
+        # 按照期望的列顺序重新排列
+        df = df.reindex(columns=expected_columns)
+        df.to_excel(filename, index=False)
+
+
+def migrate_excel_to_sqlite(storage, server_type, excel_file):
+    """把旧的 Excel 记录一次性导入 SQLite，已迁移过的服务器直接跳过"""
+    conn = storage._connect()
+    meta_key = f'migrated_{server_type}'
+    if conn.execute('SELECT value FROM meta WHERE key = ?', (meta_key,)).fetchone():
+        return 0
+
+    columns = storage._columns[server_type]
+    df = pd.read_excel(excel_file)
+    for col in columns:
+        if col not in df.columns:
+            df[col] = df['预计使用时间'] if col == '实际使用时间' and '预计使用时间' in df.columns else ''
+    records = df.reindex(columns=columns).to_dict('records')
+
+    # 导入与迁移标记在同一事务中提交，中途失败不会导致重复导入
+    with storage._write_lock, conn:
+        storage._insert_rows(conn, server_type, records)
+        conn.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            (meta_key, f'{excel_file}@{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
+        )
+    print(f"已从 {excel_file} 迁移 {len(records)} 条记录到 {storage.db_path}")
+    return len(records)
+
+
+def create_storage(backend, files, db_path='records.db', journal_dir='journal', feather_dir='data'):
+    """根据配置创建存储后端"""
+    if backend == 'excel':
+        return JournaledExcelStorage(files, journal_dir=journal_dir)
+    if backend == 'excel-direct':
+        return ExcelStorage(files)
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path, legacy_files=files)
+    if backend == 'feather':
+        return FeatherStorage(feather_dir, legacy_files=files, journal_dir=journal_dir)
+    raise ValueError(f'未知的存储后端: {backend}')
@@ -0,0 +1,126 @@
+"""利用率统计：NumPy 事件扫描（UsageTable.sweep）与逐条记录、逐段时间的朴素求和一致"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from analytics import ANALYTICS_KINDS, HOUR, UsageTable, usage_interval
+from inventory import SERVERS
+from records import Record
+from schedule import to_seconds
+
+NOW = datetime(2025, 6, 10, 11, 40)
+
+# (时间, 姓名, 任务类型, 预计使用时间, 实际使用时间, 是否完成, {服务器: {资源字段: 值}})
+ROWS = [
+    # 跨过窗口开始，只有一部分落在第一个桶
+    ('2025-06-09 22:30:00', 'alice', 'train', '3小时', '', '',
+     {'9755': {'占用节点': '0'}, '5520': {'使用核数': '40'}}),
+    # 与上一条在同一节点上重叠；5520 上合计超过总核数
+    ('2025-06-10 00:20:00', 'bob', 'train', '2.5h', '', '',
+     {'9755': {'占用节点': '0,1', '占用GPU': 'Yes'}, '5520': {'使用核数': '30', '占用GPU': 'Yes'}}),
+    # 已完成，按实际使用时间计，落在一个桶的中间
+    ('2025-06-10 03:10:00', 'alice', 'eval', '5小时', '45分钟', 'Yes',
+     {'9755': {'占用节点': 'Yes', '是否使用远程桌面': 'Yes'}, '5520': {'使用核数': 'all', '是否使用远程桌面': 'Yes'}}),
+    ('2025-06-10 03:30:00', 'carol', 'eval', '1h', '', '',
+     {'9755': {'占用节点': '2,3', '是否使用远程桌面': 'Yes'}, '5520': {'使用核数': '8', '是否使用远程桌面': 'Yes'}}),
+    # 提前预约一整天
+    ('2025-06-09 18:00:00', 'dave', 'train', '2025.6.10~2025.6.10', '', '',
+     {'9755': {'占用节点': '3', '占用GPU': '0,1'}, '5520': {'使用核数': '16'}}),
+    # 没有预计使用时间，一直使用到现在（最后一个桶只有一部分）
+    ('2025-06-10 10:15:00', 'carol', 'debug', '', '', '',
+     {'9755': {'占用节点': '1'}, '5520': {'使用核数': '4'}}),
+    # 窗口之外
+    ('2025-06-01 09:00:00', 'erin', 'train', '2小时', '', '',
+     {'9755': {'占用节点': '0'}, '5520': {'使用核数': '56'}}),
+]
+
+IDLE_FIELDS = {'9755': {'占用节点': '', '占用GPU': 'No', '是否使用远程桌面': 'No'},
+               '5520': {'使用核数': '', '占用GPU': 'No', '是否使用远程桌面': 'No'}}
+
+
+def make_records(spec):
+    records = []
+    for start, name, task, estimated, actual, done, demands in ROWS:
+        fields = {'时间': start, '姓名': name, '任务类型': task, '预计使用时间': estimated,
+                  '实际使用时间': actual, '是否完成': done, **IDLE_FIELDS[spec.id], **demands[spec.id]}
+        records.append(Record(fields, spec.resources))
+    return records
+
+
+def naive_sweep(columns, records, edges, now):
+    """逐个桶：按所有记录的起止时间切成小段，每段把覆盖它的记录的占用量相加；分组使用量逐条记录累加"""
+    intervals = []
+    for record in records:
+        begin, end = usage_interval(record)
+        if end == float('inf'):
+            end = max(begin, now)
+        intervals.append((begin, end))
+
+    results = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        clipped = [(max(begin, lo), min(end, hi)) for begin, end in intervals]
+        points = sorted({lo, hi, *(t for span in clipped for t in span if lo <= t <= hi)})
+        resources = {}
+        for column in columns:
+            stats = {'used_hours': 0.0, 'peak': 0.0}
+            if column.resource.kind == 'discrete':
+                stats['by_id'] = dict.fromkeys(column.resource.ids, 0.0)
+            resources[column.resource.key] = stats
+        for p, q in zip(points[:-1], points[1:]):
+            active = [record for record, (begin, end) in zip(records, clipped) if begin <= p and end >= q]
+            for column in columns:
+                stats = resources[column.resource.key]
+                position = columns.index(column)
+                level = np.zeros((1, column.width), dtype=np.int64)
+                for record in active:
+                    level[0] += column.values(record.demand[position])
+                used, busy = column.used(level)
+                stats['used_hours'] += float(used[0]) * (q - p) / HOUR
+                stats['peak'] = max(stats['peak'], float(used[0]))
+                if busy is not None:
+                    for i, flag in zip(column.resource.ids, busy[0]):
+                        stats['by_id'][i] += float(flag) * (q - p) / HOUR
+
+        groups = {'by_user': {}, 'by_task_type': {}}
+        for record, (begin, end) in zip(records, clipped):
+            if end <= begin:
+                continue
+            amounts = [column.amount(column.values(demand)) * (end - begin) / HOUR
+                       for column, demand in zip(columns, record.demand)]
+            for field, label in (('by_user', record.name), ('by_task_type', record.get('任务类型'))):
+                sums = groups[field].setdefault(label, [0.0] * len(columns))
+                groups[field][label] = [a + b for a, b in zip(sums, amounts)]
+        results.append({'resources': resources, **groups})
+    return results
+
+
+@pytest.mark.parametrize('server_type', sorted(SERVERS))
+@pytest.mark.parametrize('bucket_minutes, count', [(60, 12), (25, 29), (24 * 60, 1)])
+def test_sweep_matches_naive_sum(server_type, bucket_minutes, count):
+    spec = SERVERS[server_type]
+    columns = [ANALYTICS_KINDS[resource.kind](resource) for resource in spec.resources]
+    records = make_records(spec)
+    table = UsageTable(columns)
+    table.load(records)
+
+    start = to_seconds(datetime(2025, 6, 10), 0)
+    edges = np.array([start + i * bucket_minutes * 60 for i in range(count + 1)], dtype=float)
+    now = to_seconds(NOW, 0)
+    results = table.sweep(edges, now)
+    expected = naive_sweep(columns, records, list(edges), now)
+
+    assert len(results) == len(expected) == count
+    for result, naive in zip(results, expected):
+        for key, stats in naive['resources'].items():
+            actual = dict(result['resources'][key])
+            assert actual.pop('by_id', None) == pytest.approx(stats.pop('by_id', None))
+            assert actual == pytest.approx(stats)
+        for field in ('by_user', 'by_task_type'):
+            labels, sums = result[field]
+            actual = {(label, i): value for label, row in zip(labels, sums.tolist()) for i, value in enumerate(row)}
+            assert actual == pytest.approx({(label, i): value for label, row in naive[field].items()
+                                            for i, value in enumerate(row)})
+    # 确认用例覆盖了重叠和部分落在桶内的情况
+    assert any(stats['peak'] > 1 for result in results for stats in result['resources'].values())
+    assert sum(result['resources'][columns[0].resource.key]['used_hours'] for result in results) > 0
@@ -0,0 +1,794 @@
+"""app.py：并发登记时同一节点、同一时间段只有一个成功；多个 worker 共用存储时按增量同步其他 worker 的写入；
+记录接口的 ETag 验证与 since= 增量查询；翻页过程中归档时按记录ID游标接着翻页；PATCH 修改记录的各种响应；
+写入和重新加载作废导出缓存与受影响的利用率统计桶；批量导入的冲突、重复、错误行数上限与读取错误"""
+import gzip
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import app as app_module
+import pagecache
+from inventory import ID_COLUMN, SERVERS
+from schedule import to_seconds
+
+SERVER = '9755'
+THREADS = 16
+
+
+@pytest.fixture
+def storage_env(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    # 后台线程在测试结束后仍可能写入，所有目录都用绝对路径
+    for name, path in [('SQLITE_PATH', 'records.db'), ('BACKUP_DIR', 'backups'), ('COHERENCE_DIR', 'coherence'),
+                       ('ARCHIVE_DIR', 'archive')]:
+        monkeypatch.setenv(name, str(tmp_path / path))
+    monkeypatch.setattr(app_module, 'WATCH_FILES', False)
+    # 不在后台归档，需要时测试中调用 archive_completed
+    monkeypatch.setattr(app_module, 'ARCHIVE_INTERVAL', 0)
+    return tmp_path
+
+
+@pytest.fixture(params=[True, False], ids=['group-commit', 'per-request'])
+def manager(request, storage_env, monkeypatch):
+    monkeypatch.setattr(app_module, 'GROUP_COMMIT', request.param)
+    manager = app_module.ServerManager()
+    yield manager
+    manager.backups.flush()
+
+
+@pytest.fixture
+def workers(storage_env):
+    """共用同一个 SQLite 数据库和 coherence 目录的两个 ServerManager，相当于两个 worker 进程"""
+    managers = [app_module.ServerManager(), app_module.ServerManager()]
+    yield managers
+    for manager in managers:
+        manager.backups.flush()
+
+
+@pytest.fixture
+def client(manager, monkeypatch):
+    monkeypatch.setattr(app_module, 'server_manager', manager)
+    return app_module.app.test_client()
+
+
+def booking(name, nodes='0'):
+    return {'时间': '2099-12-31 12:00:00', '姓名': name, '占用节点': nodes, '占用GPU': 'No', '是否使用远程桌面': 'No',
+            '任务类型': 'test', '预计使用时间': '2100.1.10~2100.1.12', '实际使用时间': '', '是否完成': ''}
+
+
+def reserve_concurrently(manager, bookings):
+    barrier = threading.Barrier(len(bookings))
+    results = [None] * len(bookings)
+
+    def worker(i):
+        barrier.wait()
+        results[i] = manager.try_reserve(SERVER, bookings[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(bookings))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return results
+
+
+def test_concurrent_reserve_same_node_single_success(manager):
+    results = reserve_concurrently(manager, [booking(f'user{i}') for i in range(THREADS)])
+
+    assert sum(1 for errors in results if errors == []) == 1
+    assert all(errors for errors in results if errors != [])
+    assert len(manager.get_records(SERVER)) == 1
+    assert len(manager.storage.load(SERVER)) == 1
+
+
+def test_concurrent_reserve_different_nodes_all_succeed(manager):
+    nodes = SERVERS[SERVER].resources[0].ids
+    results = reserve_concurrently(manager, [booking(f'user{node}', str(node)) for node in nodes])
+
+    assert results == [[] for _ in nodes]
+    assert len(manager.storage.load(SERVER)) == len(nodes)
+
+
+def current_booking(name, nodes='0'):
+    """从现在开始、立即占用资源的登记"""
+    return dict(booking(name, nodes), 时间=datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 预计使用时间='48h')
+
+
+def no_full_reload(manager, monkeypatch):
+    def fail(server_type):
+        raise AssertionError('不应完整重新加载')
+    monkeypatch.setattr(manager, '_load_server', fail)
+
+
+def test_other_worker_append_loads_incrementally(workers, monkeypatch):
+    first, second = workers
+    first.try_reserve(SERVER, current_booking('a', nodes='1'))
+    since = second.data_version(SERVER)
+    no_full_reload(second, monkeypatch)
+
+    assert first.try_reserve(SERVER, current_booking('b', nodes='2')) == []
+
+    version, changes = second.get_changes(SERVER, since)
+    assert version == first.data_version(SERVER)
+    assert [(idx, record.name) for idx, record in changes] == [(1, 'b')]
+    assert [record.name for record in second.get_records(SERVER)] == ['a', 'b']
+    assert second.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [1, 2]
+    # 冲突检查使用同步后的占用
+    assert second.try_reserve(SERVER, current_booking('c', nodes='2'))
+
+
+def test_other_worker_update_loads_incrementally(workers, monkeypatch):
+    first, second = workers
+    first.try_reserve(SERVER, current_booking('a'))
+    first.try_reserve(SERVER, current_booking('b', nodes='1'))
+    since = second.data_version(SERVER)
+    no_full_reload(second, monkeypatch)
+
+    record = first.get_records(SERVER)[0]
+    assert first.update_record(SERVER, record[ID_COLUMN], record.revision, status='Yes')[0]
+
+    _, changes = second.get_changes(SERVER, since)
+    assert [(idx, record.completed) for idx, record in changes] == [(0, True)]
+    assert second.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [1]
+    assert second.query_records(SERVER, status='pending')['total'] == 1
+
+
+def test_own_writes_are_not_reapplied(workers, monkeypatch):
+    first, second = workers
+    first.try_reserve(SERVER, current_booking('a'))
+    second.try_reserve(SERVER, current_booking('b', nodes='1'))
+    since = first.data_version(SERVER)
+    no_full_reload(first, monkeypatch)
+    no_full_reload(second, monkeypatch)
+
+    first.try_reserve(SERVER, current_booking('c', nodes='2'))
+    second.try_reserve(SERVER, current_booking('d', nodes='3'))
+
+    assert [record.name for record in first.get_records(SERVER)] == ['a', 'b', 'c', 'd']
+    assert [record.name for record in second.get_records(SERVER)] == ['a', 'b', 'c', 'd']
+    assert [idx for idx, _ in first.get_changes(SERVER, since)[1]] == [2, 3]
+
+
+def test_booking_started_by_leader_counts_in_other_worker(workers, monkeypatch):
+    first, second = workers
+    begin = datetime.now() + timedelta(seconds=1)
+    first.try_reserve(SERVER, dict(current_booking('a'), 时间=begin.strftime('%Y-%m-%d %H:%M:%S')))
+    assert second.calculate_remaining_resources()[SERVER]['nodes_occupied'] == []
+    no_full_reload(second, monkeypatch)
+
+    time.sleep(max((begin - datetime.now()).total_seconds(), 0) + 0.1)
+    # 主进程的超时检查计入已开始的预约，只递增版本号，不写存储
+    first._periodic_status_check()
+
+    assert first.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [0]
+    assert second.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [0]
+
+
+def test_other_worker_replace_falls_back_to_full_reload(workers):
+    first, second = workers
+    first.try_reserve(SERVER, current_booking('a'))
+    first.backups.flush()
+    restore_point = datetime.now()
+    first.try_reserve(SERVER, current_booking('b', nodes='1'))
+    since = second.data_version(SERVER)
+
+    # 恢复备份整表替换，主键全部改变，其他 worker 只能完整加载，增量查询返回全部记录
+    assert first.restore_backup(SERVER, restore_point) == 1
+
+    _, changes = second.get_changes(SERVER, since)
+    assert [(idx, record.name) for idx, record in changes] == [(0, 'a')]
+    assert second.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [0]
+
+
+def fetch_since(client, since):
+    payload = client.get(f'/api/records/{SERVER}?since={since}').get_json()
+    return payload['version'], [record['姓名'] for record in payload['records']]
+
+
+def test_records_etag_revalidation(client, manager):
+    manager.try_reserve(SERVER, current_booking('a'))
+    response = client.get(f'/api/records/{SERVER}')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+
+    cached = client.get(f'/api/records/{SERVER}', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    # 查询参数不同，ETag 也不同
+    assert client.get(f'/api/records/{SERVER}?size=10', headers={'If-None-Match': etag}).status_code == 200
+
+    manager.try_reserve(SERVER, current_booking('b', nodes='1'))
+    changed = client.get(f'/api/records/{SERVER}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert [record['姓名'] for record in changed.get_json()['records']] == ['b', 'a']
+
+
+def test_records_since_returns_delta(client, manager):
+    manager.try_reserve(SERVER, current_booking('a'))
+    version, names = fetch_since(client, 0)
+    assert names == ['a']
+
+    manager.try_reserve(SERVER, current_booking('b', nodes='1'))
+    record = manager.get_records(SERVER)[0]
+    manager.update_record(SERVER, record[ID_COLUMN], record.revision, status='Yes')
+
+    new_version, names = fetch_since(client, version)
+    assert new_version > version
+    assert names == ['a', 'b']
+    assert fetch_since(client, new_version) == (new_version, [])
+
+
+def test_records_since_falls_back_after_change_log_truncation(client, manager, monkeypatch):
+    monkeypatch.setattr(app_module, 'CHANGE_LOG_MAX', 4)
+    manager.try_reserve(SERVER, current_booking('a'))
+    first_version, _ = fetch_since(client, 0)
+    for node in '123':
+        manager.try_reserve(SERVER, current_booking(f'n{node}', nodes=node))
+    recent_version, _ = fetch_since(client, 0)
+    for name in ('x', 'y'):
+        manager.try_reserve(SERVER, dict(current_booking(name), 占用节点='', 预计使用时间='1h'))
+
+    # 日志超过上限后丢弃较早的一半，更早的版本只能取得全部记录
+    assert fetch_since(client, first_version)[1] == ['a', 'n1', 'n2', 'n3', 'x', 'y']
+    assert fetch_since(client, recent_version)[1] == ['x', 'y']
+
+
+def test_records_since_falls_back_after_full_reload(client, manager):
+    manager.try_reserve(SERVER, current_booking('a'))
+    manager.backups.flush()
+    restore_point = datetime.now()
+    manager.try_reserve(SERVER, current_booking('b', nodes='1'))
+    version, _ = fetch_since(client, 0)
+
+    # 整表替换后行号重新编号，之前的版本号都返回全部记录
+    manager.restore_backup(SERVER, restore_point)
+    new_version, names = fetch_since(client, version)
+    assert new_version > version
+    assert names == ['a']
+
+
+def test_records_since_stays_delta_across_workers(workers, monkeypatch):
+    first, second = workers
+    client = app_module.app.test_client()
+    first.try_reserve(SERVER, current_booking('a'))
+    monkeypatch.setattr(app_module, 'server_manager', second)
+    version, names = fetch_since(client, 0)
+    assert names == ['a']
+
+    # 另一个 worker 写入后，本 worker 增量同步，变更日志仍然完整
+    first.try_reserve(SERVER, current_booking('b', nodes='1'))
+    assert fetch_since(client, version)[1] == ['b']
+
+
+def add_history(manager, count):
+    """依次登记 count 条已完成的记录：偶数序号登记于 2020 年（可归档），奇数序号登记于现在"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for i in range(count):
+        if i % 2 == 0:
+            data = dict(booking(f'r{i}'), 时间='2020-01-01 08:00:00', 预计使用时间='2020.1.1~2020.1.2', 是否完成='Yes')
+        else:
+            data = dict(booking(f'r{i}'), 时间=now, 预计使用时间='1h', 是否完成='Yes')
+        manager.add_record(SERVER, data)
+
+
+def fetch_page(client, query):
+    payload = client.get(f'/api/records/{SERVER}?{query}').get_json()
+    return payload, [record['姓名'] for record in payload['records']]
+
+
+def test_paging_continues_across_archiving(client, manager):
+    add_history(manager, 12)
+    first, names = fetch_page(client, 'size=4')
+    assert names == ['r11', 'r10', 'r9', 'r8']
+    assert first['total'] == 12 and first['has_more']
+
+    # 翻页之间：新登记一条，偶数序号的记录（含游标 r8 本身）被归档，存储中的行重新编号
+    manager.add_record(SERVER, dict(booking('new'), 是否完成='Yes'))
+    assert manager.archive_completed(SERVER) == 6
+
+    cursor = first['next']
+    seen = list(names)
+    while cursor:
+        page, names = fetch_page(client, f'size=3&after={cursor}')
+        seen.extend(names)
+        cursor = page['next']
+    assert seen == ['r11', 'r10', 'r9', 'r8', 'r7', 'r5', 'r3', 'r1']
+
+
+def test_paging_by_date_continues_into_archive(client, manager):
+    add_history(manager, 12)
+    manager.archive_completed(SERVER)
+
+    # 按日期查询时已归档的记录排在存储中的记录之后，游标可以是已归档的记录
+    cursor = ''
+    seen = []
+    while True:
+        page, names = fetch_page(client, f'size=4&from=2020.1.1&after={cursor}')
+        seen.extend(names)
+        cursor = page['next']
+        if not cursor:
+            break
+    assert seen == ['r11', 'r9', 'r7', 'r5', 'r3', 'r1', 'r10', 'r8', 'r6', 'r4', 'r2', 'r0']
+
+    assert client.get(f'/api/records/{SERVER}?after=missing').status_code == 400
+
+
+def test_record_filters_and_cursor_boundaries(client, manager):
+    # r0..r8，最新登记的在前；alice 为偶数序号，序号是3的倍数的已完成
+    for i in range(9):
+        manager.add_record(SERVER, dict(booking(f'r{i}'), 姓名='alice' if i % 2 == 0 else 'bob',
+                                        任务类型=f'r{i}', 是否完成='Yes' if i % 3 == 0 else ''))
+
+    def tasks(query):
+        payload = client.get(f'/api/records/{SERVER}?{query}').get_json()
+        return payload, [record['任务类型'] for record in payload['records']]
+
+    assert tasks('name=alice')[1] == ['r8', 'r6', 'r4', 'r2', 'r0']
+    assert tasks('name=%20alice%20')[1] == ['r8', 'r6', 'r4', 'r2', 'r0']
+    assert tasks('status=done')[1] == ['r6', 'r3', 'r0']
+    assert tasks('status=pending')[1] == ['r8', 'r7', 'r5', 'r4', 'r2', 'r1']
+    assert tasks('name=alice&status=pending')[1] == ['r8', 'r4', 'r2']
+    payload, names = tasks('name=nobody')
+    assert (names, payload['total'], payload['next'], payload['has_more']) == ([], 0, None, False)
+
+    # 按游标翻页：页大小整除结果数时最后一页没有下一页的游标
+    ids = {record[ID_COLUMN]: record['任务类型'] for record in manager.get_records(SERVER)}
+    by_task = {task: record_id for record_id, task in ids.items()}
+    payload, names = tasks('name=alice&status=pending&size=1')
+    seen = list(names)
+    while payload['next']:
+        assert ids[payload['next']] == seen[-1]
+        payload, names = tasks(f'name=alice&status=pending&size=1&after={payload["next"]}')
+        seen.extend(names)
+    assert seen == ['r8', 'r4', 'r2'] and payload['total'] == 1
+    payload, names = tasks('name=alice&size=5')
+    assert names == ['r8', 'r6', 'r4', 'r2', 'r0'] and payload['next'] is None
+
+    # 游标之后只有排在它后面的记录；游标是最早的一条时为空页；游标可以是不符合过滤条件的记录
+    assert tasks(f'name=alice&after={by_task["r2"]}')[1] == ['r0']
+    payload, names = tasks(f'name=alice&after={by_task["r0"]}')
+    assert (names, payload['total'], payload['next']) == ([], 0, None)
+    assert tasks(f'name=alice&after={by_task["r5"]}')[1] == ['r4', 'r2', 'r0']
+    assert tasks(f'status=done&size=1&after={by_task["r7"]}')[0]['next'] == by_task['r6']
+
+    for query in ('status=finished', 'size=0', f'size={app_module.MAX_RECORDS_PAGE_SIZE + 1}', 'page=0', 'after=missing'):
+        assert client.get(f'/api/records/{SERVER}?{query}').status_code == 400, query
+
+
+def test_legacy_update_routes_use_record_id_or_row(client, manager):
+    add_history(manager, 4)
+    manager.archive_completed(SERVER)
+    target = next(record for record in manager.get_records(SERVER) if record.name == 'r3')
+
+    response = client.post(f'/api/update_actual_time_{SERVER}/{target[ID_COLUMN]}', json={'actual_time': '2小时'})
+    assert response.status_code == 200
+    assert {record.name: record['实际使用时间'] for record in manager.get_records(SERVER)} == {'r1': '', 'r3': '2小时'}
+    # 旧客户端传入的行号按归档后存储中的行号定位
+    assert client.post(f'/api/update_actual_time_{SERVER}/0', json={'actual_time': '1小时'}).status_code == 200
+    assert {record.name: record['实际使用时间'] for record in manager.get_records(SERVER)} == {'r1': '1小时', 'r3': '2小时'}
+    assert client.post(f'/api/update_status_{SERVER}/2', json={'status': 'Yes'}).status_code == 404
+    assert client.post(f'/api/update_status_{SERVER}/missing', json={'status': 'Yes'}).status_code == 404
+
+
+def patch(client, record_id, body, revision=None):
+    headers = {'If-Match': f'"{revision}"'} if revision else {}
+    return client.patch(f'/api/records/{SERVER}/{record_id}', json=body, headers=headers)
+
+
+def test_patch_record_responses(client, manager):
+    manager.try_reserve(SERVER, current_booking('a'))
+    record = manager.get_records(SERVER)[0]
+    record_id, revision = record[ID_COLUMN], record.revision
+
+    assert patch(client, record_id, {'status': 'Yes'}).status_code == 428
+    assert patch(client, 'missing', {'status': 'Yes'}, revision).status_code == 404
+    for body in ({}, {'status': 'Done'}, {'status': 'No'}, {'actual_time': 3}):
+        response = patch(client, record_id, body, revision)
+        assert response.status_code == 400, body
+        assert response.get_json()['success'] is False
+    assert manager.get_records(SERVER)[0].revision == revision
+
+    response = patch(client, record_id, {'actual_time': '3小时'}, revision)
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['record']['实际使用时间'] == '3小时'
+    assert response.headers['ETag'] == f'"{payload["record"]["revision"]}"'
+
+    # 用修改前的 revision 再改一次：返回 409 和最新的记录，不做修改
+    stale = patch(client, record_id, {'status': 'Yes'}, revision)
+    assert stale.status_code == 409
+    assert stale.get_json()['record']['revision'] == payload['record']['revision']
+    assert not manager.get_records(SERVER)[0].completed
+
+    # 请求体中的 revision 与 If-Match 头等价
+    done = client.patch(f'/api/records/{SERVER}/{record_id}',
+                        json={'status': 'Yes', 'revision': payload['record']['revision']})
+    assert done.status_code == 200
+    assert manager.get_records(SERVER)[0].completed
+    assert client.post(f'/api/update_status_{SERVER}/{record_id}', json={'status': 'Done'}).status_code == 400
+
+
+def test_writes_invalidate_export_cache(manager):
+    manager.try_reserve(SERVER, current_booking('a'))
+    version, content = manager.export_excel(SERVER)
+    assert manager._cache.get(('export', SERVER), version) is content
+    assert manager.export_excel(SERVER) == (version, content)
+
+    # 写入作废依赖 records 的导出缓存
+    manager.try_reserve(SERVER, current_booking('b', nodes='1'))
+    assert manager._cache.get(('export', SERVER), version) is None
+    new_version, new_content = manager.export_excel(SERVER)
+    assert new_version != version and new_content != content
+
+    # 重新加载作废 data，连带作废派生的 records
+    manager._load_server(SERVER)
+    assert manager._cache.get(('export', SERVER), new_version) is None
+
+
+def test_record_update_invalidates_only_overlapping_utilization_buckets(manager):
+    for i, day in enumerate((1, 2)):
+        manager.add_record(SERVER, dict(booking(f'u{i}'), 时间=f'2020-01-0{day} 08:00:00', 预计使用时间='3h',
+                                        实际使用时间='2h', 是否完成='Yes', **{ID_COLUMN: f'id{i}'}))
+    begin, end = datetime(2020, 1, 1), datetime(2020, 1, 3)
+    first = manager.utilization(SERVER, begin, end, 'day')
+    assert [bucket['resources']['nodes']['used_hours'] for bucket in first['buckets']] == [2.0, 2.0]
+
+    def cached_days():
+        return [day for day in (1, 2)
+                if manager._cache.get(('analytics', SERVER, 'day', to_seconds(datetime(2020, 1, day), 0))) is not None]
+
+    assert cached_days() == [1, 2]
+    record = next(record for record in manager.get_records(SERVER) if record[ID_COLUMN] == 'id0')
+    manager.update_record(SERVER, 'id0', record.revision, actual_time='5h')
+    # 只有与修改前后使用时间段重叠的桶被作废，另一天仍然命中缓存
+    assert cached_days() == [2]
+    second = manager.utilization(SERVER, begin, end, 'day')
+    assert [bucket['resources']['nodes']['used_hours'] for bucket in second['buckets']] == [5.0, 2.0]
+
+    manager._load_server(SERVER)
+    assert cached_days() == []
+
+
+def post_bulk(client, rows, fmt='csv'):
+    if fmt == 'csv':
+        body, content_type = pd.DataFrame(rows).to_csv(index=False).encode('utf-8'), 'text/csv'
+    else:
+        body = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows).encode('utf-8')
+        content_type = 'application/x-ndjson'
+    return client.post(f'/api/records/{SERVER}/bulk', data=body, content_type=content_type)
+
+
+def test_bulk_import_rejects_conflicts_and_skips_duplicates(client, manager):
+    manager.try_reserve(SERVER, current_booking('a', nodes='0'))
+    rows = [
+        dict(current_booking('b', nodes='0'), **{ID_COLUMN: 'b'}),   # 与已有预约冲突
+        dict(current_booking('c', nodes='1'), **{ID_COLUMN: 'c'}),
+        dict(current_booking('d', nodes='1'), **{ID_COLUMN: 'd'}),   # 与同一文件中前面的行冲突
+        dict(current_booking('e', nodes='0'), 是否完成='Yes', **{ID_COLUMN: 'e'}),  # 已完成，不检查冲突
+        dict(current_booking('f', nodes='2'), 占用GPU='5', **{ID_COLUMN: 'f'}),
+    ]
+    response = post_bulk(client, rows)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['imported'], result['skipped'], result['rejected']) == (2, 0, 3)
+    assert [error['row'] for error in result['errors']] == [1, 3, 5]
+    assert all(error['errors'] for error in result['errors'])
+    assert sorted(record['姓名'] for record in manager.get_records(SERVER)) == ['a', 'c', 'e']
+
+    # 再次导入同一文件：记录ID已存在的行跳过，不产生重复记录
+    again = post_bulk(client, rows, fmt='jsonl').get_json()
+    assert (again['imported'], again['skipped'], again['rejected']) == (0, 2, 3)
+    assert len(manager.get_records(SERVER)) == 3
+
+
+def test_bulk_import_caps_listed_errors(client, manager):
+    rows = [dict(booking(f'r{i}'), 占用节点='9') for i in range(app_module.MAX_IMPORT_ERRORS + 5)]
+    rows.append(dict(booking('ok'), 是否完成='Yes'))
+    result = post_bulk(client, rows).get_json()
+    assert (result['imported'], result['rejected']) == (1, app_module.MAX_IMPORT_ERRORS + 5)
+    assert len(result['errors']) == app_module.MAX_IMPORT_ERRORS
+    assert result['errors'][0]['row'] == 1
+
+
+def test_bulk_import_bad_columns_and_later_read_errors(client, manager):
+    response = post_bulk(client, [{'时间': '2025.6.1', '姓名': 'a'}])
+    assert response.status_code == 400 and '缺少列' in response.get_json()['error']
+    assert client.post(f'/api/records/{SERVER}/bulk', data=b'x').status_code == 400  # 无法判断格式
+
+    def rows():
+        for i in range(3):
+            yield dict(booking(f'r{i}'), 是否完成='Yes')
+        raise ValueError('第 4 行不是 JSON 对象')
+
+    # 第一块已导入，之后的块无法读取时停止并说明
+    result = manager.import_records(SERVER, rows(), chunk_size=2)
+    assert (result['imported'], result['chunks']) == (2, 1)
+    assert '第 2 行之后' in result['error']
+    with pytest.raises(ValueError):
+        manager.import_records(SERVER, rows(), chunk_size=5)
+    assert len(manager.get_records(SERVER)) == 2
+
+
+def test_legacy_excel_migrates_once_with_record_ids(storage_env):
+    # 旧版本的 .xlsx：没有实际使用时间和记录ID两列
+    legacy = [{k: v for k, v in booking(name, node).items() if k != '实际使用时间'} for name, node in [('a', '0'), ('b', '1')]]
+    pd.DataFrame(legacy).to_excel(storage_env / SERVERS[SERVER].excel_file, index=False)
+
+    manager = app_module.ServerManager()
+    records = manager.get_records(SERVER)
+    assert [(r.name, r.get('占用节点'), r.get('实际使用时间')) for r in records] == \
+        [('a', '0', '2100.1.10~2100.1.12'), ('b', '1', '2100.1.10~2100.1.12')]
+    ids = [r.get(ID_COLUMN) for r in records]
+    assert all(ids) and len(set(ids)) == 2
+
+    # 迁移标记与导入的行在同一事务中写入；分配记录ID是普通的写入，不改变整表替换的代数
+    storage = manager.storage
+    conn = storage._connect()
+    assert conn.execute('SELECT value FROM meta WHERE key = ?', (f'migrated_{SERVER}',)).fetchone()[0] \
+        .startswith(SERVERS[SERVER].excel_file)
+    assert storage._generation(conn, SERVER) == 0
+
+    # 再次启动不重复导入，记录ID保持不变
+    manager.backups.flush()
+    again = app_module.ServerManager()
+    assert [r.get(ID_COLUMN) for r in again.get_records(SERVER)] == ids
+    again.backups.flush()
+
+
+def test_form_rejects_node_outside_inventory(client, manager):
+    form = {'time': '2099-12-31 12:00:00', 'name': 'a', 'nodes': '7', 'gpu': 'No', 'remote': 'No',
+            'task_type': 'test', 'estimated_time': '2100.1.10~2100.1.12'}
+    response = client.post(f'/add_{SERVER}', data=form)
+    assert response.status_code == 400
+    assert response.get_json()['error'] == SERVERS[SERVER].resources[0].format_error()
+    assert manager.get_records(SERVER) == []
+
+    assert client.post(f'/add_{SERVER}', data=dict(form, nodes='3')).status_code == 302
+    assert [r.get('占用节点') for r in manager.get_records(SERVER)] == ['3']
+
+
+def test_group_commit_storage_failure_fails_batch_and_reloads(storage_env, monkeypatch):
+    monkeypatch.setattr(app_module, 'GROUP_COMMIT', True)
+    manager = app_module.ServerManager()
+    manager.try_reserve(SERVER, booking('kept', nodes='3'))
+    queue = manager._write_queues[SERVER]
+    real_write = manager.storage.write_batch
+    entered, release = threading.Event(), threading.Event()
+    batches = []
+
+    def write_batch(server_type, operations):
+        batches.append(len(operations))
+        entered.set()
+        release.wait(5)
+        raise OSError('disk full')
+    monkeypatch.setattr(manager.storage, 'write_batch', write_batch)
+
+    results = [None] * 4
+
+    def reserve(i, nodes):
+        try:
+            results[i] = manager.try_reserve(SERVER, booking(f'u{i}', nodes))
+        except OSError as e:
+            results[i] = e
+    threads = [threading.Thread(target=reserve, args=(0, '0'))]
+    threads[0].start()
+    entered.wait(5)
+    # 第一批写存储期间到达的三个登记合为下一批，其中一个与同批的另一个冲突，不产生存储操作
+    threads += [threading.Thread(target=reserve, args=(i, nodes)) for i, nodes in [(1, '1'), (2, '2'), (3, '2')]]
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while queue.depth() < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert batches == [1, 2]
+    # 整批视为失败，每个等待的请求（包括同批中冲突的）都得到存储的异常
+    assert all(isinstance(result, OSError) for result in results)
+    # 失败后从存储重新加载：内存与存储一致，没有持久化的登记不占用资源
+    monkeypatch.setattr(manager.storage, 'write_batch', real_write)
+    assert [r.name for r in manager.get_records(SERVER)] == ['kept']
+    assert manager.try_reserve(SERVER, booking('retry', nodes='0,1,2')) == []
+    manager.backups.flush()
+    reopened = app_module.ServerManager()
+    assert sorted(r.name for r in reopened.get_records(SERVER)) == ['kept', 'retry']
+    reopened.backups.flush()
+
+
+def spaced_booking(name, i):
+    """同一节点上互不重叠的登记，每条间隔三天"""
+    return dict(booking(name), 预计使用时间=f'2100.2.{1 + 3 * i}~2100.2.{2 + 3 * i}')
+
+
+def test_records_compressed_by_accept_encoding(client, manager):
+    for i in range(8):
+        manager.try_reserve(SERVER, spaced_booking(f'user{i}', i))
+    url = f'/api/records/{SERVER}'
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    etag = plain.headers['ETag'].strip('"')
+    assert 'Content-Encoding' not in plain.headers and len(plain.data) >= pagecache.COMPRESS_MIN_BYTES
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    encodings = {'gzip': gzip.decompress}
+    if pagecache.brotli is not None:
+        encodings['br'] = pagecache.brotli.decompress
+    for encoding, decompress in encodings.items():
+        # 支持 br 时优先 br
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, br' if encoding == 'br' else 'gzip'})
+        assert response.headers['Content-Encoding'] == encoding
+        assert response.headers['ETag'] == f'"{etag}-{encoding}"'
+        assert decompress(response.data) == plain.data
+        # 每种编码的 ETag 都能验证
+        cached = client.get(url, headers={'Accept-Encoding': encoding, 'If-None-Match': f'"{etag}-{encoding}"'})
+        assert (cached.status_code, cached.headers['ETag']) == (304, f'"{etag}-{encoding}"')
+    assert client.get(url, headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+
+    # 小于 COMPRESS_MIN_BYTES 的响应不压缩
+    small = client.get(f'{url}?since={manager.data_version(SERVER)}', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+
+    # 写入后旧的 ETag 失效，缓存的压缩结果不再使用
+    manager.try_reserve(SERVER, spaced_booking('late', 8))
+    changed = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}-gzip"'})
+    assert changed.status_code == 200 and changed.headers['ETag'] != f'"{etag}-gzip"'
+    assert json.loads(gzip.decompress(changed.data))['records'][0]['姓名'] == 'late'
+
+
+def test_page_rerenders_only_changed_rows(client, manager, monkeypatch):
+    rendered = []
+    real_attribute = app_module.get_template_attribute
+
+    def counting_attribute(template, name):
+        macro = real_attribute(template, name)
+        if name != 'record_row':
+            return macro
+        return lambda record, *args: rendered.append(record.name) or macro(record, *args)
+    monkeypatch.setattr(app_module, 'get_template_attribute', counting_attribute)
+
+    manager.try_reserve(SERVER, spaced_booking('a', 0))
+    manager.try_reserve(SERVER, spaced_booking('b', 1))
+    first = client.get(f'/{SERVER}')
+    assert sorted(rendered) == ['a', 'b']
+
+    # 数据不变时整页来自缓存
+    rendered.clear()
+    assert client.get(f'/{SERVER}').data == first.data and rendered == []
+
+    # 新登记的记录只渲染这一行；修改一条记录后只重新渲染这一行，旧的片段不再使用
+    manager.try_reserve(SERVER, spaced_booking('c', 2))
+    assert client.get(f'/{SERVER}').status_code == 200 and rendered == ['c']
+    rendered.clear()
+    record = next(r for r in manager.get_records(SERVER) if r.name == 'a')
+    manager.update_record(SERVER, record.get(ID_COLUMN), record.revision, status='Yes')
+    page = client.get(f'/{SERVER}')
+    assert rendered == ['a']
+    assert page.headers['ETag'] != first.headers['ETag']
+
+
+SAMPLE_LINE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\["\\n])*)"(?:,|$)')
+
+
+def parse_metrics(text):
+    """检查 Prometheus 文本格式并返回 {(样本名, 排序后的标签元组): 值}：每个样本之前有所属指标的 TYPE，
+    直方图的分桶累计不减，+Inf 分桶等于 _count"""
+    assert text.endswith('\n')
+    types, samples, buckets = {}, {}, {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            continue
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert name not in types and kind in ('counter', 'gauge', 'histogram')
+            types[name] = kind
+            continue
+        match = SAMPLE_LINE.fullmatch(line)
+        assert match, line
+        name, label_text, value = match.group(1), match.group(2) or '', float(match.group(3))
+        labels = dict(LABEL.findall(label_text))
+        assert ''.join(f'{k}="{v}",' for k, v in labels.items()).rstrip(',') == label_text, line
+        base = name if name in types else re.sub(r'_(bucket|sum|count)$', '', name)
+        assert base in types, line
+        if types[base] == 'histogram' and name.endswith('_bucket'):
+            series = (base, tuple(sorted((k, v) for k, v in labels.items() if k != 'le')))
+            assert value >= buckets.get(series, 0), line
+            buckets[series] = value
+        samples[(name, tuple(sorted(labels.items())))] = value
+    for (base, series), value in buckets.items():
+        assert samples[(f'{base}_count', series)] == value
+    return samples
+
+
+def test_metrics_exposition_changes_after_requests(client, manager):
+    def scrape():
+        response = client.get('/metrics')
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        return parse_metrics(response.get_data(as_text=True))
+
+    def value(samples, name, **labels):
+        return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+    client.get(f'/api/records/{SERVER}')
+    before = scrape()
+    client.get(f'/api/records/{SERVER}')
+    manager.try_reserve(SERVER, booking('metered'))
+    after = scrape()
+
+    route = dict(route='/api/records/<server_type>', method='GET', status='200')
+    assert value(after, 'http_request_duration_seconds_count', **route) == \
+        value(before, 'http_request_duration_seconds_count', **route) + 1
+    assert value(after, 'server_manager_call_seconds_count', method='_commit') > \
+        value(before, 'server_manager_call_seconds_count', method='_commit')
+    assert value(after, 'storage_call_seconds_count', backend='sqlite', method='write_batch') > \
+        value(before, 'storage_call_seconds_count', backend='sqlite', method='write_batch')
+    assert value(after, 'records', server=SERVER, state='total') == len(manager.get_records(SERVER))
+
+
+def test_resources_stream_pushes_after_write(client, manager, monkeypatch):
+    monkeypatch.setattr(app_module, 'SSE_KEEPALIVE_SECONDS', 0.2)
+    response = client.get('/api/resources/stream', buffered=False)
+    assert response.mimetype == 'text/event-stream'
+    events = response.iter_encoded()
+
+    def parse(event):
+        fields = dict(line.split(': ', 1) for line in event.decode('utf-8').strip().split('\n'))
+        return int(fields['id']), json.loads(fields['data'])
+
+    try:
+        # 连接后立即推送当前的资源使用情况
+        version, resources = parse(next(events))
+        assert resources == manager.calculate_remaining_resources()
+        key = SERVERS[SERVER].resources[0].key
+        used = resources[SERVER][f'{key}_used']
+        # 没有变化时发送心跳注释
+        assert next(events) == b': keep-alive\n\n'
+
+        timer = threading.Timer(0.05, manager.try_reserve, (SERVER, current_booking('streamed', nodes='2')))
+        timer.start()
+        for _ in range(50):  # 最多等待约10秒
+            event = next(events)
+            if event != b': keep-alive\n\n':
+                break
+        timer.join()
+        new_version, resources = parse(event)
+        assert new_version > version
+        assert resources[SERVER][f'{key}_used'] == used + 1
+        assert 2 in resources[SERVER][f'{key}_occupied']
+    finally:
+        response.close()
+
+
+def test_expired_records_complete_and_release_resources(manager):
+    now = datetime.now()
+    start = now.strftime('%Y-%m-%d %H:%M:%S')
+    later = (now + timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+    manager.try_reserve(SERVER, dict(current_booking('short'), 预计使用时间='2小时'))
+    manager.try_reserve(SERVER, dict(current_booking('long', nodes='1'), 时间=start, 预计使用时间='48h'))
+    # 一小时后才开始的预约，开始前不计入当前占用
+    manager.try_reserve(SERVER, dict(current_booking('next', nodes='2'), 时间=later, 预计使用时间='3h'))
+    assert manager.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [0, 1]
+    # 检查线程睡到最近的期限：一小时后的预约开始
+    manager.max_check_interval = 7200
+    with manager._expiry_cond:
+        assert 3500 < manager._next_check_delay() <= 3600
+
+    # 时间前进到 short 的预计结束时间之后：next 开始计入占用，short 自动完成并释放节点 0
+    manager._check_and_update_records(SERVER, now + timedelta(hours=2, minutes=1))
+    records = {record.name: record for record in manager.get_records(SERVER)}
+    assert (records['short'].get('是否完成'), records['short'].get('实际使用时间')) == ('Yes', '2小时')
+    assert records['long'].get('是否完成') == '' and records['next'].get('是否完成') == ''
+    assert manager.calculate_remaining_resources()[SERVER]['nodes_occupied'] == [1, 2]
+    assert manager.try_reserve(SERVER, current_booking('reuse', nodes='0')) == []
+
+    # 自动完成已写入存储
+    stored = manager.storage.load(SERVER)
+    assert stored.loc[stored['姓名'] == 'short', ['是否完成', '实际使用时间']].values.tolist() == [['Yes', '2小时']]
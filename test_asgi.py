@@ -0,0 +1,96 @@
+"""asgi.py：挂载的 Flask 路由经 Starlette 原样返回；长轮询在事件循环中等待写入；AsyncServerManager 在线程池中调用 ServerManager"""
+import importlib
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('starlette')
+pytest.importorskip('a2wsgi')
+pytest.importorskip('httpx')
+from starlette.testclient import TestClient
+
+import app as app_module
+
+SERVER = '9755'
+
+
+def booking(name, nodes='0'):
+    return {'时间': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), '姓名': name, '占用节点': nodes, '占用GPU': 'No',
+            '是否使用远程桌面': 'No', '任务类型': 'test', '预计使用时间': '48h', '实际使用时间': '', '是否完成': ''}
+
+
+@pytest.fixture(scope='module')
+def asgi(tmp_path_factory):
+    """导入 asgi.py（导入时创建 ServerManager），整个模块只导入一次：指标在导入时登记"""
+    tmp_path = tmp_path_factory.mktemp('asgi')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+        for name, path in [('SQLITE_PATH', 'records.db'), ('BACKUP_DIR', 'backups'),
+                           ('COHERENCE_DIR', 'coherence'), ('ARCHIVE_DIR', 'archive')]:
+            monkeypatch.setenv(name, str(tmp_path / path))
+        monkeypatch.setattr(app_module, 'WATCH_FILES', False)
+        monkeypatch.setattr(app_module, 'ARCHIVE_INTERVAL', 0)
+        monkeypatch.setattr(app_module, 'server_manager', None)
+        module = importlib.import_module('asgi')
+        yield module
+        module.server_manager.manager.backups.flush()
+
+
+@pytest.fixture
+def client(asgi):
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def test_mounted_wsgi_routes(asgi, client):
+    manager = asgi.server_manager.manager
+    assert client.get('/').status_code == 200
+
+    response = client.post(f'/api/records/{SERVER}/bulk', content=b'x')
+    assert response.status_code == 400 and response.json()['success'] is False
+
+    before = len(manager.get_records(SERVER))
+    manager.try_reserve(SERVER, booking('mounted'))
+    payload = client.get(f'/api/records/{SERVER}').json()
+    assert payload['version'] == manager.data_version(SERVER)
+    assert len(payload['records']) == before + 1
+    assert payload['records'][0]['姓名'] == 'mounted'
+
+
+def test_long_poll_waits_for_write(asgi, client):
+    manager = asgi.server_manager.manager
+    version = client.get(f'/api/records/{SERVER}?since=0').json()['version']
+
+    # 没有写入时等到超时，返回空的差量
+    start = time.monotonic()
+    payload = client.get(f'/api/records/{SERVER}?since={version}&wait=0.3').json()
+    assert time.monotonic() - start >= 0.25
+    assert (payload['version'], payload['records']) == (version, [])
+
+    timer = threading.Timer(0.2, manager.try_reserve, (SERVER, booking('polled', nodes='1')))
+    timer.start()
+    start = time.monotonic()
+    payload = client.get(f'/api/records/{SERVER}?since={version}&wait=10').json()
+    timer.join()
+    assert time.monotonic() - start < 5
+    assert payload['version'] > version
+    assert [record['姓名'] for record in payload['records']] == ['polled']
+
+
+def test_async_manager_runs_methods_in_executor(asgi, client):
+    async_manager = asgi.server_manager
+    manager = async_manager.manager
+    records = client.portal.call(async_manager.get_records, SERVER)
+    assert [record.fields for record in records] == [record.fields for record in manager.get_records(SERVER)]
+
+    # 资源使用情况每个版本只计算一次
+    first = client.portal.call(async_manager.resources_json)
+    assert client.portal.call(async_manager.resources_json) is first
+
+    version = async_manager.version
+    manager.try_reserve(SERVER, booking('async', nodes='2'))
+    assert client.portal.call(async_manager.wait_for_change, version, 5) > version
+    assert client.portal.call(async_manager.resources_json) != first
@@ -0,0 +1,88 @@
+"""backup.py：快照与恢复的往返、按内容寻址去重、保留策略与未引用数据块的清理，写入均 fsync"""
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import backup
+import storage
+from backup import CHUNK_ROWS, SNAPSHOT_TIME_FORMAT, BackupStore
+
+SERVER = '9755'
+COLUMNS = ['时间', '姓名', '是否完成']
+
+
+def rows(count, prefix='u'):
+    return [{'时间': f'2025-06-01 {i % 24:02d}:00:00', '姓名': f'{prefix}{i}', '是否完成': 'Yes' if i % 2 else ''}
+            for i in range(count)]
+
+
+def chunk_files(store):
+    objects = os.path.join(store.directory, 'objects')
+    return {name for prefix in os.listdir(objects) for name in os.listdir(os.path.join(objects, prefix))}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BackupStore(str(tmp_path / 'backups'))
+
+
+def test_snapshot_restore_round_trip(store):
+    records = rows(CHUNK_ROWS + 10) + [{'时间': '2025.6.6', '姓名': '张三', '是否完成': None}]
+    path = store.snapshot(SERVER, COLUMNS, records)
+
+    df = store.restore(SERVER, datetime.now())
+    assert list(df.columns) == COLUMNS
+    assert df.to_dict('records') == [{col: storage.to_text(record[col]) for col in COLUMNS} for record in records]
+    assert store.list_snapshots(SERVER)[0][1] == path
+    with pytest.raises(LookupError):
+        store.restore(SERVER, datetime.now() - timedelta(days=1))
+
+
+def test_snapshot_writes_only_changed_chunks(store):
+    records = rows(3 * CHUNK_ROWS)
+    store.snapshot(SERVER, COLUMNS, records)
+    assert len(chunk_files(store)) == 3
+    # 内容没有变化时不写新的快照
+    assert store.snapshot(SERVER, COLUMNS, records) is None
+
+    records[CHUNK_ROWS] = dict(records[CHUNK_ROWS], 是否完成='Yes')
+    records.append({'时间': '2025-06-02 00:00:00', '姓名': 'new', '是否完成': ''})
+    latest = store.snapshot(SERVER, COLUMNS, records)
+    # 第二块改变，最后一块多了一行：两块新写入，其余两块复用
+    assert len(chunk_files(store)) == 5
+    assert len(store.list_snapshots(SERVER)) == 2
+    assert store.load(latest)['是否完成'].tolist() == [storage.to_text(r['是否完成']) for r in records]
+
+
+def test_snapshot_files_are_fsynced(store, monkeypatch):
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(storage.os, 'fsync', lambda fd: synced.append(fd) or real_fsync(fd))
+    store.snapshot(SERVER, COLUMNS, rows(2 * CHUNK_ROWS))
+    # 两个数据块和一份清单，每个文件和所在目录各一次；新建的目录再 fsync 其上级目录
+    assert len(synced) >= 3 * 2
+    assert not [name for _, _, names in os.walk(store.directory) for name in names if name.endswith('.tmp')]
+
+
+def test_prune_keeps_retention_buckets_and_collects_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, 'GC_GRACE_SECONDS', -60)
+    store = BackupStore(str(tmp_path / 'backups'),
+                        retention={'recent': timedelta(hours=1), 'hourly': 2, 'daily': 2, 'weekly': 1})
+    now = datetime(2025, 6, 10, 12, 0)
+    times = [now - timedelta(minutes=10), datetime(2025, 6, 10, 10, 30), datetime(2025, 6, 10, 10, 10),
+             datetime(2025, 6, 10, 7, 0), datetime(2025, 6, 7, 9, 0), datetime(2025, 5, 31, 9, 0)]
+    server_dir = os.path.join(store.directory, 'snapshots', SERVER)
+    for i, created in enumerate(times):
+        path = store.snapshot(SERVER, COLUMNS, rows(1, prefix=f's{i}-'))
+        os.replace(path, os.path.join(server_dir, f'{created.strftime(SNAPSHOT_TIME_FORMAT)}-1.json'))
+    assert len(chunk_files(store)) == len(times)
+
+    # 最近1小时：11:50；按小时保留最新两个小时：11:50、10:30；按天：6月10日、6月7日；按周：本周
+    assert store.prune(SERVER, now=now) == 3
+    kept = [created for created, _ in store.list_snapshots(SERVER)]
+    assert kept == [times[0], times[1], times[4]]
+    assert len(chunk_files(store)) == 3
+    assert [store.load(path)['姓名'].tolist() for _, path in store.list_snapshots(SERVER)] == \
+        [['s0-0'], ['s1-0'], ['s4-0']]
+    assert store.prune(SERVER, now=now) == 0
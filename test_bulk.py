@@ -0,0 +1,115 @@
+"""bulk.py：CSV、JSONL、XLSX 逐行读取结果一致，格式错误时抛出 ValueError；列名与逐行取值的检查"""
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from bulk import check_columns, chunks, read_rows, validate_chunk
+from inventory import ID_COLUMN, SERVERS
+
+SPEC = SERVERS['9755']
+
+ROWS = [
+    {'时间': '2025-06-01 08:00:00', '姓名': '张三', '占用节点': '0,1', '预计使用时间': '3小时', '是否完成': 'Yes'},
+    # 字段中的换行和逗号
+    {'时间': '2025.6.2', '姓名': 'li, si', '占用节点': 'Yes', '预计使用时间': '2025.6.2~2025.6.3', '是否完成': '',
+     '任务类型': '多行\n说明'},
+]
+
+
+def csv_bytes(rows, encoding='utf-8-sig'):
+    return pd.DataFrame(rows).fillna('').to_csv(index=False).encode(encoding)
+
+
+def jsonl_bytes(rows):
+    lines = [json.dumps(row, ensure_ascii=False) for row in rows]
+    return ('\n'.join(lines[:1] + [''] + lines[1:]) + '\n').encode('utf-8')
+
+
+def xlsx_bytes(rows):
+    buffer = io.BytesIO()
+    pd.DataFrame(rows).fillna('').to_excel(buffer, index=False)
+    buffer.seek(0)
+    return buffer
+
+
+def expected_rows(rows):
+    columns = list(pd.DataFrame(rows).columns)
+    return [{column: row.get(column, '') for column in columns} for row in rows]
+
+
+def test_csv_jsonl_xlsx_read_the_same_rows():
+    expected = expected_rows(ROWS)
+    assert list(read_rows(io.BytesIO(csv_bytes(ROWS)), 'csv')) == expected
+    assert list(read_rows(io.BytesIO(csv_bytes(ROWS, 'gbk')), 'csv', 'gbk')) == expected
+    assert list(read_rows(xlsx_bytes(ROWS), 'xlsx')) == expected
+    # JSONL 各行的键可以不同，空行跳过
+    assert list(read_rows(io.BytesIO(jsonl_bytes(ROWS)), 'jsonl')) == ROWS
+
+
+def test_csv_rows_read_across_block_boundaries():
+    rows = [dict(ROWS[0], 姓名=f'用户{i}') for i in range(5000)]
+    read = list(read_rows(io.BytesIO(csv_bytes(rows)), 'csv'))
+    assert [row['姓名'] for row in read] == [row['姓名'] for row in rows]
+
+
+@pytest.mark.parametrize('data, fmt, encoding', [
+    (csv_bytes(ROWS, 'gbk'), 'csv', 'utf-8-sig'),
+    (b'{"a": 1}\n{not json}\n', 'jsonl', 'utf-8-sig'),
+    (b'[1, 2]\n', 'jsonl', 'utf-8-sig'),
+    (b'not a zip file', 'xlsx', 'utf-8-sig'),
+    (b'', 'xml', 'utf-8-sig'),
+])
+def test_unreadable_files_raise_value_error(data, fmt, encoding):
+    with pytest.raises(ValueError):
+        list(read_rows(io.BytesIO(data), fmt, encoding))
+
+
+def test_check_columns():
+    check_columns(SPEC, {'时间': '', '姓名': '', '预计使用时间': '', ID_COLUMN: ''})
+    with pytest.raises(ValueError, match='缺少列: 预计使用时间'):
+        check_columns(SPEC, {'时间': '', '姓名': ''})
+    with pytest.raises(ValueError, match='未知的列: 使用核数'):
+        check_columns(SPEC, {'时间': '', '姓名': '', '预计使用时间': '', '使用核数': '8'})
+
+
+def test_chunks():
+    assert [len(chunk) for chunk in chunks(iter(range(7)), 3)] == [3, 3, 1]
+    assert list(chunks(iter(()), 3)) == []
+
+
+def test_validate_chunk_reports_each_bad_row():
+    good = {'时间': '2025-06-01 08:00:00', '姓名': '张三', '占用节点': '0', '预计使用时间': '3小时', '是否完成': ''}
+    rows = [
+        good,
+        dict(good, 时间=''),
+        dict(good, 姓名=' '),
+        dict(good, 时间='昨天'),
+        dict(good, 是否完成='Done'),
+        dict(good, 预计使用时间=''),
+        dict(good, 预计使用时间='', 是否完成='Yes', 记录ID=' id-6 '),
+        dict(good, 占用节点='0,7'),
+        dict(good, 占用GPU='x'),
+        dict(good, 是否使用远程桌面='maybe'),
+        dict(good, 备注='?'),
+        dict(good, 时间='', 占用节点='9'),
+    ]
+    valid, hours, errors = validate_chunk(SPEC, rows)
+
+    assert list(valid.index) == [0, 6]
+    assert hours.tolist() == [3.0, 0.0]
+    assert list(valid.columns) == SPEC.columns
+    assert valid.loc[6, ID_COLUMN] == 'id-6'
+    assert errors == {
+        1: ['缺少时间'],
+        2: ['缺少姓名'],
+        3: ['时间中没有日期'],
+        4: ['是否完成只能是 Yes、No 或空'],
+        5: ['未完成的记录需要有效的预计使用时间'],
+        7: ['节点编号只能是 0、1、2、3（多个用逗号分隔）、Yes 或 No'],
+        8: ['GPU编号只能是 0、1（多个用逗号分隔）、Yes 或 No'],
+        9: ['远程桌面只能是 Yes 或 No'],
+        10: ['未知的列: 备注'],
+        11: ['缺少时间', '节点编号只能是 0、1、2、3（多个用逗号分隔）、Yes 或 No'],
+    }
@@ -0,0 +1,69 @@
+"""cache.py：字节数上限与 LRU 淘汰、版本号、依赖标签与派生标签的作废"""
+from cache import LRUCache
+
+
+def test_byte_budget_evicts_least_recently_used():
+    cache = LRUCache('test', max_bytes=100)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+    assert cache.get('a') == 'A'  # a 变为最近使用
+    cache.put('c', 'C', 40)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('A', 'C')
+    assert cache.bytes == 80 and len(cache) == 2 and cache.evictions == 1
+
+    # 一个大条目挤出多个旧条目
+    cache.put('d', 'D', 90)
+    assert len(cache) == 1 and cache.bytes == 90 and cache.evictions == 3
+
+
+def test_oversized_entry_is_not_cached_and_replacing_recounts_bytes():
+    cache = LRUCache('test', max_bytes=100)
+    cache.put('a', 'A', 30)
+    cache.put('big', 'X', 101)
+    assert cache.get('big') is None and cache.get('a') == 'A'
+
+    cache.put('a', 'A2', 60)
+    assert cache.get('a') == 'A2' and cache.bytes == 60
+    # 替换为超过上限的值时旧值也不再保留
+    cache.put('a', 'A3', 200)
+    assert cache.get('a') is None and cache.bytes == 0
+
+
+def test_version_mismatch_is_a_miss_and_drops_entry():
+    cache = LRUCache('test', max_bytes=100)
+    cache.put('a', 'A', 10, version=1)
+    assert cache.get('a', 1) == 'A'
+    assert cache.get('a', 2) is None
+    assert cache.get('a', 1) is None and cache.bytes == 0
+
+
+def test_invalidate_tag_evicts_dependents_and_derived_tags():
+    cache = LRUCache('test', max_bytes=1000)
+    cache.depend(('records', 's1'), ('data', 's1'))
+    cache.put(('export', 's1'), b'xlsx', 10, version=1, deps=[('records', 's1')])
+    cache.put(('analytics', 's1', 'day', 0), 'bucket', 10, deps=[('data', 's1')])
+    cache.put(('export', 's2'), b'xlsx', 10, version=1, deps=[('records', 's2')])
+    cache.put('plain', 'P', 10)
+
+    # 写入只作废 records：导出缓存失效，统计桶保留
+    assert cache.invalidate(('records', 's1')) == 1
+    assert cache.get(('export', 's1'), 1) is None
+    assert cache.get(('analytics', 's1', 'day', 0)) == 'bucket'
+
+    # 重新加载作废 data，连带作废派生的 records
+    cache.put(('export', 's1'), b'xlsx', 10, version=2, deps=[('records', 's1')])
+    assert cache.invalidate(('data', 's1')) == 2
+    assert len(cache) == 2 and cache.bytes == 20
+    assert cache.get(('export', 's2'), 1) == b'xlsx' and cache.get('plain') == 'P'
+    assert cache.invalidate(('data', 's1')) == 0
+
+
+def test_evicted_and_discarded_entries_leave_no_tag_references():
+    cache = LRUCache('test', max_bytes=20)
+    cache.put('a', 'A', 10, deps=['t'])
+    cache.put('b', 'B', 10, deps=['t'])
+    cache.put('c', 'C', 10, deps=['t'])  # 淘汰 a
+    cache.discard('b')
+    assert cache.invalidate('t') == 1
+    assert len(cache) == 0 and cache.bytes == 0
@@ -0,0 +1,74 @@
+"""duration.py：逐个解析（parse_duration_hours）与整列向量化解析（parse_duration_column）对每种格式结果相同"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from duration import parse_duration_column, parse_duration_hours
+
+CASES = [
+    # 完整日期范围
+    ('2025.6.10~2025.6.12', 48),
+    ('2025-6-10 - 2025-6-13', 72),
+    ('2025/6/10到2025/6/10', 24),
+    ('2024.12.30~2025.1.2', 72),
+    # 简化日期范围（同年），结束早于开始时按至少1天计
+    ('2025.6.10~6.12', 48),
+    ('2025.6.10至6.10', 24),
+    ('2025.12.30~1.2', 24),
+    # 日期无效时继续尝试后面的格式：按单一日期计
+    ('2025.2.30~2025.3.2', 24),
+    # 单一日期
+    ('2025.6.10', 24),
+    ('预约 2025.6.10 上午', 24),
+    # 带单位的时长
+    ('3小时', 3),
+    ('2.5 小时', 2.5),
+    ('2h', 2),
+    ('3H', 3),
+    ('1.5hour', 1.5),
+    ('3 hours', 3),
+    ('3天', 72),
+    ('2day', 48),
+    ('2 days', 48),
+    ('90分钟', 1.5),
+    ('90min', 1.5),
+    ('30minute', 0.5),
+    ('45 minutes', 0.75),
+    # 多个单位时按优先级取一个
+    ('2天3小时', 3),
+    ('1天12h', 12),
+    ('40分钟2天', 48),
+    # 纯数字按小时计
+    ('24', 24),
+    (' 1.5 ', 1.5),
+    (3, 3),
+    (2.5, 2.5),
+    # 空值与无法解析的值
+    ('', 0),
+    ('  ', 0),
+    (None, 0),
+    (np.nan, 0),
+    ('abc', 0),
+    ('inf', 0),
+    ('nan', 0),
+]
+
+
+@pytest.mark.parametrize('value, expected', CASES)
+def test_scalar_and_column_parse_each_format(value, expected):
+    assert parse_duration_hours(value) == expected
+    assert parse_duration_column([value]).tolist() == [expected]
+
+
+def test_column_matches_scalar_with_repeated_values():
+    values = [value for value, _ in CASES] * 3
+    np.random.default_rng(0).shuffle(values)
+    series = pd.Series(values, index=range(100, 100 + len(values)), dtype=object)
+    hours = parse_duration_column(series)
+    assert hours.dtype == float
+    assert hours.tolist() == [parse_duration_hours(value) for value in values]
+
+
+def test_empty_column():
+    assert parse_duration_column([]).tolist() == []
+    assert parse_duration_column(pd.Series([], dtype=object)).shape == (0,)
@@ -0,0 +1,89 @@
+"""预约表的冲突检查：重叠与首尾相接的时间段；登记与批量导入按同样的规则拒绝清单之外的资源取值"""
+from datetime import datetime
+
+import pytest
+
+from bulk import validate_chunk
+from inventory import SERVERS
+from records import Record
+from schedule import ServerSchedule
+
+SPEC = SERVERS['9755']
+NOW = datetime(2100, 1, 1)
+
+
+def make_record(window, nodes='0'):
+    fields = {'时间': '2099-12-31 12:00:00', '姓名': 'test', '占用节点': nodes, '占用GPU': 'No',
+              '是否使用远程桌面': 'No', '任务类型': 'test', '预计使用时间': window, '实际使用时间': '', '是否完成': ''}
+    return Record(fields, SPEC.resources)
+
+
+@pytest.fixture
+def schedule():
+    schedule = ServerSchedule(SPEC)
+    schedule.add(0, make_record('2100.1.10~2100.1.12'))
+    return schedule
+
+
+@pytest.mark.parametrize('window', [
+    '2100.1.10~2100.1.12',  # 完全相同
+    '2100.1.9~2100.1.11',   # 跨过开始
+    '2100.1.11~2100.1.13',  # 跨过结束
+    '2100.1.11~2100.1.11',  # 包含在内
+    '2100.1.8~2100.1.14',   # 包含对方
+])
+def test_overlapping_window_conflicts(schedule, window):
+    assert schedule.reservation_errors(make_record(window), None, NOW)
+
+
+@pytest.mark.parametrize('window', [
+    '2100.1.12~2100.1.13',  # 紧接在结束之后
+    '2100.1.9~2100.1.10',   # 紧接在开始之前
+])
+def test_adjacent_window_does_not_conflict(schedule, window):
+    assert schedule.reservation_errors(make_record(window), None, NOW) == []
+
+
+def test_other_node_does_not_conflict(schedule):
+    assert schedule.reservation_errors(make_record('2100.1.10~2100.1.12', nodes='1'), None, NOW) == []
+
+
+def test_overlapping_query_excludes_adjacent(schedule):
+    assert [row for _, _, row in schedule.overlapping(datetime(2100, 1, 11), datetime(2100, 1, 13))] == [0]
+    assert schedule.overlapping(datetime(2100, 1, 12), datetime(2100, 1, 13)) == []
+    assert schedule.overlapping(datetime(2100, 1, 9), datetime(2100, 1, 10)) == []
+
+
+def test_removed_booking_frees_window(schedule):
+    schedule.remove(0, make_record('2100.1.10~2100.1.12'))
+    assert schedule.reservation_errors(make_record('2100.1.11~2100.1.13'), None, NOW) == []
+
+
+def resource_values(resource):
+    """按资源类型和清单生成的 (有效取值, 无效取值)"""
+    if resource.kind == 'discrete':
+        first, missing = resource.ids[0], max(resource.ids) + 1
+        return ['', 'No', 'Yes', str(first), f'{first}, {resource.ids[-1]}'], \
+            [str(missing), f'{first},{missing}', 'x', f'{first},x', 'Yes,No']
+    if resource.kind == 'pool':
+        return ['', '1', str(resource.total), 'all', 'ALL'], ['0', '-1', '1.5', 'x']
+    return ['', 'No', 'Yes'], ['yes', 'maybe', '1']
+
+
+@pytest.mark.parametrize('server_type, position', [
+    (server_type, position) for server_type, spec in sorted(SERVERS.items()) for position in range(len(spec.resources))
+])
+def test_resource_values_outside_inventory_rejected(server_type, position):
+    spec = SERVERS[server_type]
+    resource = spec.resources[position]
+    idle = {r.field: '' for r in spec.resources}
+    valid, invalid = resource_values(resource)
+    rows = [{'时间': '2099-12-31 12:00:00', '姓名': 'test', '任务类型': 'test', '预计使用时间': '2100.1.10~2100.1.12',
+             '实际使用时间': '', '是否完成': '', **idle, resource.field: value} for value in valid + invalid]
+
+    schedule = ServerSchedule(spec)
+    errors = [schedule.reservation_errors(Record(row, spec.resources), None, NOW) for row in rows]
+    assert errors == [[]] * len(valid) + [[resource.format_error()]] * len(invalid)
+    # 批量导入与登记表单的判断一致
+    _, _, bulk_errors = validate_chunk(spec, rows)
+    assert bulk_errors == {i: [resource.format_error()] for i in range(len(valid), len(rows))}
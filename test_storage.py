@@ -0,0 +1,214 @@
+"""存储后端：带预写日志的后端在写入中断、合并中断后重新打开时重放日志；SQLite 只读取其他进程新增和修改的行；
+Feather 的类型化列与文本解析结果一致，加载时只解析日志中修改过的行"""
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import storage as storage_module
+from duration import parse_record_columns
+from records import records_from_frame
+from storage import JournaledExcelStorage, SQLiteStorage
+
+SERVER = '9755'
+COLUMNS = ['时间', '姓名', '是否完成']
+
+
+def record(name):
+    return {'时间': '2100-01-01 00:00:00', '姓名': name, '是否完成': ''}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {SERVER: str(tmp_path / f'{SERVER}_records.xlsx')}, str(tmp_path / 'journal')
+
+
+def open_storage(paths):
+    files, journal_dir = paths
+    # 不自动合并：测试中由调用方决定日志何时写回 .xlsx
+    storage = JournaledExcelStorage(files, journal_dir=journal_dir, compact_interval=3600, compact_batch=10 ** 6)
+    storage.init_server(SERVER, COLUMNS)
+    return storage
+
+
+def names(storage):
+    df = storage.load(SERVER)
+    return list(zip(df['姓名'], df['是否完成'].fillna('')))
+
+
+def test_replay_after_interrupted_write(paths):
+    storage = open_storage(paths)
+    storage.write_batch(SERVER, [('append', record('a')), ('append', record('b'))])
+    storage.write_batch(SERVER, [('update', 0, {'是否完成': 'Yes'})])
+    # 进程在写最后一条日志时崩溃，只留下半行
+    with open(os.path.join(paths[1], f'{SERVER}.jsonl'), 'a', encoding='utf-8') as f:
+        f.write('{"op": "append", "row": 2, "rec')
+    assert len(pd.read_excel(paths[0][SERVER])) == 0  # 尚未合并，全部来自日志
+
+    assert names(open_storage(paths)) == [('a', 'Yes'), ('b', '')]
+
+
+def test_replay_after_interrupted_compaction(paths):
+    storage = open_storage(paths)
+    storage.write_batch(SERVER, [('append', record('a')), ('append', record('b'))])
+    storage.write_batch(SERVER, [('update', 1, {'是否完成': 'Yes'})])
+    rows = storage.load(SERVER).to_dict('records')
+    # 合并轮换了日志并写完 .xlsx，删除 .compacting 之前崩溃；之后又有一次写入进入新日志
+    journal_path = os.path.join(paths[1], f'{SERVER}.jsonl')
+    os.replace(journal_path, journal_path + '.compacting')
+    pd.DataFrame(rows, columns=COLUMNS).to_excel(paths[0][SERVER], index=False)
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'append', 'row': 2, 'record': record('c')}) + '\n')
+
+    reopened = open_storage(paths)
+    # 已写入 .xlsx 的追加不会重复，更新重放结果不变
+    assert names(reopened) == [('a', ''), ('b', 'Yes'), ('c', '')]
+
+    reopened.compact()
+    assert not os.path.exists(journal_path + '.compacting')
+    assert names(open_storage(paths)) == [('a', ''), ('b', 'Yes'), ('c', '')]
+
+
+def test_replay_when_compaction_did_not_write_base(paths):
+    storage = open_storage(paths)
+    storage.write_batch(SERVER, [('append', record('a'))])
+    # 轮换日志后、写 .xlsx 之前崩溃
+    journal_path = os.path.join(paths[1], f'{SERVER}.jsonl')
+    os.replace(journal_path, journal_path + '.compacting')
+
+    assert names(open_storage(paths)) == [('a', '')]
+
+
+def test_compaction_is_not_an_external_change(paths, monkeypatch):
+    storage = open_storage(paths)
+    storage.write_batch(SERVER, [('append', record('a'))])
+    # 文件监视恰好在合并替换 .xlsx 之后检查文件：等到合并记下新签名才返回，不会当作外部修改
+    seen = []
+    checkers = []
+    real_replace = os.replace
+
+    def replace(src, dst):
+        real_replace(src, dst)
+        if dst == paths[0][SERVER]:
+            checkers.append(threading.Thread(target=lambda: seen.append(storage.changed_externally(SERVER))))
+            checkers[0].start()
+            checkers[0].join(0.2)
+    monkeypatch.setattr(storage_module.os, 'replace', replace)
+    storage.compact()
+    monkeypatch.undo()
+    checkers[0].join()
+
+    assert seen == [False]
+    assert names(open_storage(paths)) == [('a', '')]
+
+
+def open_sqlite(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'records.db'))
+    storage.init_server(SERVER, COLUMNS)
+    return storage
+
+
+def test_sqlite_load_changes_returns_other_writers_rows(tmp_path):
+    writer, reader = open_sqlite(tmp_path), open_sqlite(tmp_path)
+    writer.write_batch(SERVER, [('append', record('a')), ('append', record('b'))])
+    reader.load(SERVER)
+    assert reader.load_changes(SERVER) == []
+
+    writer.write_batch(SERVER, [('update', 0, {'是否完成': 'Yes'}), ('append', record('c'))])
+    # 在其他进程的写入之后，本进程的写入也一起读回（调用方按内容跳过）
+    reader.write_batch(SERVER, [('append', record('d'))])
+
+    changes = reader.load_changes(SERVER)
+    assert [(idx, fields['姓名'], fields['是否完成']) for idx, fields in changes] == \
+        [(0, 'a', 'Yes'), (2, 'c', ''), (3, 'd', '')]
+    assert reader.load_changes(SERVER) == []
+
+
+def test_sqlite_load_changes_after_own_write_skips_own_rows(tmp_path):
+    storage = open_sqlite(tmp_path)
+    storage.load(SERVER)
+    storage.write_batch(SERVER, [('append', record('a'))])
+    storage.write_batch(SERVER, [('update', 0, {'是否完成': 'Yes'})])
+    assert storage.load_changes(SERVER) == []
+
+
+def test_sqlite_load_changes_after_replace_requires_full_load(tmp_path):
+    writer, reader = open_sqlite(tmp_path), open_sqlite(tmp_path)
+    writer.write_batch(SERVER, [('append', record('a')), ('append', record('b'))])
+    reader.load(SERVER)
+
+    writer.replace(SERVER, [record('b')])
+    assert reader.load_changes(SERVER) is None
+    assert names(reader) == [('b', '')]
+    assert reader.load_changes(SERVER) == []
+
+
+TYPED_FIELDS = ['时间', '姓名', '预计使用时间', '实际使用时间', '是否完成']
+
+
+def typed_record(name, start, estimated, actual='', done=''):
+    return {'时间': start, '姓名': name, '预计使用时间': estimated, '实际使用时间': actual, '是否完成': done}
+
+
+def open_feather(tmp_path):
+    pytest.importorskip('pyarrow')
+    storage = storage_module.FeatherStorage(str(tmp_path / 'data'), legacy_files={SERVER: str(tmp_path / 'none.xlsx')},
+                                            journal_dir=str(tmp_path / 'journal'), compact_interval=3600,
+                                            compact_batch=10 ** 6)
+    storage.init_server(SERVER, TYPED_FIELDS)
+    return storage
+
+
+def assert_typed_matches_text(df, typed):
+    expected = parse_record_columns(df)
+    pd.testing.assert_frame_equal(typed.astype(expected.dtypes.to_dict()), expected)
+
+
+def test_feather_typed_columns_reparse_only_journaled_rows(tmp_path, monkeypatch):
+    storage = open_feather(tmp_path)
+    storage.write_batch(SERVER, [
+        ('append', typed_record('a', '2025-06-01 08:00:00', '2025.6.1~2025.6.3', '20小时', 'Yes')),
+        ('append', typed_record('b', '2025.6.2', '3h')),
+        ('append', typed_record('c', '2025-06-03 09:30:00', '90分钟')),
+    ])
+    storage.compact()
+    storage.write_batch(SERVER, [('update', 1, {'是否完成': 'Yes', '实际使用时间': '2天'}),
+                                 ('append', typed_record('d', 'bad', ''))])
+
+    parsed = []
+    monkeypatch.setattr(storage_module, 'parse_record_columns',
+                        lambda df, hours=None: parsed.append(list(df['姓名'])) or parse_record_columns(df, hours))
+    reopened = open_feather(tmp_path)
+    # 文件中的三行留在 Arrow 表中，不转换为字典；日志中的写入另外保存
+    rows = reopened._rows[SERVER]
+    assert isinstance(rows, storage_module._ArrowRows)
+    assert (rows.base_count, list(rows.changed), len(rows.appended)) == (3, [1], 1)
+    df, typed = reopened.load_typed(SERVER)
+    # 合并后没有变化的行取用文件中的类型化列，只有日志中修改和追加的行重新解析（重放日志后后台合并时也一样）
+    assert parsed and all(names == ['b', 'd'] for names in parsed)
+    assert_typed_matches_text(df, typed)
+
+    reopened.compact()
+    parsed.clear()
+    df, typed = reopened.load_typed(SERVER)
+    assert parsed == []
+    assert_typed_matches_text(df, typed)
+
+
+def test_records_from_typed_columns_match_parsed_records(tmp_path):
+    storage = open_feather(tmp_path)
+    storage.write_batch(SERVER, [
+        ('append', typed_record('a', '2025-06-01 08:00:00', '2025.6.1~6.3', '20小时', 'Yes')),
+        ('append', typed_record('b', '2025.6.2', '3h')),
+        ('append', typed_record('c', '', '1.5', '', 'Yes')),
+    ])
+    storage.compact()
+    df, typed = open_feather(tmp_path).load_typed(SERVER)
+
+    def attributes(records):
+        return [(r.start_time, r.duration_hours, r.actual_hours, r.completed, r.end_time) for r in records]
+    assert attributes(records_from_frame(df, typed=typed)) == attributes(records_from_frame(df))
+    assert attributes(records_from_frame(df)) == attributes(
+        [records_from_frame(df.iloc[[i]])[0] for i in range(len(df))])
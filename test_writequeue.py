@@ -0,0 +1,105 @@
+"""writequeue.py：提交期间到达的写操作合为下一批，各写操作分别得到自己的结果或异常"""
+import threading
+import time
+
+import pytest
+
+from writequeue import WriteQueue
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+class BlockingCommit:
+    """第一次提交阻塞到 release，期间到达的写操作积累在队列中；error 不为 None 时提交抛出该异常"""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.released = threading.Event()
+        self.error = None
+
+    def __call__(self, stages):
+        self.batches.append(len(stages))
+        self.entered.set()
+        self.released.wait(5)
+        if self.error is not None:
+            raise self.error
+        outcomes = []
+        for stage in stages:
+            try:
+                outcomes.append((stage(None), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+
+def submit_all(queue, stages):
+    results = [None] * len(stages)
+
+    def worker(i):
+        try:
+            results[i] = queue.submit(stages[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(stages))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def stage(value):
+    def run(batch):
+        if isinstance(value, Exception):
+            raise value
+        return value
+    return run
+
+
+@pytest.fixture
+def commit():
+    commit = BlockingCommit()
+    yield commit
+    commit.released.set()
+
+
+def test_waiting_writes_commit_as_one_batch(commit):
+    queue = WriteQueue('test', commit)
+    first, first_result = submit_all(queue, [stage('first')])
+    commit.entered.wait(5)
+
+    conflict = ValueError('conflict')
+    threads, results = submit_all(queue, [stage(i) for i in range(5)] + [stage(conflict)])
+    wait_until(lambda: queue.depth() == 6)
+    commit.released.set()
+    for thread in first + threads:
+        thread.join(5)
+
+    assert commit.batches == [1, 6]
+    assert first_result == ['first']
+    # 每个写操作得到自己的结果，同批中一个写操作出错不影响其他写操作
+    assert results == [0, 1, 2, 3, 4, conflict]
+
+
+def test_commit_failure_reaches_every_waiter(commit):
+    queue = WriteQueue('test', commit)
+    commit.error = OSError('disk full')
+    first, first_result = submit_all(queue, [stage('first')])
+    commit.entered.wait(5)
+    threads, results = submit_all(queue, [stage(i) for i in range(4)])
+    wait_until(lambda: queue.depth() == 4)
+    commit.released.set()
+    for thread in first + threads:
+        thread.join(5)
+
+    assert commit.batches == [1, 4]
+    assert all(result is commit.error for result in first_result + results)
+
+    # 失败之后队列继续工作
+    commit.error = None
+    assert queue.submit(stage('next')) == 'next'
@@ -0,0 +1,77 @@
+"""写入队列与组提交
+
+组会等时段很多人同时登记，每个请求各自占用写锁、各自写一次存储（重写一次 .xlsx、提交一次事务或 fsync 一次日志），
+请求只能排队逐个完成。WriteQueue 把同一台服务器的写操作排入队列，由一个提交线程成批执行：
+一批写操作在一个写事务中依次检查并应用到内存，累积的存储操作最后一次写入（RecordStorage.write_batch），
+之后每个请求各自得到结果（登记成功、资源冲突或异常）。提交期间到达的写操作自然积累为下一批，
+写入越集中，每次存储写入覆盖的请求越多；没有并发时每批只有一个写操作，只多一次线程切换。
+
+请求在所在批次写入存储后才返回，返回成功即已持久化。
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from metrics import Gauge, Histogram
+
+BATCH_SIZE = Histogram('write_batch_size', '每次组提交包含的写操作数', ['server'],
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+
+_QUEUES = []
+
+
+class WriteBatch:
+    """一次组提交中各写操作累积的存储操作（见 RecordStorage.write_batch）和修改的行号"""
+
+    def __init__(self):
+        self.operations = []
+        self.rows = []
+
+
+class WriteQueue:
+    """一台服务器的写入队列
+
+    submit(stage) 把写操作排入队列并等待结果；提交线程每次取出最多 max_batch 个，
+    调用 commit(stages) 在一个写事务中执行，commit 返回每个写操作的 (结果, 异常)
+    """
+
+    def __init__(self, name, commit, max_batch=256):
+        self.name = name
+        self.commit = commit
+        self.max_batch = max_batch
+        self._pending = deque()
+        self._cond = threading.Condition()
+        _QUEUES.append(self)
+        thread = threading.Thread(target=self._run, name=f'write-queue-{name}', daemon=True)
+        thread.start()
+
+    def submit(self, stage):
+        """排入写操作，阻塞到所在批次提交完成，返回 stage 的结果或抛出其异常"""
+        future = Future()
+        with self._cond:
+            self._pending.append((stage, future))
+            self._cond.notify()
+        return future.result()
+
+    def depth(self):
+        return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            BATCH_SIZE.observe(len(batch), server=self.name)
+            try:
+                outcomes = self.commit([stage for stage, _ in batch])
+            except Exception as e:
+                outcomes = [(None, e)] * len(batch)
+            for (_, future), (result, error) in zip(batch, outcomes):
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+
+Gauge('write_queue_depth', '等待组提交的写操作数', ['server'],
+      callback=lambda: [({'server': queue.name}, queue.depth()) for queue in _QUEUES])
@@ -0,0 +1,10 @@
+"""生产环境入口
+
+    gunicorn -w 4 -b 0.0.0.0:8000 wsgi:app
+
+每个 worker 导入本模块时各自初始化，不要使用 --preload（预加载会在 fork 之前启动后台线程）。
+多 worker 部署需使用 SQLite 存储后端（默认）。
+"""
+from app import create_app
+
+app = create_app()